@@ -0,0 +1,68 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Wall time of the full calibration chain with each registry backend."""
+
+__all__ = ["main"]
+
+import argparse
+import os
+import shlex
+import subprocess
+import time
+
+from .utils import formatTable, writeResults
+
+
+def _scons(packageDir, backend, sconsArgs):
+    environ = dict(os.environ, CI_CPP_REGISTRY=backend)
+    subprocess.run(["scons", "-c", "-Q"], cwd=packageDir, env=environ, check=True,
+                   stdout=subprocess.DEVNULL)
+    start = time.perf_counter()
+    result = subprocess.run(["scons", *sconsArgs], cwd=packageDir, env=environ)
+    return time.perf_counter() - start, result.returncode
+
+
+def main(argv=None):
+    """Command line entry point for the registry backend benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Time a clean build of the chain with the SQLite and PostgreSQL registries.  "
+                    "DATA is cleaned before each build.",
+    )
+    parser.add_argument("--package-dir", default=os.environ.get("CI_CPP_GEN3_DIR", "."),
+                        help="ci_cpp_gen3 checkout to build.")
+    parser.add_argument("--backends", default="sqlite,postgres", help="Comma separated backends to time.")
+    parser.add_argument("--scons-args", default="-j 4",
+                        help="Arguments for scons, e.g. the number of jobs and the target.")
+    parser.add_argument("--repeat", type=int, default=1, help="Number of builds per backend.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    sconsArgs = shlex.split(args.scons_args)
+    results = []
+    for backend in args.backends.split(","):
+        for iteration in range(args.repeat):
+            wallTime, returncode = _scons(args.package_dir, backend, sconsArgs)
+            results.append({"backend": backend, "iteration": iteration, "wallTime": wallTime,
+                            "returncode": returncode})
+
+    print(formatTable(results, ["backend", "iteration", "wallTime", "returncode"]))
+    if args.output:
+        writeResults({"sconsArgs": args.scons_args, "results": results}, args.output)
@@ -0,0 +1,137 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Bytes written, write time and read time of the storage policies."""
+
+__all__ = ["loadWriteRecipes", "main"]
+
+import argparse
+import glob
+import os
+import tempfile
+import time
+
+import numpy as np
+import yaml
+
+import lsst.afw.image as afwImage
+from lsst.daf.base import PropertySet
+
+from .utils import formatTable, writeResults
+
+FORMATTER = "lsst.obs.base.formatters.fitsExposure.FitsExposureFormatter"
+
+
+def loadWriteRecipes(configDir):
+    """Read the exposure write recipes of every storage policy.
+
+    Parameters
+    ----------
+    configDir : `str`
+        Directory holding the ``<policy>.yaml`` butler seed configs.
+
+    Returns
+    -------
+    recipes : `dict` [`str`, `dict`]
+        Distinct write recipes keyed by ``<policy>/<recipe>``, plus
+        ``none`` for the butler default of uncompressed FITS.
+    """
+    recipes = {"none": None}
+    for filename in sorted(glob.glob(os.path.join(configDir, "*.yaml"))):
+        policy = os.path.splitext(os.path.basename(filename))[0]
+        with open(filename) as f:
+            config = yaml.safe_load(f)
+        for name, recipe in config["datastore"]["writeRecipes"][FORMATTER].items():
+            # Policies share some recipes; measure each only once.
+            if recipe not in recipes.values():
+                recipes[f"{policy}/{name}"] = recipe
+    return recipes
+
+
+def _makeExposure(height, width, seed):
+    rng = np.random.Generator(np.random.PCG64(seed))
+    exposure = afwImage.ExposureF(width, height)
+    exposure.image.array[:, :] = rng.normal(1000.0, 8.0, size=(height, width))
+    exposure.variance.array[:, :] = exposure.image.array
+    return exposure
+
+
+def _writeOptions(recipe):
+    options = PropertySet()
+    for plane, planeRecipe in recipe.items():
+        options.set(plane, PropertySet.from_mapping(planeRecipe))
+    return options
+
+
+def _measure(exposure, recipe, filename):
+    start = time.perf_counter()
+    if recipe is None:
+        exposure.writeFits(filename)
+    else:
+        exposure.writeFitsWithOptions(filename, _writeOptions(recipe))
+    writeTime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    readBack = afwImage.ExposureF(filename)
+    readTime = time.perf_counter() - start
+
+    residual = readBack.image.array - exposure.image.array
+    return {
+        "bytes": os.path.getsize(filename),
+        "writeTime": writeTime,
+        "readTime": readTime,
+        "maxAbsError": float(np.max(np.abs(residual))),
+    }
+
+
+def main(argv=None):
+    """Command line entry point for the compression benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Measure bytes written and write/read time of each storage policy codec.",
+    )
+    parser.add_argument("--config-dir", required=True,
+                        help="Directory of storage policy seed configs (config/storage).")
+    parser.add_argument("--height", type=int, default=4000, help="Exposure height in pixels.")
+    parser.add_argument("--width", type=int, default=4072, help="Exposure width in pixels.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of exposures written per codec.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    recipes = loadWriteRecipes(args.config_dir)
+    exposures = [_makeExposure(args.height, args.width, seed) for seed in range(args.repeat)]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name, recipe in recipes.items():
+            runs = [_measure(exposure, recipe, os.path.join(directory, f"exposure{i}.fits"))
+                    for i, exposure in enumerate(exposures)]
+            result = {"codec": name}
+            for key in ("bytes", "writeTime", "readTime"):
+                result[key] = float(np.median([run[key] for run in runs]))
+            result["maxAbsError"] = max(run["maxAbsError"] for run in runs)
+            results.append(result)
+
+    baseline = results[0]["bytes"]
+    for result in results:
+        result["ratio"] = baseline/result["bytes"]
+
+    print(formatTable(results, ["codec", "bytes", "ratio", "writeTime", "readTime", "maxAbsError"]))
+    if args.output:
+        writeResults({"height": args.height, "width": args.width, "repeat": args.repeat,
+                      "results": results}, args.output)
@@ -0,0 +1,151 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Cost of the FFT and real-space flat pair covariances against their
+range.
+"""
+
+__all__ = ["makeFlatPair", "computeCovariances", "main"]
+
+import argparse
+import time
+
+import numpy as np
+
+from lsst.cp.pipe.utils import CovFastFourierTransform, computeCovDirect
+
+from .utils import formatTable, runIsolated, writeResults
+
+# Fraction of each pixel's charge shared with each of its four
+# neighbours, roughly as the brighter-fatter effect does, so that the
+# covariances are not all zero.
+_SHARED = 0.01
+
+
+def makeFlatPair(height, width, flux=20000.0, seed=12345):
+    """Make a synthetic flat pair for one amplifier.
+
+    Parameters
+    ----------
+    height, width : `int`
+        Amplifier size in pixels.
+    flux : `float`, optional
+        Mean signal in electrons.
+    seed : `int`, optional
+        Random seed.
+
+    Returns
+    -------
+    flat1, flat2 : `numpy.ndarray`
+        The two flats.
+    """
+    rng = np.random.Generator(np.random.PCG64(seed))
+    flats = []
+    for _ in range(2):
+        flat = rng.poisson(flux, size=(height + 2, width + 2)).astype(np.float64)
+        flats.append((1.0 - 4*_SHARED)*flat[1:-1, 1:-1]
+                     + _SHARED*(flat[:-2, 1:-1] + flat[2:, 1:-1] + flat[1:-1, :-2] + flat[1:-1, 2:]))
+    return flats[0], flats[1]
+
+
+def _fftShape(shape, maxRange):
+    # As cpPtcExtractPair sizes its FFTs.
+    size = np.array(shape) + maxRange
+    return tuple(int(n) for n in 2**(np.log2(size).astype(int) + 1))
+
+
+def computeCovariances(flat1, flat2, maxRange, realSpace=False):
+    """Measure the covariances of the difference of a flat pair.
+
+    Parameters
+    ----------
+    flat1, flat2 : `numpy.ndarray`
+        The flats.
+    maxRange : `int`
+        Largest lag measured.
+    realSpace : `bool`, optional
+        Compute the covariances directly rather than by FFT, as
+        ``covAstierRealSpace`` does in ``cpPtcExtractPair``.
+
+    Returns
+    -------
+    covariances : `dict` [`tuple` [`int`, `int`], `float`]
+        Covariance of each ``(dx, dy)`` lag.
+    """
+    diff = flat1 - flat2
+    diff -= np.mean(diff)
+    weights = np.ones(diff.shape)
+    if realSpace:
+        report = computeCovDirect(diff, weights, maxRange)
+    else:
+        fft = CovFastFourierTransform(diff, weights, _fftShape(diff.shape, maxRange), maxRange)
+        report = fft.reportCovFastFourierTransform(maxRange)
+    # Each entry is (dx, dy, variance, covariance, nPixels).
+    return {(entry[0], entry[1]): entry[3] for entry in report}
+
+
+def _runPairs(nPairs, height, width, maxRange, realSpace):
+    """Return the covariances of the last pair, to compare the two
+    methods, and the time spent computing covariances.
+    """
+    covariances = None
+    wallTime = 0.0
+    for seed in range(nPairs):
+        flat1, flat2 = makeFlatPair(height, width, seed=seed)
+        start = time.perf_counter()
+        covariances = computeCovariances(flat1, flat2, maxRange, realSpace=realSpace)
+        wallTime += time.perf_counter() - start
+    return covariances, wallTime
+
+
+def main(argv=None):
+    """Command line entry point for the covariance benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Measure the wall time and peak RSS of the FFT and real-space covariances of "
+                    "synthetic flat pairs against the covariance range and the number of pairs.",
+    )
+    parser.add_argument("--ranges", default="8,15,20", help="Comma separated covariance ranges.")
+    parser.add_argument("--pairs", default="1,4", help="Comma separated numbers of flat pairs.")
+    parser.add_argument("--height", type=int, default=2000, help="Amplifier height in pixels.")
+    parser.add_argument("--width", type=int, default=509, help="Amplifier width in pixels.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    results = []
+    for maxRange in sorted(int(r) for r in args.ranges.split(",")):
+        for nPairs in sorted(int(n) for n in args.pairs.split(",")):
+            covariances = {}
+            for method, realSpace in (("fft", False), ("realSpace", True)):
+                (covariances[method], wallTime), _, maxRss = runIsolated(
+                    _runPairs, nPairs, args.height, args.width, maxRange, realSpace
+                )
+                results.append({"range": maxRange, "pairs": nPairs, "method": method,
+                                "wallTime": wallTime, "perPair": wallTime/nPairs,
+                                "maxRssMB": maxRss/1024**2})
+            # Both methods must agree for the faster one to be used.
+            lags = set(covariances["fft"]) & set(covariances["realSpace"])
+            difference = max(abs(covariances["fft"][lag] - covariances["realSpace"][lag]) for lag in lags)
+            for result in results[-2:]:
+                result["maxAbsDifference"] = float(difference)
+
+    print(formatTable(results, ["range", "pairs", "method", "wallTime", "perPair", "maxRssMB",
+                                "maxAbsDifference"]))
+    if args.output:
+        writeResults({"height": args.height, "width": args.width, "results": results}, args.output)
@@ -0,0 +1,119 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Registry query time of exposure ``IN`` lists and compact ranges."""
+
+__all__ = ["makeExposureList", "main"]
+
+import argparse
+import time
+
+import numpy as np
+
+import lsst.daf.butler as dafButler
+
+from ..dataQuery import getDataQuery
+from .utils import formatTable, writeResults
+
+
+def makeExposureList(nExposures, firstExposure=2030010100001, dropFraction=0.05, perNight=1000, seed=12345):
+    """Make a synthetic list of exposure ids.
+
+    Ids follow the ``YYYYMMDDnnnnn`` pattern of the LATISS exposures:
+    each night holds ``perNight`` consecutive sequence numbers, of which
+    a random fraction is dropped, as exposures of other types would be.
+
+    Parameters
+    ----------
+    nExposures : `int`
+        Number of ids.
+    firstExposure : `int`, optional
+        First id of the first night; the default is clear of the real
+        LATISS exposures.
+    dropFraction : `float`, optional
+        Fraction of the sequence numbers left out.
+    perNight : `int`, optional
+        Sequence numbers per night.
+    seed : `int`, optional
+        Seed for the dropped sequence numbers.
+
+    Returns
+    -------
+    expList : `list` [`int`]
+        Sorted exposure ids.
+    """
+    rng = np.random.Generator(np.random.PCG64(seed))
+    expList = []
+    night = firstExposure
+    while len(expList) < nExposures:
+        keep = rng.random(perNight) >= dropFraction
+        expList.extend(night + int(i) for i in np.flatnonzero(keep))
+        # The next night, ignoring month ends.
+        night += 100000
+    return expList[:nExposures]
+
+
+def _legacyQuery(expList):
+    return ("instrument='LATISS' AND detector=0 AND exposure IN ("
+            + ",".join(str(exp) for exp in expList) + ")")
+
+
+def _timeQuery(butler, dataQuery, repeat):
+    wallTimes = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        count = butler.registry.queryDataIds(["exposure", "detector"], where=dataQuery).count(exact=True)
+        wallTimes.append(time.perf_counter() - start)
+    return min(wallTimes), count
+
+
+def main(argv=None):
+    """Command line entry point for the data query benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Measure the registry query time of exposure selections written as IN lists and as "
+                    "compact range expressions, against the number of exposures.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo.")
+    parser.add_argument("--exposures", default="10,100,1000,10000",
+                        help="Comma separated numbers of exposures to select.")
+    parser.add_argument("--max-gap", type=int, default=2,
+                        help="Largest gap merged into a range by the compact expression.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of queries per measurement.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    butler = dafButler.Butler(args.repo, writeable=False)
+    # Start from the exposures in the repo, so that the queries find
+    # something, and make up the rest.
+    existing = sorted(dataId["exposure"] for dataId in
+                      butler.registry.queryDataIds(["exposure"], instrument="LATISS"))
+    results = []
+    for nExposures in sorted(int(n) for n in args.exposures.split(",")):
+        expList = existing[:nExposures]
+        expList += makeExposureList(nExposures - len(expList))
+        for form, dataQuery in (("inList", _legacyQuery(expList)),
+                                ("compact", getDataQuery(expList, maxGap=args.max_gap))):
+            wallTime, count = _timeQuery(butler, dataQuery, args.repeat)
+            results.append({"exposures": nExposures, "form": form, "queryLength": len(dataQuery),
+                            "wallTime": wallTime, "dataIds": count})
+
+    print(formatTable(results, ["exposures", "form", "queryLength", "wallTime", "dataIds"]))
+    if args.output:
+        writeResults({"maxGap": args.max_gap, "repeat": args.repeat, "results": results}, args.output)
@@ -0,0 +1,260 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Cost of the defect, crosstalk, interpolation and linearity corrections
+of ``IsrTaskLSST`` with the certified calibrations.
+"""
+
+__all__ = ["tileInputs", "main"]
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+import lsst.afw.image as afwImage
+import lsst.daf.butler as dafButler
+import lsst.geom as geom
+import lsst.ip.isr as ipIsr
+
+from ..isrConfigs import CORRECTIONS, makeIsrConfig
+from .utils import formatTable, runIsolated, writeResults
+
+# Certified calibrations read for each configuration.
+CALIBRATIONS = {
+    "bias": None,
+    "ptc": ipIsr.PhotonTransferCurveDataset,
+    "defects": ipIsr.Defects,
+    "crosstalk": ipIsr.CrosstalkCalib,
+    "linearizer": ipIsr.Linearizer,
+}
+
+
+def _shifted(bbox, offset):
+    return geom.Box2I(bbox.getMin() + offset, bbox.getDimensions())
+
+
+def _tileAmpName(name, tile):
+    return f"{name}_{tile}"
+
+
+def _tileDetector(detector, nx, ny, rawDimensions):
+    """Make a detector from ``nx`` by ``ny`` copies of ``detector``.
+
+    Amplifiers are renamed ``<name>_<tile>`` so that they stay
+    distinct.
+    """
+    bbox = detector.getBBox()
+    builder = detector.rebuild()
+    builder.clear()
+    for tile in range(nx*ny):
+        iy, ix = divmod(tile, nx)
+        offset = geom.Extent2I(ix*bbox.getWidth(), iy*bbox.getHeight())
+        rawOffset = geom.Extent2I(ix*rawDimensions.getX(), iy*rawDimensions.getY())
+        for amp in detector:
+            ampBuilder = amp.rebuild()
+            ampBuilder.setName(_tileAmpName(amp.getName(), tile))
+            ampBuilder.setBBox(_shifted(amp.getBBox(), offset))
+            ampBuilder.setRawBBox(_shifted(amp.getRawBBox(), rawOffset))
+            ampBuilder.setRawDataBBox(_shifted(amp.getRawDataBBox(), rawOffset))
+            ampBuilder.setRawHorizontalOverscanBBox(_shifted(amp.getRawHorizontalOverscanBBox(), rawOffset))
+            ampBuilder.setRawVerticalOverscanBBox(_shifted(amp.getRawVerticalOverscanBBox(), rawOffset))
+            ampBuilder.setRawPrescanBBox(_shifted(amp.getRawPrescanBBox(), rawOffset))
+            builder.append(ampBuilder)
+    builder.setBBox(geom.Box2I(bbox.getMin(), geom.Extent2I(nx*bbox.getWidth(), ny*bbox.getHeight())))
+    return builder.finish()
+
+
+def _tileExposure(exposure, nx, ny, detector):
+    bbox = exposure.getBBox()
+    tiled = type(exposure)(geom.Box2I(bbox.getMin(),
+                                      geom.Extent2I(nx*bbox.getWidth(), ny*bbox.getHeight())))
+    for tile in range(nx*ny):
+        iy, ix = divmod(tile, nx)
+        offset = geom.Extent2I(ix*bbox.getWidth(), iy*bbox.getHeight())
+        tiled.maskedImage.assign(exposure.maskedImage, _shifted(bbox, offset))
+    tiled.setMetadata(exposure.getMetadata())
+    tiled.info.setVisitInfo(exposure.info.getVisitInfo())
+    tiled.setFilter(exposure.getFilter())
+    tiled.setDetector(detector)
+    return tiled
+
+
+def _tileAmpKeyed(value, ampNames, nTiles):
+    """Replicate the per-amplifier entries of a calibration dictionary."""
+    if isinstance(value, dict):
+        if value and set(value) <= set(ampNames):
+            return {_tileAmpName(name, tile): value[name]
+                    for tile in range(nTiles) for name in ampNames if name in value}
+        return {key: _tileAmpKeyed(item, ampNames, nTiles) for key, item in value.items()}
+    if isinstance(value, list) and value and all(isinstance(item, str) and item in ampNames
+                                                 for item in value):
+        return [_tileAmpName(name, tile) for tile in range(nTiles) for name in value]
+    return value
+
+
+def _tileCrosstalk(crosstalk, nTiles):
+    # Copies do not crosstalk with each other, so every coefficient
+    # matrix becomes block diagonal.
+    calibDict = crosstalk.toDict()
+    nAmp = calibDict["nAmp"]
+    for key, value in calibDict.items():
+        if isinstance(value, (list, np.ndarray)) and np.size(value) == nAmp**2:
+            matrix = np.asarray(value).reshape(nAmp, nAmp)
+            calibDict[key] = np.kron(np.eye(nTiles, dtype=matrix.dtype), matrix).ravel().tolist()
+    calibDict["nAmp"] = nAmp*nTiles
+    return type(crosstalk).fromDict(calibDict)
+
+
+def tileInputs(inputs, nx, ny):
+    """Make a larger synthetic detector from the LATISS inputs.
+
+    The raw exposure, the bias and the defects are tiled ``nx`` by
+    ``ny`` times, and the per-amplifier calibrations are copied to the
+    amplifiers of each tile.
+
+    Parameters
+    ----------
+    inputs : `dict`
+        The ``raw`` exposure and the calibrations in `CALIBRATIONS`.
+    nx, ny : `int`
+        Number of copies along each axis.
+
+    Returns
+    -------
+    tiled : `dict`
+        Inputs for the tiled detector.
+    """
+    raw = inputs["raw"]
+    detector = raw.getDetector()
+    ampNames = [amp.getName() for amp in detector]
+    nTiles = nx*ny
+    tiledDetector = _tileDetector(detector, nx, ny, raw.getDimensions())
+
+    tiled = {
+        "raw": _tileExposure(raw, nx, ny, tiledDetector),
+        "bias": _tileExposure(inputs["bias"], nx, ny, tiledDetector),
+        "crosstalk": _tileCrosstalk(inputs["crosstalk"], nTiles),
+    }
+    bbox = detector.getBBox()
+    defects = []
+    for tile in range(nTiles):
+        iy, ix = divmod(tile, nx)
+        offset = geom.Extent2I(ix*bbox.getWidth(), iy*bbox.getHeight())
+        defects.extend(_shifted(defect.getBBox(), offset) for defect in inputs["defects"])
+    tiled["defects"] = ipIsr.Defects(defects, metadata=inputs["defects"].getMetadata())
+    for name in ("ptc", "linearizer"):
+        calib = inputs[name]
+        tiled[name] = type(calib).fromDict(_tileAmpKeyed(calib.toDict(), ampNames, nTiles))
+    return tiled
+
+
+def _writeInputs(inputs, directory):
+    for name, calib in inputs.items():
+        calib.writeFits(os.path.join(directory, f"{name}.fits"))
+
+
+def _readInputs(directory):
+    inputs = {}
+    for name in ("raw",) + tuple(CALIBRATIONS):
+        filename = os.path.join(directory, f"{name}.fits")
+        calibClass = CALIBRATIONS.get(name)
+        inputs[name] = calibClass.readFits(filename) if calibClass else afwImage.ExposureF(filename)
+    return inputs
+
+
+def _runIsr(directory, corrections, repeat):
+    """Run ISR ``repeat`` times and return the fastest wall time."""
+    inputs = _readInputs(directory)
+    raw = inputs.pop("raw")
+    task = ipIsr.IsrTaskLSST(config=makeIsrConfig(corrections=corrections))
+    wallTimes = []
+    for _ in range(repeat):
+        # ISR modifies the exposure in place.
+        exposure = raw.clone()
+        start = time.perf_counter()
+        task.run(exposure, **inputs)
+        wallTimes.append(time.perf_counter() - start)
+    return min(wallTimes)
+
+
+def _parseTiles(value):
+    tiles = []
+    for tile in value.split(","):
+        nx, ny = (int(n) for n in tile.lower().split("x"))
+        tiles.append((nx, ny))
+    return tiles
+
+
+def main(argv=None):
+    """Command line entry point for the ISR correction benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Measure the wall time and peak RSS of IsrTaskLSST with each of the defect, crosstalk, "
+                    "interpolation and linearity corrections enabled alone, on a LATISS detector and on "
+                    "synthetic detectors tiled from it.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo with the certified calibrations.")
+    parser.add_argument("--collections", default="LATISS/raw/all,calib/v00,LATISS/calib",
+                        help="Comma separated collections to read the raw and calibrations from.")
+    parser.add_argument("--exposure", type=int, default=2021052500015, help="Raw exposure to process.")
+    parser.add_argument("--detector", type=int, default=0, help="Detector to process.")
+    parser.add_argument("--tiles", default="2x1,2x2",
+                        help="Comma separated <nx>x<ny> tilings of the synthetic detectors; "
+                             "the native detector is always measured.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of ISR runs per measurement.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    butler = dafButler.Butler(args.repo, collections=args.collections.split(","))
+    dataId = {"instrument": "LATISS", "exposure": args.exposure, "detector": args.detector}
+    native = {"raw": butler.get("raw", dataId)}
+    native.update({name: butler.get(name, dataId) for name in CALIBRATIONS})
+
+    results = []
+    for nx, ny in [(1, 1)] + _parseTiles(args.tiles):
+        inputs = native if (nx, ny) == (1, 1) else tileInputs(native, nx, ny)
+        detector = inputs["raw"].getDetector()
+        size = "native" if (nx, ny) == (1, 1) else f"{nx}x{ny}"
+        with tempfile.TemporaryDirectory() as directory:
+            _writeInputs(inputs, directory)
+            baseline = None
+            for correction in ("baseline",) + CORRECTIONS:
+                corrections = () if correction == "baseline" else (correction,)
+                wallTime, _, maxRss = runIsolated(_runIsr, directory, corrections, args.repeat)
+                if baseline is None:
+                    baseline = (wallTime, maxRss)
+                results.append({
+                    "detector": size,
+                    "nAmp": len(detector),
+                    "pixels": detector.getBBox().getArea(),
+                    "correction": correction,
+                    "wallTime": wallTime,
+                    "extraTime": wallTime - baseline[0],
+                    "maxRssMB": maxRss/1024**2,
+                    "extraRssMB": (maxRss - baseline[1])/1024**2,
+                })
+
+    print(formatTable(results, ["detector", "nAmp", "pixels", "correction", "wallTime", "extraTime",
+                                "maxRssMB", "extraRssMB"]))
+    if args.output:
+        writeResults({"exposure": args.exposure, "detector": args.detector, "repeat": args.repeat,
+                      "results": results}, args.output)
@@ -0,0 +1,117 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Request latency of the single-exposure ISR service."""
+
+__all__ = ["main"]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from ..isrService import IsrClient
+from .utils import formatTable, writeResults
+
+
+def _requestAll(client, args, exposures, directory, results):
+    """Time ``args.rounds`` passes of requests over the exposures."""
+    for iteration in range(args.rounds):
+        for exposure in exposures:
+            output = os.path.join(directory, f"{exposure}.fits") if args.write_fits else None
+            requestStart = time.perf_counter()
+            _, timing = client.process(exposure, detector=args.detector, output=output)
+            latency = time.perf_counter() - requestStart
+            results.append({
+                "round": iteration,
+                "exposure": exposure,
+                "latency": latency,
+                "raw": timing["raw"],
+                "calibrations": timing["calibrations"],
+                "isr": timing["isr"],
+                # Serialization, the socket and writing FITS.
+                "transfer": latency - sum(timing.values()),
+            })
+
+
+def main(argv=None):
+    """Command line entry point for the ISR service latency benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Start the ISR service and measure the latency of single-exposure requests.  "
+                    "The first round reads the calibrations; later rounds reuse them.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo.")
+    parser.add_argument("--exposures", required=True, help="Comma separated exposures to request.")
+    parser.add_argument("--detector", type=int, default=0, help="Detector to request.")
+    parser.add_argument("--collections", default="LATISS/raw/all,calib/v00,LATISS/calib",
+                        help="Comma separated collections holding the raws and calibrations.")
+    parser.add_argument("--rounds", type=int, default=3, help="Number of passes over the exposures.")
+    parser.add_argument("--write-fits", action="store_true",
+                        help="Have the service write FITS files instead of returning the exposures.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    exposures = [int(exposure) for exposure in args.exposures.split(",")]
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "isr.sock")
+        start = time.perf_counter()
+        server = subprocess.Popen([sys.executable, "-m", "lsst.ci.cpp.isrService", "-r", args.repo,
+                                   "--socket", path, "--collections", args.collections])
+        stopped = False
+        try:
+            with IsrClient(path, timeout=600.0) as client:
+                startup = time.perf_counter() - start
+                try:
+                    _requestAll(client, args, exposures, directory, results)
+                finally:
+                    # Stop the service even if a request failed; if the
+                    # connection is gone, the service is terminated below.
+                    try:
+                        client.shutdown()
+                        stopped = True
+                    except OSError:
+                        pass
+        finally:
+            if not stopped:
+                server.terminate()
+            returncode = server.wait(timeout=60)
+        if returncode != 0:
+            raise RuntimeError(f"The ISR service exited with {returncode}.")
+
+    print(formatTable(results, ["round", "exposure", "latency", "raw", "calibrations", "isr", "transfer"]))
+    warm = [row["latency"] for row in results if row["round"] > 0]
+    summary = {
+        "startup": startup,
+        "firstRequest": results[0]["latency"],
+        "warmMedian": float(np.median(warm)) if warm else None,
+        "warmP95": float(np.percentile(warm, 95)) if warm else None,
+    }
+    message = f"Service startup {summary['startup']:.2f} s, first request {summary['firstRequest']:.2f} s"
+    if warm:
+        message += f", warm median {summary['warmMedian']:.2f} s, p95 {summary['warmP95']:.2f} s"
+    print(message + ".")
+    if args.output:
+        writeResults({"detector": args.detector, "writeFits": args.write_fits, "summary": summary,
+                      "results": results}, args.output)
@@ -0,0 +1,105 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Wall time and agreement of the cp_pipe and batched spline linearity
+solves on the PTC of the linearizer stage.
+"""
+
+__all__ = ["main"]
+
+import argparse
+import time
+
+import numpy as np
+
+import lsst.daf.butler as dafButler
+from lsst.cp.pipe.linearity import LinearitySolveTask
+
+from ..linearity import BatchedLinearitySolveTask, evaluateSplines
+from .utils import formatTable, writeResults
+
+
+def _timeSolve(task, inputs, repeat):
+    wallTimes = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = task.run(*inputs)
+        wallTimes.append(time.perf_counter() - start)
+    return min(wallTimes), result.outputLinearizer
+
+
+def _maxDeviation(reference, linearizer):
+    """Largest difference of the spline corrections of two linearizers,
+    as a fraction of the signal, over the nodes of the reference.
+    """
+    deviation = 0.0
+    for amp, linearityType in reference.linearityType.items():
+        if linearityType != "Spline" or linearizer.linearityType[amp] != "Spline":
+            continue
+        nodes, values = np.split(np.asarray(reference.linearityCoeffs[amp]), 2)
+        otherNodes, otherValues = np.split(np.asarray(linearizer.linearityCoeffs[amp]), 2)
+        signal = np.linspace(nodes[1], min(nodes[-1], otherNodes[-1]), 100)[np.newaxis]
+        difference = (evaluateSplines(signal, otherNodes[np.newaxis], otherValues[np.newaxis])
+                      - evaluateSplines(signal, nodes[np.newaxis], values[np.newaxis]))
+        deviation = max(deviation, float(np.max(np.abs(difference)/signal)))
+    return deviation
+
+
+def main(argv=None):
+    """Command line entry point for the linearity solve benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Measure the wall time of the cp_pipe spline linearity solve and of the batched "
+                    "solve on the PTC of the linearizer stage, and the largest fractional difference of "
+                    "their corrections.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo with the linearizer stage.")
+    parser.add_argument("--collections", default="ci_cpp_linearizer,LATISS/calib",
+                        help="Comma separated collections to read the PTC, solve config and camera from.")
+    parser.add_argument("--label", default="cpLinearizerSolve", help="Label of the linearity solve task.")
+    parser.add_argument("--detector", type=int, default=0, help="Detector to solve.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of solves per measurement.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    butler = dafButler.Butler(args.repo, collections=args.collections.split(","))
+    # The configuration the stage ran with, including its overrides.
+    config = butler.get(f"{args.label}_config")
+    dataId = {"instrument": "LATISS", "detector": args.detector}
+    inputs = (
+        butler.get(config.connections.inputPtc, dataId),
+        [],
+        butler.get("camera", instrument="LATISS"),
+        dataId,
+    )
+
+    perAmp, reference = _timeSolve(LinearitySolveTask(config=config), inputs, args.repeat)
+    batched, linearizer = _timeSolve(BatchedLinearitySolveTask(config=config), inputs, args.repeat)
+    results = [{
+        "amps": len(inputs[2][args.detector]),
+        "knots": config.splineKnots,
+        "cpPipe": perAmp,
+        "batched": batched,
+        "speedup": perAmp/batched,
+        "maxDeviation": _maxDeviation(reference, linearizer),
+    }]
+
+    print(formatTable(results, ["amps", "knots", "cpPipe", "batched", "speedup", "maxDeviation"]))
+    if args.output:
+        writeResults({"repeat": args.repeat, "results": results}, args.output)
@@ -0,0 +1,104 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Peak memory and wall time of the bias, dark and flat pipelines with
+the default and row-chunked (``cp<Type>LowMemory.yaml``) combination.
+"""
+
+__all__ = ["CALIBRATIONS", "main"]
+
+import argparse
+import os
+import resource
+import subprocess
+import sys
+
+from lsst.utils import getPackageDir
+
+from ..dataQuery import getDataQuery
+from ..stacking import computeSubregionRows
+from .utils import formatTable, runIsolated, writeResults
+
+# Default and row-chunked pipelines of each calibration.
+CALIBRATIONS = {
+    "bias": ("cpBias.yaml", "cpBiasLowMemory.yaml"),
+    "dark": ("cpDark.yaml", "cpDarkLowMemory.yaml"),
+    "flat": ("cpFlat.yaml", "cpFlatLowMemory.yaml"),
+}
+
+
+def _runPipetask(args):
+    """Run a pipetask and return its peak resident set size in bytes."""
+    subprocess.run(["pipetask", "run", *args], check=True, stdout=subprocess.DEVNULL)
+    maxRss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return maxRss if sys.platform == "darwin" else maxRss*1024
+
+
+def main(argv=None):
+    """Command line entry point for the stacking benchmark."""
+    parser = argparse.ArgumentParser(
+        description="Measure the wall time and peak RSS of the cpBias, cpDark and cpFlat pipelines, with "
+                    "the default and the row-chunked combination, against the number of inputs.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo with the certified calibrations.")
+    parser.add_argument("--collections", default="LATISS/raw/all,calib/v00,LATISS/calib",
+                        help="Comma separated input collections.")
+    for calibType in CALIBRATIONS:
+        parser.add_argument(f"--{calibType}-exposures", required=True,
+                            help=f"Comma separated exposures of the {calibType} stage.")
+    parser.add_argument("--inputs", default="2,4,8", help="Comma separated numbers of inputs.")
+    parser.add_argument("--width", type=int, default=4072, help="Detector width in pixels.")
+    parser.add_argument("--memory-limit", type=float, default=256.0,
+                        help="Memory ceiling for the chunked combination, in MB.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    pipelineDirs = [os.path.join(getPackageDir("ci_cpp_gen3"), "pipelines", "LATISS"),
+                    os.path.join(getPackageDir("cp_pipe"), "pipelines", "LATISS")]
+    memoryLimit = int(args.memory_limit*1024**2)
+    results = []
+    for calibType, pipelines in CALIBRATIONS.items():
+        exposures = [int(exposure) for exposure in getattr(args, f"{calibType}_exposures").split(",")]
+        for nInputs in sorted({min(int(n), len(exposures)) for n in args.inputs.split(",")}):
+            rows = computeSubregionRows(nInputs, args.width, memoryLimit)
+            for mode, pipelineFile in zip(("default", "lowMemory"), pipelines):
+                pipeline = next(os.path.join(directory, pipelineFile) for directory in pipelineDirs
+                                if os.path.exists(os.path.join(directory, pipelineFile)))
+                run = f"benchmarks/stacking/{calibType}/{mode}/{nInputs}"
+                pipetaskArgs = ["-j", "1", "-b", args.repo, "-i", args.collections, "--output-run", run,
+                                "-p", pipeline, "-d", getDataQuery(exposures[:nInputs]),
+                                "--register-dataset-types"]
+                if mode == "lowMemory":
+                    calibName = calibType.capitalize()
+                    pipetaskArgs += ["-c", f"cp{calibName}Combine:subregionSize=[10000,{rows}]"]
+                maxRss, wallTime, _ = runIsolated(_runPipetask, pipetaskArgs)
+                subprocess.run(["butler", "remove-runs", args.repo, run, "--no-confirm"], check=True,
+                               stdout=subprocess.DEVNULL)
+                result = {"calibration": calibType, "mode": mode, "nInputs": nInputs, "wallTime": wallTime,
+                          "maxRssMB": maxRss/1024**2}
+                if mode == "lowMemory":
+                    result["rows"] = rows
+                results.append(result)
+
+    print(formatTable(results, ["calibration", "mode", "nInputs", "rows", "wallTime", "maxRssMB"]))
+    if args.output:
+        writeResults({"width": args.width, "memoryLimitMB": args.memory_limit, "results": results},
+                     args.output)
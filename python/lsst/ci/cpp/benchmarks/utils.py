@@ -0,0 +1,123 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Shared helpers for the ci_cpp_gen3 benchmarks."""
+
+__all__ = ["maxResidentSetSize", "runIsolated", "formatTable", "writeResults"]
+
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import yaml
+
+
+def maxResidentSetSize():
+    """Return the peak resident set size of this process in bytes.
+
+    Returns
+    -------
+    maxRss : `int`
+        Peak resident set size.
+    """
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return maxRss if sys.platform == "darwin" else maxRss*1024
+
+
+def _measure(func, args, kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    wallTime = time.perf_counter() - start
+    return result, wallTime, maxResidentSetSize()
+
+
+def runIsolated(func, *args, **kwargs):
+    """Run a function in a fresh process and measure it.
+
+    The peak resident set size of a process never decreases, so each
+    measurement needs its own process.
+
+    Parameters
+    ----------
+    func : callable
+        Module-level function to run.
+    *args, **kwargs
+        Arguments for ``func``.
+
+    Returns
+    -------
+    result : `object`
+        Return value of ``func``.
+    wallTime : `float`
+        Time spent in ``func``, in seconds.
+    maxRss : `int`
+        Peak resident set size of the process running ``func``, in
+        bytes.
+    """
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(_measure, (func, args, kwargs))
+
+
+def formatTable(rows, columns):
+    """Format benchmark results as a plain text table.
+
+    Parameters
+    ----------
+    rows : `list` [`dict`]
+        Results, one dictionary per row.
+    columns : `list` [`str`]
+        Keys to include, in order.
+
+    Returns
+    -------
+    table : `str`
+        The formatted table.
+    """
+    def _format(value):
+        if isinstance(value, float):
+            return f"{value:.4g}"
+        return str(value)
+
+    cells = [[_format(row.get(column, "")) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(cell[i]) for cell in cells]) for i, column in enumerate(columns)]
+    lines = ["  ".join(column.ljust(width) for column, width in zip(columns, widths)),
+             "  ".join("-"*width for width in widths)]
+    lines.extend("  ".join(cell.ljust(width) for cell, width in zip(row, widths)) for row in cells)
+    return "\n".join(line.rstrip() for line in lines)
+
+
+def writeResults(results, filename):
+    """Write machine-readable benchmark results.
+
+    Parameters
+    ----------
+    results : `dict`
+        Results to write.
+    filename : `str`
+        Output YAML file.
+    """
+    dirname = os.path.dirname(os.path.abspath(filename))
+    os.makedirs(dirname, exist_ok=True)
+    with open(filename, "w") as f:
+        yaml.safe_dump(results, f, sort_keys=False)
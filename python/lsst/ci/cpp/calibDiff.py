@@ -0,0 +1,299 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Pixel-level comparison of certified calibrations from two builds.
+
+The image, mask and variance planes are read a tile at a time through
+`astropy.io.fits` sections, which are memory mapped for uncompressed
+files and decompressed tile by tile otherwise, so memory use is set by
+the tile size and not by the size of the calibration.  The stack is
+only imported by the functions that need it, so ``diffFiles`` is cheap
+to import.
+"""
+
+__all__ = ["DEFAULT_IGNORE_PLANES", "diffFiles", "getAmpBoxes", "findCalibrations", "main"]
+
+import argparse
+import math
+import os
+
+import numpy as np
+import yaml
+from astropy.io import fits
+
+# Mask planes whose pixels are left out of the statistics.
+DEFAULT_IGNORE_PLANES = ("BAD", "NO_DATA")
+
+
+def _maskBits(header, planes):
+    """Return the bits of the named mask planes, from the ``MP_*``
+    keywords written by afw.
+    """
+    bits = 0
+    for plane in planes:
+        key = f"MP_{plane}"
+        if key in header:
+            bits |= 1 << header[key]
+    return bits
+
+
+def _origin(header):
+    # afw writes the negated image origin as LTV1/LTV2.
+    return -int(header.get("LTV1", 0)), -int(header.get("LTV2", 0))
+
+
+def getAmpBoxes(filename):
+    """Read the amplifier layout of a calibration exposure.
+
+    Only the detector is read, not the pixels.
+
+    Parameters
+    ----------
+    filename : `str`
+        FITS file of an exposure.
+
+    Returns
+    -------
+    ampBoxes : `dict` [`str`, `tuple`]
+        ``(x0, y0, x1, y1)`` of each amplifier in parent pixel
+        coordinates, with ``x1`` and ``y1`` exclusive.
+    """
+    import lsst.afw.image as afwImage
+
+    detector = afwImage.ExposureFitsReader(filename).readDetector()
+    ampBoxes = {}
+    for amp in detector:
+        bbox = amp.getBBox()
+        ampBoxes[amp.getName()] = (bbox.getMinX(), bbox.getMinY(), bbox.getEndX(), bbox.getEndY())
+    return ampBoxes
+
+
+class _Stats:
+    """Running difference statistics of a set of pixels."""
+
+    def __init__(self):
+        self.nPixels = 0
+        self.sum = 0.0
+        self.sumSq = 0.0
+        self.maxAbs = 0.0
+        self.nOutliers = 0
+
+    def add(self, diff, outliers):
+        if diff.size == 0:
+            return
+        self.nPixels += diff.size
+        self.sum += float(np.sum(diff))
+        self.sumSq += float(np.sum(diff*diff))
+        self.maxAbs = max(self.maxAbs, float(np.max(np.abs(diff))))
+        self.nOutliers += int(np.count_nonzero(outliers))
+
+    def toDict(self):
+        mean = self.sum/self.nPixels if self.nPixels else float("nan")
+        variance = self.sumSq/self.nPixels - mean**2 if self.nPixels else float("nan")
+        return {"nPixels": self.nPixels, "mean": mean, "std": float(np.sqrt(max(variance, 0.0))),
+                "maxAbs": self.maxAbs, "nOutliers": self.nOutliers}
+
+
+def diffFiles(fileA, fileB, ampBoxes, tileSize=512, nSigma=5.0, ignorePlanes=DEFAULT_IGNORE_PLANES):
+    """Compare two calibration exposures tile by tile.
+
+    A pixel is an outlier if its difference exceeds ``nSigma`` times the
+    combined noise of the two variance planes.
+
+    Parameters
+    ----------
+    fileA, fileB : `str`
+        FITS files of the reference and the new calibration.
+    ampBoxes : `dict` [`str`, `tuple`]
+        Amplifier bounding boxes, as from `getAmpBoxes`.
+    tileSize : `int`, optional
+        Side of the square tiles read at a time, in pixels.
+    nSigma : `float`, optional
+        Outlier threshold.
+    ignorePlanes : iterable [`str`], optional
+        Mask planes whose pixels (in either calibration) are ignored.
+
+    Returns
+    -------
+    amps : `dict` [`str`, `dict`]
+        Difference statistics of each amplifier.
+    total : `dict`
+        Difference statistics of the whole detector.
+    tiles : `dict` [`str`, `numpy.ndarray`]
+        Per-tile ``mean``, ``maxAbs`` and ``nOutliers`` maps.
+
+    Raises
+    ------
+    ValueError
+        Raised if the two calibrations differ in shape.
+    """
+    with fits.open(fileA, memmap=True) as hdulA, fits.open(fileB, memmap=True) as hdulB:
+        planesA = [hdulA[name] for name in ("IMAGE", "MASK", "VARIANCE")]
+        planesB = [hdulB[name] for name in ("IMAGE", "MASK", "VARIANCE")]
+        if planesA[0].shape != planesB[0].shape:
+            raise ValueError(f"{fileA} has shape {planesA[0].shape} but {fileB} has {planesB[0].shape}.")
+        ignoreA = _maskBits(planesA[1].header, ignorePlanes)
+        ignoreB = _maskBits(planesB[1].header, ignorePlanes)
+        x0, y0 = _origin(planesA[0].header)
+
+        height, width = planesA[0].shape
+        nTilesY, nTilesX = -(-height//tileSize), -(-width//tileSize)
+        tiles = {"mean": np.full((nTilesY, nTilesX), np.nan, dtype=np.float32),
+                 "maxAbs": np.zeros((nTilesY, nTilesX), dtype=np.float32),
+                 "nOutliers": np.zeros((nTilesY, nTilesX), dtype=np.int64)}
+        amps = {name: _Stats() for name in ampBoxes}
+        total = _Stats()
+
+        for ty in range(nTilesY):
+            ys = slice(ty*tileSize, min((ty + 1)*tileSize, height))
+            for tx in range(nTilesX):
+                xs = slice(tx*tileSize, min((tx + 1)*tileSize, width))
+                imageA, maskA, varianceA = (plane.section[ys, xs] for plane in planesA)
+                imageB, maskB, varianceB = (plane.section[ys, xs] for plane in planesB)
+
+                diff = imageB.astype(np.float64) - imageA
+                sigma = np.sqrt(np.clip(varianceA.astype(np.float64) + varianceB, 0.0, None))
+                good = ((maskA & ignoreA) == 0) & ((maskB & ignoreB) == 0) & np.isfinite(diff)
+                outliers = good & (np.abs(diff) > nSigma*sigma)
+
+                if np.any(good):
+                    tiles["mean"][ty, tx] = np.mean(diff[good])
+                    tiles["maxAbs"][ty, tx] = np.max(np.abs(diff[good]))
+                    tiles["nOutliers"][ty, tx] = np.count_nonzero(outliers)
+                total.add(diff[good], outliers[good])
+
+                # Amplifier boxes in the array coordinates of this tile.
+                for name, (ax0, ay0, ax1, ay1) in ampBoxes.items():
+                    sy = slice(max(ay0 - y0 - ys.start, 0), max(min(ay1 - y0, ys.stop) - ys.start, 0))
+                    sx = slice(max(ax0 - x0 - xs.start, 0), max(min(ax1 - x0, xs.stop) - xs.start, 0))
+                    ampGood = good[sy, sx]
+                    amps[name].add(diff[sy, sx][ampGood], outliers[sy, sx][ampGood])
+
+    return ({name: stats.toDict() for name, stats in amps.items()}, total.toDict(), tiles)
+
+
+def findCalibrations(butler, datasetType, collections):
+    """Find the calibrations of one type, keyed by data ID.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler to search.
+    datasetType : `str`
+        Dataset type, e.g. ``bias``.
+    collections : `list` [`str`]
+        Collections to search in order; the first collection with a
+        dataset for a data ID provides it.  Within a calibration
+        collection, the dataset whose validity range starts last is
+        used.
+
+    Returns
+    -------
+    refs : `dict` [`tuple`, `lsst.daf.butler.DatasetRef`]
+        Datasets keyed by their sorted data ID items.
+    """
+    from lsst.daf.butler import CollectionType
+
+    refs = {}
+    for collection in butler.registry.queryCollections(collections, flattenChains=True):
+        if butler.registry.getCollectionType(collection) == CollectionType.CALIBRATION:
+            latest = {}
+            associations = butler.registry.queryDatasetAssociations(datasetType, collections=[collection])
+            for association in associations:
+                key = tuple(sorted(association.ref.dataId.required.items()))
+                begin = association.timespan.begin
+                start = begin.tai.mjd if begin is not None else -math.inf
+                if key not in latest or start > latest[key][0]:
+                    latest[key] = (start, association.ref)
+            found = {key: ref for key, (_, ref) in latest.items()}
+        else:
+            found = {tuple(sorted(ref.dataId.required.items())): ref
+                     for ref in butler.registry.queryDatasets(datasetType, collections=[collection],
+                                                              findFirst=True)}
+        for key, ref in found.items():
+            refs.setdefault(key, ref)
+    return refs
+
+
+def _formatDataId(key):
+    return ",".join(f"{name}={value}" for name, value in key)
+
+
+def main(argv=None):
+    """Command line entry point for comparing calibrations."""
+    parser = argparse.ArgumentParser(
+        description="Compare the certified calibrations of two repos or collections pixel by pixel, "
+                    "a tile at a time, and write per-amplifier and per-tile difference statistics.",
+    )
+    parser.add_argument("--repo-a", required=True, help="Reference butler repo.")
+    parser.add_argument("--collections-a", default="calib/v00",
+                        help="Comma separated collections of the reference calibrations.")
+    parser.add_argument("--repo-b", default=None,
+                        help="Butler repo to compare (default: the reference repo).")
+    parser.add_argument("--collections-b", required=True,
+                        help="Comma separated collections of the calibrations to compare.")
+    parser.add_argument("--dataset-types", default="bias,dark,flat,sky",
+                        help="Comma separated calibration dataset types to compare.")
+    parser.add_argument("--tile-size", type=int, default=512, help="Side of the tiles read at a time.")
+    parser.add_argument("--n-sigma", type=float, default=5.0,
+                        help="Outlier threshold, in units of the combined variance-plane noise.")
+    parser.add_argument("--ignore-planes", default=",".join(DEFAULT_IGNORE_PLANES),
+                        help="Comma separated mask planes to leave out.")
+    parser.add_argument("-o", "--output-dir", required=True,
+                        help="Directory for the report (calibDiff.yaml) and the tile maps (calibDiff.npz).")
+    args = parser.parse_args(argv)
+
+    import lsst.daf.butler as dafButler
+
+    butlerA = dafButler.Butler(args.repo_a, writeable=False)
+    butlerB = dafButler.Butler(args.repo_b, writeable=False) if args.repo_b else butlerA
+    ignorePlanes = [plane for plane in args.ignore_planes.split(",") if plane]
+
+    products = []
+    tileMaps = {}
+    for datasetType in args.dataset_types.split(","):
+        refsA = findCalibrations(butlerA, datasetType, args.collections_a.split(","))
+        refsB = findCalibrations(butlerB, datasetType, args.collections_b.split(","))
+        for key in sorted(set(refsA) | set(refsB)):
+            product = {"datasetType": datasetType, "dataId": dict(key)}
+            products.append(product)
+            if key not in refsA or key not in refsB:
+                product["missing"] = "a" if key not in refsA else "b"
+                continue
+            with butlerA.getURI(refsA[key]).as_local() as localA, \
+                    butlerB.getURI(refsB[key]).as_local() as localB:
+                ampBoxes = getAmpBoxes(localA.ospath)
+                amps, total, tiles = diffFiles(localA.ospath, localB.ospath, ampBoxes,
+                                               tileSize=args.tile_size, nSigma=args.n_sigma,
+                                               ignorePlanes=ignorePlanes)
+            product.update({"total": total, "amps": amps})
+            name = f"{datasetType}:{_formatDataId(key)}"
+            tileMaps.update({f"{name}:{stat}": values for stat, values in tiles.items()})
+            print(f"{name}: mean {total['mean']:.4g}, std {total['std']:.4g}, "
+                  f"max |diff| {total['maxAbs']:.4g}, {total['nOutliers']} outlier(s) of "
+                  f"{total['nPixels']} pixels.")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    with open(os.path.join(args.output_dir, "calibDiff.yaml"), "w") as f:
+        yaml.safe_dump({"a": {"repo": args.repo_a, "collections": args.collections_a},
+                        "b": {"repo": args.repo_b or args.repo_a, "collections": args.collections_b},
+                        "tileSize": args.tile_size, "nSigma": args.n_sigma, "ignorePlanes": ignorePlanes,
+                        "products": products}, f, sort_keys=False)
+    np.savez_compressed(os.path.join(args.output_dir, "calibDiff.npz"), **tileMaps)
@@ -0,0 +1,110 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Compact data queries for long exposure lists.
+
+Runs of exposure ids are written with the ``a..b`` range syntax of the
+butler expression language, and short gaps inside a run are excluded
+with ``NOT IN``, so the length of the query grows with the number of
+runs rather than the number of exposures.  No stack packages are used,
+so that the SConscript can load this module directly.
+"""
+
+__all__ = ["compressExposures", "formatExposureQuery", "getDataQuery"]
+
+
+def compressExposures(expList, maxGap=2):
+    """Cover exposure ids with ranges and exclusions.
+
+    Parameters
+    ----------
+    expList : iterable [`int`]
+        Exposure ids.
+    maxGap : `int`, optional
+        Largest number of missing ids between two runs for them to be
+        merged into one range, with the missing ids excluded.
+
+    Returns
+    -------
+    ranges : `list` [`tuple` [`int`, `int`]]
+        Inclusive ``(first, last)`` ranges, in order.
+    excluded : `list` [`int`]
+        Ids inside the ranges that are not selected.
+    """
+    ranges = []
+    excluded = []
+    for exp in sorted(set(int(exp) for exp in expList)):
+        if ranges and exp - ranges[-1][1] - 1 <= maxGap:
+            excluded.extend(range(ranges[-1][1] + 1, exp))
+            ranges[-1][1] = exp
+        else:
+            ranges.append([exp, exp])
+    return [tuple(r) for r in ranges], excluded
+
+
+def formatExposureQuery(expList, maxGap=2):
+    """Format the selection of exposures as a query term.
+
+    Parameters
+    ----------
+    expList : iterable [`int`]
+        Exposure ids.
+    maxGap : `int`, optional
+        As for `compressExposures`.
+
+    Returns
+    -------
+    term : `str`
+        Expression selecting exactly those exposures.
+    """
+    ranges, excluded = compressExposures(expList, maxGap=maxGap)
+    if not ranges:
+        raise ValueError("No exposures to select.")
+    items = [str(first) if first == last else f"{first}..{last}" for first, last in ranges]
+    # The spaces inside the parentheses match the queries the SConscript
+    # wrote before, so a stage whose exposures form no ranges keeps its
+    # build signature.
+    term = f"exposure IN ( {','.join(items)} )"
+    if excluded:
+        term = f"{term} AND exposure NOT IN ( {','.join(str(exp) for exp in excluded)} )"
+    return term
+
+
+def getDataQuery(expList, instrument="LATISS", detector=0, maxGap=2):
+    """Data query selecting the given exposures of one detector.
+
+    Parameters
+    ----------
+    expList : iterable [`int`]
+        Exposure ids.
+    instrument : `str`, optional
+        Instrument name.
+    detector : `int`, optional
+        Detector id.
+    maxGap : `int`, optional
+        As for `compressExposures`.
+
+    Returns
+    -------
+    dataQuery : `str`
+        The ``pipetask -d`` expression.
+    """
+    return (f"instrument='{instrument}' AND detector={detector} AND "
+            + formatExposureQuery(expList, maxGap=maxGap))
@@ -0,0 +1,305 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Run a pipetask stage by dispatching its quanta to worker nodes.
+
+The quantum graph of the stage is saved with its datastore records, the
+init-outputs are written, and each quantum is run with ``pipetask
+run-qbb`` (a quantum-backed butler, which needs no registry access) on
+a worker that shares the repo filesystem.  Once every quantum has
+finished, the outputs are transferred into the repo and the output
+chain is updated.
+
+Workers are hosts reached through a launcher command such as ``ssh
+{host}`` or ``docker exec {host} bash -lc``; without hosts, local
+processes stand in for them.
+"""
+
+__all__ = ["QuantumScheduler", "splitPipetaskArgs", "runStage", "main"]
+
+import argparse
+import math
+import os
+import shlex
+import subprocess
+import sys
+import time
+
+
+class QuantumScheduler:
+    """Order quanta so that each runs after the quanta it depends on.
+
+    Parameters
+    ----------
+    dependencies : `dict` [`str`, `set` [`str`]]
+        The quanta each quantum depends on, keyed by quantum id.
+    """
+
+    def __init__(self, dependencies):
+        self._waitingOn = {quantum: set(inputs) for quantum, inputs in dependencies.items()}
+        self._dependents = {quantum: set() for quantum in dependencies}
+        for quantum, inputs in dependencies.items():
+            for input in inputs:
+                self._dependents[input].add(quantum)
+        self._ready = [quantum for quantum, inputs in self._waitingOn.items() if not inputs]
+        self._running = set()
+        self._finished = set()
+
+    @property
+    def nReady(self):
+        """Number of quanta that can be started now (`int`)."""
+        return len(self._ready)
+
+    @property
+    def done(self):
+        """Whether every quantum has finished (`bool`)."""
+        return len(self._finished) == len(self._waitingOn)
+
+    def takeBatch(self, nFree, maxBatch=None):
+        """Take ready quanta for one worker.
+
+        Ready quanta are shared evenly between the free workers, so that
+        the start-up cost of each job is spread over several quanta.
+
+        Parameters
+        ----------
+        nFree : `int`
+            Number of free workers.
+        maxBatch : `int`, optional
+            Largest number of quanta per job.
+
+        Returns
+        -------
+        batch : `list` [`str`]
+            Quanta to run, now marked as running.
+        """
+        size = math.ceil(len(self._ready)/max(nFree, 1))
+        if maxBatch:
+            size = min(size, maxBatch)
+        batch, self._ready = self._ready[:size], self._ready[size:]
+        self._running.update(batch)
+        return batch
+
+    def finish(self, batch):
+        """Mark quanta as finished and release their dependents.
+
+        Parameters
+        ----------
+        batch : `list` [`str`]
+            Quanta that ran successfully.
+        """
+        for quantum in batch:
+            self._running.discard(quantum)
+            self._finished.add(quantum)
+            for dependent in sorted(self._dependents[quantum]):
+                self._waitingOn[dependent].discard(quantum)
+                if not self._waitingOn[dependent]:
+                    self._ready.append(dependent)
+
+
+def splitPipetaskArgs(args):
+    """Separate the arguments of ``pipetask run`` for a distributed run.
+
+    Parameters
+    ----------
+    args : `list` [`str`]
+        Arguments as given to ``pipetask run``; a leading ``run`` is
+        ignored.
+
+    Returns
+    -------
+    butlerConfig : `str`
+        The ``-b`` repo.
+    jobs : `int`
+        The ``-j`` process count (1 if not given).
+    qgraphArgs : `list` [`str`]
+        Arguments for ``pipetask qgraph``, without ``-b``.
+    """
+    args = list(args)
+    if args and args[0] == "run":
+        args = args[1:]
+    butlerConfig, jobs, qgraphArgs = None, 1, []
+    iterArgs = iter(args)
+    for arg in iterArgs:
+        if arg in ("-b", "--butler-config"):
+            butlerConfig = next(iterArgs)
+        elif arg in ("-j", "--processes"):
+            jobs = int(next(iterArgs))
+        elif arg == "--register-dataset-types":
+            # Done when the outputs are transferred.
+            continue
+        else:
+            qgraphArgs.append(arg)
+    if butlerConfig is None:
+        raise ValueError("The pipetask arguments must include the repo (-b).")
+    return butlerConfig, jobs, qgraphArgs
+
+
+def _pipetask(*args):
+    return shlex.join(["pipetask", *args])
+
+
+class _Worker:
+    """A slot that runs one job at a time, locally or through a launcher."""
+
+    def __init__(self, name, launcher=None):
+        self.name = name
+        self.launcher = launcher
+        self.process = None
+        self.batch = None
+        self.start = None
+
+    def run(self, cmd, batch, logFile):
+        # Remote shells start in the home directory.
+        cmd = f"cd {shlex.quote(os.getcwd())} && {cmd}"
+        if self.launcher is None:
+            argv = ["sh", "-c", cmd]
+        else:
+            argv = shlex.split(self.launcher.format(host=self.name)) + [cmd]
+        self.process = subprocess.Popen(argv, stdout=logFile, stderr=subprocess.STDOUT)
+        self.batch = batch
+        self.start = time.perf_counter()
+
+
+def _loadDependencies(qgraphFile):
+    from lsst.pipe.base import QuantumGraph
+
+    qgraph = QuantumGraph.loadUri(qgraphFile)
+    return {str(node.nodeId): {str(input.nodeId) for input in qgraph.determineInputsToQuantumNode(node)}
+            for node in qgraph}
+
+
+def runStage(butlerConfig, qgraphArgs, qgraphFile, hosts=None, launcher="ssh {host}", jobs=1,
+             maxBatch=None, logDir=None):
+    """Build, dispatch and merge the quanta of one stage.
+
+    Parameters
+    ----------
+    butlerConfig : `str`
+        The central repo.
+    qgraphArgs : `list` [`str`]
+        Arguments for ``pipetask qgraph``.
+    qgraphFile : `str`
+        File to save the quantum graph to.
+    hosts : `list` [`str`], optional
+        Worker hosts; if not given, ``jobs`` local processes are used.
+    launcher : `str`, optional
+        Command that runs a shell command on ``{host}``.
+    jobs : `int`, optional
+        Number of jobs to run at once.  With hosts, at least one job
+        runs on each host.
+    maxBatch : `int`, optional
+        Largest number of quanta per job.
+    logDir : `str`, optional
+        Directory for the log of each job; defaults to the directory of
+        ``qgraphFile``.
+
+    Returns
+    -------
+    summary : `dict`
+        Number of quanta and jobs, and the wall time of each step.
+
+    Raises
+    ------
+    RuntimeError
+        Raised if a step fails; the outputs are then not transferred.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(qgraphFile)), exist_ok=True)
+    logDir = logDir or os.path.join(os.path.dirname(os.path.abspath(qgraphFile)), "logs")
+    os.makedirs(logDir, exist_ok=True)
+    summary = {}
+
+    start = time.perf_counter()
+    subprocess.run(["pipetask", "qgraph", "-b", butlerConfig, *qgraphArgs,
+                    "--qgraph-datastore-records", "--save-qgraph", qgraphFile], check=True)
+    subprocess.run(["pipetask", "pre-exec-init-qbb", butlerConfig, qgraphFile], check=True)
+    summary["qgraphTime"] = time.perf_counter() - start
+
+    scheduler = QuantumScheduler(_loadDependencies(qgraphFile))
+    if hosts:
+        workers = [_Worker(hosts[i % len(hosts)], launcher) for i in range(max(jobs, len(hosts)))]
+    else:
+        workers = [_Worker(f"local{i}") for i in range(jobs)]
+
+    start = time.perf_counter()
+    nJobs = 0
+    failed = []
+    while not scheduler.done and not failed:
+        for worker in workers:
+            if worker.process is not None and worker.process.poll() is not None:
+                if worker.process.returncode == 0:
+                    scheduler.finish(worker.batch)
+                else:
+                    failed.append(worker.name)
+                worker.process = None
+        free = [worker for worker in workers if worker.process is None]
+        while free and scheduler.nReady and not failed:
+            batch = scheduler.takeBatch(len(free), maxBatch)
+            worker = free.pop()
+            with open(os.path.join(logDir, f"job{nJobs:05d}.log"), "w") as logFile:
+                worker.run(_pipetask("run-qbb", butlerConfig, qgraphFile,
+                                     "--qgraph-node-id", ",".join(batch)), batch, logFile)
+            nJobs += 1
+        if not scheduler.done:
+            time.sleep(0.2)
+    for worker in workers:
+        if worker.process is not None:
+            worker.process.wait()
+    summary["dispatchTime"] = time.perf_counter() - start
+    if failed:
+        raise RuntimeError(f"Jobs failed on {', '.join(failed)}; see {logDir}.")
+
+    start = time.perf_counter()
+    subprocess.run(["butler", "transfer-from-graph", qgraphFile, butlerConfig,
+                    "--register-dataset-types", "--update-output-chain"], check=True)
+    summary["transferTime"] = time.perf_counter() - start
+    summary["jobs"] = nJobs
+    return summary
+
+
+def main(argv=None):
+    """Command line entry point for distributed stage execution."""
+    parser = argparse.ArgumentParser(
+        description="Run the quanta of a pipetask stage on workers sharing the repo filesystem, and "
+                    "merge their outputs into the repo.  The arguments after -- are those of "
+                    "'pipetask run'; -j sets the number of jobs run at once.",
+    )
+    parser.add_argument("--qgraph", required=True, help="File to save the quantum graph to.")
+    parser.add_argument("--hosts", default="",
+                        help="Comma separated worker hosts; local processes are used if empty.")
+    parser.add_argument("--launcher", default="ssh {host}",
+                        help="Command that runs a shell command on a worker {host}.")
+    parser.add_argument("--max-batch", type=int, default=None, help="Largest number of quanta per job.")
+    parser.add_argument("pipetaskArgs", nargs=argparse.REMAINDER, help="Arguments of 'pipetask run'.")
+    args = parser.parse_args(argv)
+
+    pipetaskArgs = args.pipetaskArgs
+    if pipetaskArgs and pipetaskArgs[0] == "--":
+        pipetaskArgs = pipetaskArgs[1:]
+    butlerConfig, jobs, qgraphArgs = splitPipetaskArgs(pipetaskArgs)
+    hosts = [host.strip() for host in args.hosts.split(",") if host.strip()]
+    try:
+        summary = runStage(butlerConfig, qgraphArgs, args.qgraph, hosts=hosts, launcher=args.launcher,
+                           jobs=jobs, maxBatch=args.max_batch)
+    except (RuntimeError, subprocess.CalledProcessError) as e:
+        print(e, file=sys.stderr)
+        sys.exit(1)
+    print(f"{summary['jobs']} jobs: graph {summary['qgraphTime']:.1f} s, "
+          f"quanta {summary['dispatchTime']:.1f} s, transfer {summary['transferTime']:.1f} s.")
@@ -0,0 +1,339 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""History of verification statistics and stage metrics across builds.
+
+Each build is stored as one Parquet file of ``(build, timestamp,
+source, name, metric, value)`` rows in a history directory.  Reading
+and writing the history needs ``pyarrow``, which is imported only when
+it is used, so that the rest of the package does not depend on it.
+"""
+
+__all__ = ["VERIFY_PRODUCTS", "flattenStats", "collectVerifyRows", "collectStageRows", "writeBuild",
+           "readHistory", "findDrifts", "main"]
+
+import argparse
+import datetime
+import fnmatch
+import glob
+import os
+
+import numpy as np
+import yaml
+
+# Verification statistics recorded for each build, as
+# (collection, dataset type, data id).  These are the products that
+# tests/test_verification.py compares.
+VERIFY_PRODUCTS = [
+    ("ci_cpv_bias", "verifyBiasStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500015}),
+    ("ci_cpv_bias", "verifyBiasExpStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500015}),
+    ("ci_cpv_bias", "verifyBiasDetStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500015}),
+    ("ci_cpv_dark", "verifyDarkStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500057}),
+    ("ci_cpv_dark", "verifyDarkExpStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500057}),
+    ("ci_cpv_dark", "verifyDarkDetStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500057}),
+    ("ci_cpv_flat", "verifyFlatStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500080,
+                                        "physical_filter": "RG610~empty"}),
+    ("ci_cpv_flat", "verifyFlatExpStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500080,
+                                           "physical_filter": "RG610~empty"}),
+    ("ci_cpv_flat", "verifyFlatDetStats", {"instrument": "LATISS", "detector": 0, "exposure": 2021052500080,
+                                           "physical_filter": "RG610~empty"}),
+    ("ci_cpv_ptc", "verifyPtcStats", {"instrument": "LATISS", "detector": 0}),
+    ("ci_cpv_ptc", "verifyPtcDetStats", {"instrument": "LATISS", "detector": 0}),
+    ("ci_cpv_linearizer", "verifyLinearizerStats", {"instrument": "LATISS", "detector": 0}),
+    ("ci_cpv_linearizer", "verifyLinearizerDetStats", {"instrument": "LATISS", "detector": 0}),
+]
+
+
+def _getSchema():
+    """Schema of the history tables."""
+    import pyarrow as pa
+
+    return pa.schema([
+        ("build", pa.string()),
+        ("timestamp", pa.timestamp("us", tz="UTC")),
+        ("source", pa.string()),
+        ("name", pa.string()),
+        ("metric", pa.string()),
+        ("value", pa.float64()),
+    ])
+
+
+def flattenStats(stats, prefix=""):
+    """Flatten nested verification statistics to numeric metrics.
+
+    Parameters
+    ----------
+    stats : `dict` or `list` or scalar
+        Statistics, e.g. as read from ``verifyBiasDetStats``.
+    prefix : `str`, optional
+        Path of ``stats`` within the enclosing statistics.
+
+    Returns
+    -------
+    metrics : `dict` [`str`, `float`]
+        Values keyed by dotted path, e.g. ``AMP.C10.NOISE``.  Booleans
+        become 0 or 1; lists of strings (such as ``FAILURES``) are
+        recorded as ``<path>.count``.
+    """
+    metrics = {}
+    if isinstance(stats, dict):
+        for key, value in stats.items():
+            metrics.update(flattenStats(value, f"{prefix}.{key}" if prefix else str(key)))
+    elif isinstance(stats, (list, tuple)):
+        if all(isinstance(value, str) for value in stats):
+            metrics[f"{prefix}.count"] = float(len(stats))
+        else:
+            for i, value in enumerate(stats):
+                metrics.update(flattenStats(value, f"{prefix}.{i}"))
+    elif isinstance(stats, (bool, int, float, np.number)):
+        metrics[prefix] = float(stats)
+    return metrics
+
+
+def collectVerifyRows(butler):
+    """Read the verification statistics of a build.
+
+    Products that are missing (e.g. a stage that was not run) are
+    skipped.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler for the repo.
+
+    Returns
+    -------
+    rows : `list` [`tuple`]
+        ``(source, name, metric, value)`` rows.
+    """
+    from lsst.daf.butler import MissingCollectionError
+
+    rows = []
+    for collection, datasetType, dataId in VERIFY_PRODUCTS:
+        try:
+            stats = butler.get(datasetType, dataId=dataId, collections=collection)
+        except (LookupError, MissingCollectionError):
+            # DatasetNotFoundError and MissingDatasetTypeError are
+            # LookupErrors.
+            continue
+        for metric, value in flattenStats(stats).items():
+            rows.append(("verify", datasetType, metric, value))
+    return rows
+
+
+def collectStageRows(metricsDir, since=None):
+    """Read the per-stage metrics written by ``ci_cpp_stage_metrics.py``.
+
+    Parameters
+    ----------
+    metricsDir : `str`
+        Directory of ``<stage>.yaml`` metrics files.
+    since : `float`, optional
+        Start of the build, in seconds since the epoch.  Files written
+        before then belong to stages this build did not run, and are
+        skipped.
+
+    Returns
+    -------
+    rows : `list` [`tuple`]
+        ``(source, name, metric, value)`` rows.
+    """
+    rows = []
+    for filename in sorted(glob.glob(os.path.join(metricsDir, "*.yaml"))):
+        if since is not None and os.path.getmtime(filename) < since:
+            continue
+        stage = os.path.splitext(os.path.basename(filename))[0]
+        with open(filename) as f:
+            metrics = yaml.safe_load(f)
+        for metric in ("quanta", "wallTime", "maxResidentSetSize"):
+            rows.append(("stage", stage, metric, float(metrics[metric])))
+    return rows
+
+
+def writeBuild(historyDir, build, rows, timestamp=None):
+    """Store the rows of one build.
+
+    Parameters
+    ----------
+    historyDir : `str`
+        History directory.
+    build : `str`
+        Identifier of the build.
+    rows : `list` [`tuple`]
+        ``(source, name, metric, value)`` rows.
+    timestamp : `datetime.datetime`, optional
+        Time of the build; defaults to now.
+
+    Returns
+    -------
+    filename : `str`
+        The Parquet file written.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    timestamp = timestamp or datetime.datetime.now(datetime.timezone.utc)
+    columns = list(zip(*rows)) if rows else [[], [], [], []]
+    table = pa.Table.from_arrays(
+        [
+            pa.array([build]*len(rows), pa.string()),
+            pa.array([timestamp]*len(rows), pa.timestamp("us", tz="UTC")),
+            pa.array(columns[0], pa.string()),
+            pa.array(columns[1], pa.string()),
+            pa.array(columns[2], pa.string()),
+            pa.array(columns[3], pa.float64()),
+        ],
+        schema=_getSchema(),
+    )
+    os.makedirs(historyDir, exist_ok=True)
+    filename = os.path.join(historyDir, f"{timestamp.strftime('%Y%m%dT%H%M%S')}_{build}.parquet")
+    pq.write_table(table, filename)
+    return filename
+
+
+def readHistory(historyDir, metric="*"):
+    """Read the history of matching metrics.
+
+    Parameters
+    ----------
+    historyDir : `str`
+        History directory.
+    metric : `str`, optional
+        Shell-style pattern matched against ``<name>/<metric>``.
+
+    Returns
+    -------
+    series : `dict` [`str`, `list` [`tuple`]]
+        ``(timestamp, build, value)`` in time order, keyed by
+        ``<name>/<metric>``.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    filenames = sorted(glob.glob(os.path.join(historyDir, "*.parquet")))
+    series = {}
+    if not filenames:
+        return series
+    schema = _getSchema()
+    table = pa.concat_tables([pq.read_table(filename, schema=schema) for filename in filenames])
+    for row in table.to_pylist():
+        key = f"{row['name']}/{row['metric']}"
+        if fnmatch.fnmatchcase(key, metric):
+            series.setdefault(key, []).append((row["timestamp"], row["build"], row["value"]))
+    for values in series.values():
+        values.sort(key=lambda value: value[0])
+    return series
+
+
+def findDrifts(series, window=10, recent=3, threshold=4.0):
+    """Flag metrics whose recent builds moved away from their history.
+
+    The median of the last ``recent`` builds is compared with the
+    median of the ``window`` builds before them, in units of the
+    robust scatter (1.4826 times the median absolute deviation) of
+    that window.  Using medians on both sides picks up slow shifts that
+    individual builds, and the wide test tolerances, would not.
+
+    Parameters
+    ----------
+    series : `dict` [`str`, `list` [`tuple`]]
+        History, as from `readHistory`.
+    window : `int`, optional
+        Number of earlier builds forming the baseline.
+    recent : `int`, optional
+        Number of latest builds compared with the baseline.
+    threshold : `float`, optional
+        Shift, in robust sigma, above which a metric is flagged.
+
+    Returns
+    -------
+    drifts : `list` [`dict`]
+        Flagged metrics, largest shift first.
+    """
+    drifts = []
+    for key, values in series.items():
+        numbers = np.array([value[2] for value in values], dtype=float)
+        if len(numbers) < recent + 2:
+            continue
+        baseline = numbers[-(recent + window):-recent]
+        latest = numbers[-recent:]
+        baselineMedian = np.nanmedian(baseline)
+        latestMedian = np.nanmedian(latest)
+        if np.isnan(baselineMedian) or np.isnan(latestMedian):
+            continue
+        sigma = 1.4826*np.nanmedian(np.abs(baseline - baselineMedian))
+        if sigma == 0.0:
+            # A constant baseline: any change is a drift.
+            significance = np.inf if latestMedian != baselineMedian else 0.0
+        else:
+            significance = abs(latestMedian - baselineMedian)/sigma
+        if significance > threshold:
+            drifts.append({"metric": key, "baseline": float(baselineMedian), "latest": float(latestMedian),
+                           "sigma": float(sigma), "significance": float(significance)})
+    drifts.sort(key=lambda drift: -drift["significance"])
+    return drifts
+
+
+def main(argv=None):
+    """Command line entry point for the build history."""
+    parser = argparse.ArgumentParser(description="Record and query verification and stage metric history.")
+    parser.add_argument("--history-dir", required=True, help="Directory of per-build Parquet files.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    record = subparsers.add_parser("record", help="Record the metrics of the current build.")
+    record.add_argument("-r", "--repo", required=True, help="Butler repo of the build.")
+    record.add_argument("--metrics-dir", default=None, help="Directory of stage metrics to include.")
+    record.add_argument("--build", default=None, help="Build identifier; defaults to the time.")
+    record.add_argument("--since", type=float, default=None,
+                        help="Build start in seconds since the epoch; older stage metrics are skipped.")
+
+    trend = subparsers.add_parser("trend", help="Print the history of matching metrics.")
+    trend.add_argument("metric", help="Pattern matched against <name>/<metric>, e.g. '*/AMP.C10.NOISE'.")
+
+    drift = subparsers.add_parser("drift", help="List metrics that drifted; exits 1 if any did.")
+    drift.add_argument("--metric", default="*", help="Pattern matched against <name>/<metric>.")
+    drift.add_argument("--window", type=int, default=10, help="Number of baseline builds.")
+    drift.add_argument("--recent", type=int, default=3, help="Number of latest builds compared.")
+    drift.add_argument("--threshold", type=float, default=4.0, help="Shift in robust sigma to flag.")
+    args = parser.parse_args(argv)
+
+    if args.command == "record":
+        import lsst.daf.butler as dafButler
+
+        rows = collectVerifyRows(dafButler.Butler(args.repo))
+        if args.metrics_dir and os.path.isdir(args.metrics_dir):
+            rows.extend(collectStageRows(args.metrics_dir, since=args.since))
+        timestamp = datetime.datetime.now(datetime.timezone.utc)
+        build = args.build if args.build else timestamp.strftime("%Y%m%dT%H%M%S")
+        filename = writeBuild(args.history_dir, build, rows, timestamp=timestamp)
+        print(f"Recorded {len(rows)} metrics for build {build} in {filename}.")
+    elif args.command == "trend":
+        for key, values in sorted(readHistory(args.history_dir, args.metric).items()):
+            print(key)
+            for timestamp, build, value in values:
+                print(f"  {timestamp.isoformat()}  {build}  {value:.6g}")
+    else:
+        drifts = findDrifts(readHistory(args.history_dir, args.metric), window=args.window,
+                            recent=args.recent, threshold=args.threshold)
+        for result in drifts:
+            print(f"{result['metric']}: {result['baseline']:.6g} -> {result['latest']:.6g} "
+                  f"({result['significance']:.1f} sigma)")
+        if drifts:
+            raise SystemExit(1)
@@ -0,0 +1,183 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Import-time report and budget for the test modules.
+
+Each test module is imported in a fresh interpreter run with
+``-X importtime``, so the report covers exactly what collecting that
+module costs.
+"""
+
+__all__ = ["parseImportTime", "measureImportTime", "checkBudget", "main"]
+
+import argparse
+import glob
+import os
+import re
+import subprocess
+import sys
+
+import yaml
+
+from .benchmarks.utils import formatTable, writeResults
+
+_IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)\s*$")
+
+
+def parseImportTime(text):
+    """Parse the output of ``python -X importtime``.
+
+    Parameters
+    ----------
+    text : `str`
+        Standard error of the interpreter.
+
+    Returns
+    -------
+    imports : `list` [`tuple`]
+        ``(module, selfSeconds, cumulativeSeconds, depth)`` for each
+        import, in the order reported.
+    """
+    imports = []
+    for line in text.splitlines():
+        match = _IMPORT_TIME.match(line)
+        if match:
+            selfUs, cumulativeUs, indent, module = match.groups()
+            imports.append((module, int(selfUs)*1e-6, int(cumulativeUs)*1e-6, len(indent)//2))
+    return imports
+
+
+def _packageOf(module):
+    parts = module.split(".")
+    return ".".join(parts[:2]) if parts[0] == "lsst" else parts[0]
+
+
+def measureImportTime(filename):
+    """Measure the cost of importing a test module.
+
+    Parameters
+    ----------
+    filename : `str`
+        Path of the test module.
+
+    Returns
+    -------
+    report : `dict`
+        ``seconds``: cumulative import time of the module;
+        ``packages``: self time of the modules imported with it, summed
+        per package; ``modules``: names of every module imported with
+        it.
+
+    Raises
+    ------
+    RuntimeError
+        Raised if the module cannot be imported.
+    """
+    directory, name = os.path.split(os.path.abspath(filename))
+    name = os.path.splitext(name)[0]
+    code = f"import sys; sys.path.insert(0, {directory!r}); import {name}"
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {filename} failed:\n{result.stderr[-2000:]}")
+
+    imports = parseImportTime(result.stderr)
+    # Everything reported up to and including the test module itself.
+    end = max(i for i, (module, *_) in enumerate(imports) if module == name)
+    start = end
+    while start > 0 and imports[start - 1][3] > imports[end][3]:
+        start -= 1
+    packages = {}
+    for module, selfSeconds, _, _ in imports[start:end]:
+        package = _packageOf(module)
+        packages[package] = packages.get(package, 0.0) + selfSeconds
+    return {"seconds": imports[end][2], "packages": packages,
+            "modules": sorted(module for module, *_ in imports[start:end])}
+
+
+def checkBudget(name, report, budget, checkSeconds=True):
+    """Compare an import-time report with the budget.
+
+    Parameters
+    ----------
+    name : `str`
+        Test module name, e.g. ``test_bias``.
+    report : `dict`
+        Report from `measureImportTime`.
+    budget : `dict`
+        ``deferred``: packages that must not be imported with a test
+        module; ``seconds``: largest cumulative import time of each
+        test module, with a ``default``.
+    checkSeconds : `bool`, optional
+        Whether to check the time as well as the deferred packages.
+        Import times depend on the machine and its load, so the tests
+        only check the deferred packages.
+
+    Returns
+    -------
+    violations : `list` [`str`]
+        Descriptions of what is over budget.
+    """
+    violations = []
+    for package in budget.get("deferred", []):
+        imported = [module for module in report["modules"]
+                    if module == package or module.startswith(package + ".")]
+        if imported:
+            violations.append(f"{name} imports {package} ({imported[0]}) at collection time.")
+    seconds = budget.get("seconds", {})
+    limit = seconds.get(name, seconds.get("default"))
+    if checkSeconds and limit is not None and report["seconds"] > limit:
+        violations.append(f"{name} takes {report['seconds']:.2f} s to import; the budget is {limit} s.")
+    return violations
+
+
+def main(argv=None):
+    """Command line entry point for the test import-time report."""
+    parser = argparse.ArgumentParser(
+        description="Report the import time of each test module and check it against the budget.",
+    )
+    parser.add_argument("--tests-dir", default="tests", help="Directory holding the test_*.py modules.")
+    parser.add_argument("--budget", default=None,
+                        help="Budget YAML (default: data/importBudget.yaml in the tests directory).")
+    parser.add_argument("--top", type=int, default=3, help="Number of costliest packages to list per module.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the report to.")
+    args = parser.parse_args(argv)
+
+    with open(args.budget or os.path.join(args.tests_dir, "data", "importBudget.yaml")) as f:
+        budget = yaml.safe_load(f)
+
+    rows = []
+    reports = {}
+    violations = []
+    for filename in sorted(glob.glob(os.path.join(args.tests_dir, "test_*.py"))):
+        name = os.path.splitext(os.path.basename(filename))[0]
+        report = measureImportTime(filename)
+        top = sorted(report["packages"].items(), key=lambda item: item[1], reverse=True)[:args.top]
+        rows.append({"module": name, "seconds": report["seconds"],
+                     "costliest": ", ".join(f"{package} {seconds:.2f}" for package, seconds in top)})
+        reports[name] = {"seconds": report["seconds"], "packages": report["packages"]}
+        violations.extend(checkBudget(name, report, budget))
+
+    print(formatTable(rows, ["module", "seconds", "costliest"]))
+    for violation in violations:
+        print(violation)
+    if args.output:
+        writeResults({"reports": reports, "violations": violations}, args.output)
+    sys.exit(1 if violations else 0)
@@ -0,0 +1,375 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""IsrTaskLSST that reuses post-ISR outputs from an on-disk cache."""
+
+__all__ = ["IsrCache", "getStackVersions", "CachedIsrTaskLSSTConfig", "CachedIsrTaskLSST",
+           "makeIsrPipeline", "main"]
+
+import argparse
+import functools
+import hashlib
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import yaml
+
+import lsst.afw.image as afwImage
+import lsst.pex.config as pexConfig
+from lsst.pipe.base import Struct
+from lsst.pipe.base.pipelineIR import ConfigIR, PipelineIR
+from lsst.utils.packages import getVersionFromPythonModule
+
+from .isrProfiling import ProfiledIsrTaskLSST, ProfiledIsrTaskLSSTConfig
+
+# Fields that do not change the ISR outputs, and so are left out of
+# the cache key.
+_KEY_IGNORED_FIELDS = frozenset({"connections", "cacheDirectory", "doProfile", "doTraceMalloc",
+                                 "profiledSubsteps"})
+
+# Packages whose code computes the ISR outputs; their versions are part
+# of the cache key.
+_KEY_PACKAGES = ("lsst.ip.isr", "lsst.afw", "lsst.meas.algorithms", "lsst.obs.lsst")
+
+# Outputs describing a run rather than its result; they are neither
+# cached nor needed for a cache hit.
+_PROFILE_OUTPUTS = frozenset({"outputProfile"})
+
+# Image types cached as FITS.  Only these are read back, so an entry
+# cannot make the task construct anything else.
+_FITS_TYPES = ("ExposureF", "ExposureD", "ExposureI", "ExposureU", "MaskedImageF", "ImageF")
+
+# Task classes replaced by makeIsrPipeline, by unqualified name.
+_ISR_CLASSES = frozenset({"IsrTaskLSST", "ProfiledIsrTaskLSST", "CachedIsrTaskLSST"})
+
+
+@functools.lru_cache(maxsize=None)
+def getStackVersions():
+    """Return the versions of the packages that compute ISR outputs.
+
+    Returns
+    -------
+    versions : `dict` [`str`, `str`]
+        Version of each package in ``_KEY_PACKAGES``.
+    """
+    versions = {}
+    for name in _KEY_PACKAGES:
+        try:
+            versions[name] = getVersionFromPythonModule(importlib.import_module(name))
+        except (ImportError, AttributeError):
+            versions[name] = "unknown"
+    return versions
+
+
+class IsrCache:
+    """A directory of post-ISR outputs.
+
+    Each entry is a directory holding the exposures as FITS files, other
+    outputs as YAML, and a ``manifest.json`` naming them.  Entries are
+    assembled in a temporary directory and renamed into place, so
+    concurrent quanta (or concurrent stages) sharing a cache never see
+    a partial entry.
+
+    Parameters
+    ----------
+    root : `str`
+        Cache directory; created if needed.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    @staticmethod
+    def makeKey(exposure, detector, config, inputIds, versions):
+        """Compute the key identifying one ISR result.
+
+        Parameters
+        ----------
+        exposure : `int`
+            Exposure id.
+        detector : `int`
+            Detector id.
+        config : `dict`
+            ISR configuration, as from `lsst.pex.config.Config.toDict`.
+        inputIds : iterable [`str`]
+            Dataset ids of the raw and every calibration used.
+        versions : `dict` [`str`, `str`]
+            Versions of the packages computing the outputs, as from
+            `getStackVersions`.
+
+        Returns
+        -------
+        key : `str`
+            Hex digest identifying the result.
+        """
+        configDict = {name: value for name, value in config.items() if name not in _KEY_IGNORED_FIELDS}
+        digest = hashlib.sha256()
+        digest.update(f"{exposure}:{detector}\n".encode())
+        digest.update(json.dumps(configDict, sort_keys=True, default=str).encode())
+        digest.update(json.dumps(versions, sort_keys=True).encode())
+        for inputId in sorted(str(inputId) for inputId in inputIds):
+            digest.update(f"\n{inputId}".encode())
+        return digest.hexdigest()
+
+    def path(self, key):
+        """Return the directory holding the entry for a key."""
+        return os.path.join(self.root, key[:2], key)
+
+    def keys(self):
+        """Return the keys of the complete entries.
+
+        Returns
+        -------
+        keys : `list` [`str`]
+            Keys with an entry in the cache.
+        """
+        return [key for prefix in sorted(os.listdir(self.root))
+                if os.path.isdir(os.path.join(self.root, prefix))
+                for key in sorted(os.listdir(os.path.join(self.root, prefix)))
+                if os.path.exists(os.path.join(self.root, prefix, key, "manifest.json"))]
+
+    def get(self, key):
+        """Read an entry.
+
+        Parameters
+        ----------
+        key : `str`
+            Key from `makeKey`.
+
+        Returns
+        -------
+        outputs : `dict` [`str`, `object`] or `None`
+            The cached outputs, or `None` if there is no entry.
+        """
+        directory = self.path(key)
+        try:
+            with open(os.path.join(directory, "manifest.json")) as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return None
+
+        outputs = {}
+        for name, entry in manifest.items():
+            filename = os.path.join(directory, os.path.basename(entry["file"]))
+            if entry["type"] in _FITS_TYPES:
+                outputs[name] = getattr(afwImage, entry["type"]).readFits(filename)
+            elif entry["type"] == "yaml":
+                with open(filename) as f:
+                    outputs[name] = yaml.safe_load(f)
+            else:
+                raise ValueError(f"Unknown output type {entry['type']} in ISR cache entry {key}.")
+        return outputs
+
+    @staticmethod
+    def _write(name, value, directory):
+        typeName = type(value).__name__
+        if typeName in _FITS_TYPES and isinstance(value, getattr(afwImage, typeName)):
+            filename = f"{name}.fits"
+            value.writeFits(os.path.join(directory, filename))
+            return {"file": filename, "type": typeName}
+        if isinstance(value, (dict, list)):
+            filename = f"{name}.yaml"
+            with open(os.path.join(directory, filename), "w") as f:
+                yaml.safe_dump(value, f)
+            return {"file": filename, "type": "yaml"}
+        raise TypeError(f"Cannot cache {name} of type {typeName}.")
+
+    def put(self, key, outputs):
+        """Write an entry.
+
+        Parameters
+        ----------
+        key : `str`
+            Key from `makeKey`.
+        outputs : `dict` [`str`, `object`]
+            Outputs to store: images of the types in ``_FITS_TYPES``,
+            and dictionaries or lists that can be written as YAML.
+
+        Raises
+        ------
+        TypeError
+            Raised if an output cannot be stored; nothing is written.
+        """
+        finalDir = self.path(key)
+        parent = os.path.dirname(finalDir)
+        os.makedirs(parent, exist_ok=True)
+        tmpDir = tempfile.mkdtemp(dir=parent, suffix=".tmp")
+        try:
+            manifest = {name: self._write(name, value, tmpDir) for name, value in outputs.items()}
+            # The manifest marks the entry as complete.
+            with open(os.path.join(tmpDir, "manifest.json"), "w") as f:
+                json.dump(manifest, f)
+            try:
+                os.rename(tmpDir, finalDir)
+            except OSError:
+                # Another quantum stored the same entry first.
+                if not os.path.exists(os.path.join(finalDir, "manifest.json")):
+                    raise
+        finally:
+            shutil.rmtree(tmpDir, ignore_errors=True)
+
+
+class _RecordingButlerQC:
+    """Pass-through `lsst.pipe.base.QuantumContext` that keeps the
+    outputs put by the task.
+    """
+
+    def __init__(self, butlerQC):
+        self._butlerQC = butlerQC
+        self.outputs = {}
+
+    def __getattr__(self, name):
+        return getattr(self._butlerQC, name)
+
+    def put(self, values, dataset):
+        self._butlerQC.put(values, dataset)
+        for name, _ in dataset:
+            if hasattr(values, name):
+                self.outputs[name] = getattr(values, name)
+
+
+class CachedIsrTaskLSSTConfig(ProfiledIsrTaskLSSTConfig):
+    cacheDirectory = pexConfig.Field(
+        dtype=str,
+        doc="Directory of cached post-ISR outputs to reuse and add to.  No caching if None.",
+        default=None,
+        optional=True,
+    )
+
+
+class CachedIsrTaskLSST(ProfiledIsrTaskLSST):
+    """IsrTaskLSST that reuses outputs of identical earlier quanta.
+
+    Quanta with the same exposure, detector, ISR configuration, stack
+    version and input datasets (the raw and every calibration, by
+    dataset id) give the same outputs, so with ``cacheDirectory`` set
+    those outputs are read from the cache instead of being recomputed.
+    With ``cacheDirectory`` unset this behaves exactly like
+    `ProfiledIsrTaskLSST`.
+    """
+
+    ConfigClass = CachedIsrTaskLSSTConfig
+    _DefaultName = "isr"
+
+    def runQuantum(self, butlerQC, inputRefs, outputRefs):
+        if self.config.cacheDirectory is None:
+            return super().runQuantum(butlerQC, inputRefs, outputRefs)
+
+        start = time.perf_counter()
+        cache = IsrCache(self.config.cacheDirectory)
+        dataId = butlerQC.quantum.dataId
+        inputIds = []
+        for _, refs in inputRefs:
+            refs = refs if isinstance(refs, (list, tuple)) else [refs]
+            inputIds.extend(ref.id for ref in refs if ref is not None)
+        key = cache.makeKey(dataId["exposure"], dataId["detector"], self.config.toDict(), inputIds,
+                            getStackVersions())
+
+        outputNames = [name for name, _ in outputRefs]
+        cached = cache.get(key)
+        if cached is not None and all(name in cached for name in outputNames
+                                      if name not in _PROFILE_OUTPUTS):
+            self.log.info("Using cached ISR outputs for %s.", dataId)
+            outputs = {name: cached[name] for name in outputNames if name not in _PROFILE_OUTPUTS}
+            if "outputProfile" in outputNames:
+                # The profile describes this run, which only read the
+                # cache.
+                outputs["outputProfile"] = {
+                    "cached": True,
+                    "substeps": {},
+                    "total": {"wallTime": time.perf_counter() - start},
+                }
+            butlerQC.put(Struct(**outputs), outputRefs)
+            return
+
+        recorder = _RecordingButlerQC(butlerQC)
+        super().runQuantum(recorder, inputRefs, outputRefs)
+        outputs = {name: value for name, value in recorder.outputs.items() if name not in _PROFILE_OUTPUTS}
+        try:
+            cache.put(key, outputs)
+        except TypeError as e:
+            self.log.warning("Not caching the ISR outputs for %s: %s", dataId, e)
+
+
+def makeIsrPipeline(pipeline, output, cacheDirectory=None, profile=False):
+    """Write a copy of a pipeline whose ISR tasks are cached or profiled.
+
+    Imports are expanded first, so the ISR labels keep the configs of
+    the pipelines they come from; only their class changes, to
+    `CachedIsrTaskLSST`, which accepts every `IsrTaskLSSTConfig` field.
+
+    Parameters
+    ----------
+    pipeline : `str`
+        Pipeline file, without any ``#`` subset.
+    output : `str`
+        File to write the copy to.
+    cacheDirectory : `str`, optional
+        Cache directory of the ISR tasks; no caching if `None`.
+    profile : `bool`, optional
+        Profile the ISR substeps, writing the profile of each ISR label
+        as ``<label>Profile``?
+
+    Returns
+    -------
+    labels : `list` [`str`]
+        Labels of the ISR tasks that were changed.
+    """
+    pipelineIR = PipelineIR.from_uri(pipeline)
+    labels = []
+    for label, task in pipelineIR.tasks.items():
+        if task.klass.rsplit(".", 1)[-1] not in _ISR_CLASSES:
+            continue
+        task.klass = f"{__name__}.CachedIsrTaskLSST"
+        overrides = {}
+        if cacheDirectory is not None:
+            overrides["cacheDirectory"] = cacheDirectory
+        if profile:
+            overrides["doProfile"] = True
+            overrides["connections.outputProfile"] = f"{label}Profile"
+        if overrides:
+            task.add_or_update_config(ConfigIR(rest=overrides))
+        labels.append(label)
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    pipelineIR.write_to_uri(output)
+    return labels
+
+
+def main(argv=None):
+    """Command line entry point for making a cached or profiled
+    pipeline.
+    """
+    parser = argparse.ArgumentParser(
+        description="Write a copy of a pipeline whose IsrTaskLSST tasks reuse post-ISR outputs from a cache, "
+                    "or profile their substeps, keeping the configs of the ISR tasks.",
+    )
+    parser.add_argument("-p", "--pipeline", required=True, help="Pipeline to copy, without a subset.")
+    parser.add_argument("-o", "--output", required=True, help="File to write the copy to.")
+    parser.add_argument("--cache-dir", default=None, help="Directory of the ISR cache.")
+    parser.add_argument("--profile", action="store_true", help="Profile the ISR substeps.")
+    args = parser.parse_args(argv)
+
+    labels = makeIsrPipeline(args.pipeline, args.output, cacheDirectory=args.cache_dir, profile=args.profile)
+    print(f"Changed ISR tasks {', '.join(labels) if labels else '(none)'} in {args.output}.")
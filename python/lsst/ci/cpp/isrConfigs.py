@@ -0,0 +1,67 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""IsrTaskLSST configurations shared by the tests, service and
+benchmarks.
+"""
+
+__all__ = ["CORRECTIONS", "makeIsrConfig"]
+
+import lsst.ip.isr as ipIsr
+
+# Corrections that apply the certified defects, crosstalk and
+# linearizer.
+CORRECTIONS = ("doDefect", "doCrosstalk", "doInterpolate", "doLinearize")
+
+
+def makeIsrConfig(corrections=CORRECTIONS, doDark=False, doFlat=False):
+    """Make the ISR configuration of ``tests/test_bias.py``.
+
+    Parameters
+    ----------
+    corrections : iterable [`str`], optional
+        Members of `CORRECTIONS` to enable; the others are disabled.
+    doDark, doFlat : `bool`, optional
+        Also apply the dark and flat, as in ``tests/test_flat.py``.
+
+    Returns
+    -------
+    config : `lsst.ip.isr.IsrTaskLSSTConfig`
+        The configuration.
+    """
+    config = ipIsr.IsrTaskLSSTConfig()
+    config.doBias = True
+    config.expectWcs = False
+    config.doDark = doDark
+    config.doFlat = doFlat
+    config.doDiffNonLinearCorrection = False
+    config.doBootstrap = False
+    config.doDeferredCharge = False
+    config.doCorrectGains = False
+    config.doApplyGains = True
+    config.doVariance = True
+    config.doSaturation = True
+    config.doSuspect = True
+    config.doWidenSaturationTrails = False
+    config.doSetBadRegions = True
+    config.doBrighterFatter = False
+    for correction in CORRECTIONS:
+        setattr(config, correction, correction in corrections)
+    return config
@@ -0,0 +1,353 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""IsrTaskLSST with optional per-substep resource profiling."""
+
+__all__ = ["IsrSubstepProfiler", "ProfiledIsrTaskLSSTConfig", "ProfiledIsrTaskLSST"]
+
+import contextlib
+import functools
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+
+import lsst.pex.config as pexConfig
+import lsst.pipe.base.connectionTypes as cT
+from lsst.ip.isr import isrFunctions
+from lsst.ip.isr.isrTaskLSST import IsrTaskLSST, IsrTaskLSSTConfig, IsrTaskLSSTConnections
+
+# Callables currently instrumented, keyed by (id(owner), attribute).
+# Each is replaced once, however many profilers use it, and restored
+# when the last of them finishes.
+_patches = {}
+_patchLock = threading.Lock()
+
+# Profilers attached in each thread, innermost last.
+_active = threading.local()
+
+
+def _maxResidentSetSize():
+    """Return the peak resident set size of this process in bytes."""
+    maxRss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes.
+    return maxRss if sys.platform == "darwin" else maxRss*1024
+
+
+def _activeProfilers():
+    if not hasattr(_active, "profilers"):
+        _active.profilers = []
+    return _active.profilers
+
+
+class _Patch:
+    """A callable replaced by a dispatcher to the profilers of the
+    calling thread.
+
+    Calls from threads without an attached profiler go straight to the
+    original callable, so a shared object such as
+    `lsst.ip.isr.isrFunctions` can be instrumented while other threads
+    use it.
+    """
+
+    def __init__(self, owner, attribute):
+        self.owner = owner
+        self.attribute = attribute
+        ownDict = getattr(owner, "__dict__", {})
+        self.hadOwn = attribute in ownDict
+        self.ownValue = ownDict.get(attribute)
+        self.users = 0
+        key = (id(owner), attribute)
+        original = getattr(owner, attribute)
+
+        @functools.wraps(original)
+        def dispatch(*args, **kwargs):
+            for profiler in reversed(_activeProfilers()):
+                label = profiler._labels.get(key)
+                if label is not None:
+                    return profiler._call(label, original, args, kwargs)
+            return original(*args, **kwargs)
+
+        setattr(owner, attribute, dispatch)
+
+    def restore(self):
+        if self.hadOwn:
+            setattr(self.owner, self.attribute, self.ownValue)
+        else:
+            delattr(self.owner, self.attribute)
+
+
+class IsrSubstepProfiler:
+    """Record timings and allocation peaks of individual ISR steps.
+
+    Each substep is identified by a dotted path that is resolved
+    against a namespace of objects (the task, the calibrations passed
+    to ``run``, and `lsst.ip.isr.isrFunctions`).  The callable found
+    at that path is replaced by a dispatcher while any profiler uses
+    it; only calls made in the thread of an attached profiler are
+    recorded, and nested profilers record to the innermost one.
+    Allocation peaks are those of the whole process, so they include
+    any allocations by other threads.
+
+    Parameters
+    ----------
+    substeps : `dict` [`str`, `str`]
+        Mapping of substep label to dotted callable path.
+    traceMalloc : `bool`, optional
+        Record the peak of traced Python allocations in each substep?
+    log : `logging.Logger`, optional
+        Logger for unresolved substeps.
+    """
+
+    def __init__(self, substeps, traceMalloc=True, log=None):
+        self.substeps = dict(substeps)
+        self.traceMalloc = traceMalloc
+        self.log = log
+        self.records = {}
+        self._labels = {}
+        self._depth = {}
+        self._wallStart = None
+        self._cpuStart = None
+        self._wallTime = None
+        self._cpuTime = None
+        self._peakAllocated = None
+        self._runPeak = 0
+
+    @staticmethod
+    def resolve(namespace, path):
+        """Find the object owning the callable at a dotted path.
+
+        Parameters
+        ----------
+        namespace : `dict` [`str`, `object`]
+            Objects the first path component may refer to.
+        path : `str`
+            Dotted path, e.g. ``task.crosstalk.run``.
+
+        Returns
+        -------
+        owner : `object` or `None`
+            Object holding the callable, or `None` if the path cannot
+            be resolved.
+        attribute : `str` or `None`
+            Name of the callable on ``owner``.
+        """
+        head, *rest = path.split(".")
+        owner = namespace.get(head)
+        if owner is None or not rest:
+            return None, None
+        for name in rest[:-1]:
+            owner = getattr(owner, name, None)
+            if owner is None:
+                return None, None
+        if not callable(getattr(owner, rest[-1], None)):
+            return None, None
+        return owner, rest[-1]
+
+    def _call(self, label, function, args, kwargs):
+        depth = self._depth.get(label, 0)
+        if depth > 0:
+            # Recursive calls are part of the outermost one.
+            return function(*args, **kwargs)
+        record = self.records.setdefault(
+            label, {"calls": 0, "wallTime": 0.0, "cpuTime": 0.0, "peakAllocated": 0}
+        )
+        if self.traceMalloc:
+            # Resetting the peak hides it from the run total, so carry
+            # it over first.
+            startAllocated, peak = tracemalloc.get_traced_memory()
+            self._runPeak = max(self._runPeak, peak)
+            tracemalloc.reset_peak()
+        self._depth[label] = depth + 1
+        wallStart = time.perf_counter()
+        cpuStart = time.process_time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            self._depth[label] = depth
+            record["calls"] += 1
+            record["wallTime"] += time.perf_counter() - wallStart
+            record["cpuTime"] += time.process_time() - cpuStart
+            if self.traceMalloc:
+                _, peak = tracemalloc.get_traced_memory()
+                self._runPeak = max(self._runPeak, peak)
+                record["peakAllocated"] = max(record["peakAllocated"], peak - startAllocated)
+            record["maxResidentSetSize"] = _maxResidentSetSize()
+
+    def _patch(self, namespace):
+        keys = []
+        with _patchLock:
+            for label, path in self.substeps.items():
+                owner, attribute = self.resolve(namespace, path)
+                if owner is None:
+                    if self.log is not None:
+                        self.log.debug("Not profiling %s: %s could not be resolved.", label, path)
+                    continue
+                key = (id(owner), attribute)
+                if key not in _patches:
+                    try:
+                        _patches[key] = _Patch(owner, attribute)
+                    except (AttributeError, TypeError):
+                        if self.log is not None:
+                            self.log.debug("Not profiling %s: %s cannot be replaced.", label, path)
+                        continue
+                _patches[key].users += 1
+                self._labels[key] = label
+                keys.append(key)
+        return keys
+
+    def _unpatch(self, keys):
+        with _patchLock:
+            for key in keys:
+                patch = _patches[key]
+                patch.users -= 1
+                if patch.users == 0:
+                    patch.restore()
+                    del _patches[key]
+        self._labels.clear()
+
+    @contextlib.contextmanager
+    def attach(self, namespace):
+        """Instrument the configured substeps for the duration of a block.
+
+        Parameters
+        ----------
+        namespace : `dict` [`str`, `object`]
+            Objects the substep paths are resolved against.
+        """
+        keys = self._patch(namespace)
+        profilers = _activeProfilers()
+        profilers.append(self)
+
+        startedTracing = False
+        if self.traceMalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            startedTracing = True
+        if self.traceMalloc:
+            tracemalloc.reset_peak()
+        self._wallStart = time.perf_counter()
+        self._cpuStart = time.process_time()
+        try:
+            yield self
+        finally:
+            self._wallTime = time.perf_counter() - self._wallStart
+            self._cpuTime = time.process_time() - self._cpuStart
+            if self.traceMalloc:
+                _, peak = tracemalloc.get_traced_memory()
+                self._peakAllocated = max(self._runPeak, peak)
+            if startedTracing:
+                tracemalloc.stop()
+            profilers.remove(self)
+            self._unpatch(keys)
+
+    def getProfile(self):
+        """Return the recorded profile.
+
+        Returns
+        -------
+        profile : `dict`
+            Timings (seconds) and memory measurements (bytes) of the
+            substeps that were called, and of the whole block.
+        """
+        return {
+            "substeps": {label: dict(record) for label, record in self.records.items()},
+            "total": {
+                "wallTime": self._wallTime,
+                "cpuTime": self._cpuTime,
+                "peakAllocated": self._peakAllocated,
+                "maxResidentSetSize": _maxResidentSetSize(),
+            },
+        }
+
+
+class ProfiledIsrTaskLSSTConnections(IsrTaskLSSTConnections,
+                                     dimensions=("instrument", "exposure", "detector")):
+    outputProfile = cT.Output(
+        name="isrProfile",
+        doc="Per-substep timing and allocation profile of the ISR processing.",
+        storageClass="StructuredDataDict",
+        dimensions=("instrument", "exposure", "detector"),
+    )
+
+    def __init__(self, *, config=None):
+        super().__init__(config=config)
+
+        if config.doProfile is not True:
+            del self.outputProfile
+
+
+class ProfiledIsrTaskLSSTConfig(IsrTaskLSSTConfig, pipelineConnections=ProfiledIsrTaskLSSTConnections):
+    doProfile = pexConfig.Field(
+        dtype=bool,
+        doc="Record per-substep timings and allocation peaks, and write them as ``isrProfile``?",
+        default=False,
+    )
+    doTraceMalloc = pexConfig.Field(
+        dtype=bool,
+        doc="Trace Python allocations to measure per-substep peaks?  This slows processing.",
+        default=True,
+    )
+    profiledSubsteps = pexConfig.DictField(
+        keytype=str,
+        itemtype=str,
+        doc="Mapping of substep label to the dotted path of the callable to time.  The first "
+            "component is ``task``, ``isrFunctions``, or the name of a calibration passed to run.",
+        default={
+            "overscan": "task.overscanCorrection",
+            "crosstalk": "task.crosstalk.run",
+            "linearize": "linearizer.applyLinearity",
+            "brighterFatter": "task.applyBrighterFatterCorrection",
+            "deferredCharge": "task.deferredChargeCorrection.run",
+            "interpolate": "isrFunctions.interpolateFromMask",
+        },
+    )
+
+
+class ProfiledIsrTaskLSST(IsrTaskLSST):
+    """IsrTaskLSST that can profile its individual corrections.
+
+    With ``doProfile`` unset this behaves exactly like
+    `lsst.ip.isr.IsrTaskLSST`.
+    """
+
+    ConfigClass = ProfiledIsrTaskLSSTConfig
+    _DefaultName = "isr"
+
+    def run(self, ccdExposure, **kwargs):
+        if not self.config.doProfile:
+            return super().run(ccdExposure, **kwargs)
+
+        profiler = IsrSubstepProfiler(
+            self.config.profiledSubsteps,
+            traceMalloc=self.config.doTraceMalloc,
+            log=self.log,
+        )
+        namespace = {"task": self, "isrFunctions": isrFunctions}
+        namespace.update(kwargs)
+        with profiler.attach(namespace):
+            result = super().run(ccdExposure, **kwargs)
+
+        result.outputProfile = profiler.getProfile()
+        for label, record in result.outputProfile["substeps"].items():
+            self.log.info("ISR substep %s: %d call(s), %.3f s wall, %.3f s cpu, %d bytes peak.",
+                          label, record["calls"], record["wallTime"], record["cpuTime"],
+                          record["peakAllocated"])
+        return result
@@ -0,0 +1,324 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""A long-running local service that runs ISR on one exposure at a time.
+
+The service keeps the camera and the calibrations in memory, so a
+request only pays for reading the raw and running ``IsrTaskLSST``.
+Requests and responses are pickled dictionaries framed by their length,
+sent over a Unix socket that only the owner can connect to.
+"""
+
+__all__ = ["IsrService", "IsrClient", "serve", "main"]
+
+import argparse
+import os
+import pickle
+import socket
+import socketserver
+import struct
+import time
+
+import lsst.daf.butler as dafButler
+import lsst.ip.isr as ipIsr
+
+from .isrConfigs import makeIsrConfig
+
+# Calibrations used by the service, with the config field enabling each.
+CALIBRATIONS = {
+    "bias": "doBias",
+    "dark": "doDark",
+    "flat": "doFlat",
+    "ptc": None,
+    "linearizer": "doLinearize",
+    "crosstalk": "doCrosstalk",
+    "defects": "doDefect",
+}
+
+_HEADER = struct.Struct("!Q")
+
+
+def _send(sock, message):
+    payload = pickle.dumps(message, protocol=pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(payload)) + payload)
+
+
+def _recvExactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def _recv(sock):
+    header = _recvExactly(sock, _HEADER.size)
+    if header is None:
+        return None
+    payload = _recvExactly(sock, _HEADER.unpack(header)[0])
+    if payload is None:
+        raise ConnectionError("Connection closed in the middle of a message.")
+    return pickle.loads(payload)
+
+
+class IsrService:
+    """Run ISR on single exposures with cached calibrations.
+
+    Calibrations are looked up for each exposure, so validity ranges
+    are respected, but each calibration dataset is only read once.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler whose default collections hold the raws and the
+        certified calibrations.
+    config : `lsst.ip.isr.IsrTaskLSSTConfig`, optional
+        ISR configuration.  Defaults to that of ``tests/test_flat.py``.
+    """
+
+    def __init__(self, butler, config=None):
+        self.butler = butler
+        self.config = config if config is not None else makeIsrConfig(doDark=True, doFlat=True)
+        self.task = ipIsr.IsrTaskLSST(config=self.config)
+        self.calibrations = [name for name, field in CALIBRATIONS.items()
+                             if field is None or getattr(self.config, field)]
+        self._cache = {}
+
+    def _getCached(self, name, dataId):
+        datasetType = self.butler.get_dataset_type(name)
+        ref = self.butler.find_dataset(datasetType, dataId.subset(datasetType.dimensions),
+                                       timespan=dataId.timespan)
+        if ref is None:
+            raise LookupError(f"No {name} found for {dataId}.")
+        if ref.id not in self._cache:
+            self._cache[ref.id] = self.butler.get(ref)
+        return self._cache[ref.id]
+
+    def getCalibrations(self, dataId):
+        """Return the camera and calibrations for an exposure.
+
+        Parameters
+        ----------
+        dataId : `lsst.daf.butler.DataCoordinate`
+            Expanded data ID of the raw.
+
+        Returns
+        -------
+        calibrations : `dict` [`str`, `object`]
+            Keyword arguments for `lsst.ip.isr.IsrTaskLSST.run`.
+        """
+        calibrations = {"camera": self._getCached("camera", dataId)}
+        calibrations.update((name, self._getCached(name, dataId)) for name in self.calibrations)
+        return calibrations
+
+    def preload(self, dataIds):
+        """Read the calibrations for some exposures ahead of requests.
+
+        Parameters
+        ----------
+        dataIds : iterable [`dict`]
+            Data IDs of raws.
+        """
+        for dataId in dataIds:
+            self.getCalibrations(self.butler.registry.expandDataId(dataId))
+
+    def process(self, dataId):
+        """Run ISR on one raw.
+
+        Parameters
+        ----------
+        dataId : `dict`
+            Data ID of the raw.
+
+        Returns
+        -------
+        exposure : `lsst.afw.image.Exposure`
+            The post-ISR exposure.
+        timing : `dict` [`str`, `float`]
+            Seconds spent reading the raw, finding and reading the
+            calibrations, and in ISR.
+        """
+        start = time.perf_counter()
+        dataId = self.butler.registry.expandDataId(dataId)
+        raw = self.butler.get("raw", dataId)
+        rawTime = time.perf_counter()
+        calibrations = self.getCalibrations(dataId)
+        calibTime = time.perf_counter()
+        exposure = self.task.run(raw, **calibrations).outputExposure
+        end = time.perf_counter()
+        return exposure, {"raw": rawTime - start, "calibrations": calibTime - rawTime, "isr": end - calibTime}
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        # A client may send any number of requests on one connection.
+        while (request := _recv(self.request)) is not None:
+            if request.get("command") == "shutdown":
+                _send(self.request, {})
+                self.server.shutdownRequested = True
+                return
+            try:
+                dataId = {"instrument": request.get("instrument", "LATISS"),
+                          "exposure": request["exposure"],
+                          "detector": request.get("detector", 0)}
+                exposure, timing = self.server.service.process(dataId)
+                response = {"timing": timing}
+                if request.get("output"):
+                    exposure.writeFits(request["output"])
+                else:
+                    response["exposure"] = exposure
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            _send(self.request, response)
+
+
+class _IsrServer(socketserver.UnixStreamServer):
+    # Requests are processed one at a time; ISR on one exposure already
+    # saturates the memory bandwidth of a process.
+    shutdownRequested = False
+
+    def __init__(self, path, service):
+        self.service = service
+        super().__init__(path, _RequestHandler)
+        os.chmod(path, 0o600)
+
+
+def serve(service, path):
+    """Serve ISR requests on a Unix socket until asked to shut down.
+
+    Parameters
+    ----------
+    service : `IsrService`
+        The service to run requests through.
+    path : `str`
+        Path of the Unix socket; removed when the server stops.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    with _IsrServer(path, service) as server:
+        try:
+            while not server.shutdownRequested:
+                server.handle_request()
+        finally:
+            os.remove(path)
+
+
+class IsrClient:
+    """Client of an ISR service.
+
+    Parameters
+    ----------
+    path : `str`
+        Path of the service's Unix socket.
+    timeout : `float`, optional
+        Seconds to wait for the socket to appear.
+    """
+
+    def __init__(self, path, timeout=60.0):
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                self._socket.connect(path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if time.monotonic() > deadline:
+                    raise
+                time.sleep(0.1)
+
+    def process(self, exposure, detector=0, instrument="LATISS", output=None):
+        """Run ISR on one raw.
+
+        Parameters
+        ----------
+        exposure : `int`
+            Exposure id of the raw.
+        detector : `int`, optional
+            Detector id of the raw.
+        instrument : `str`, optional
+            Instrument name.
+        output : `str`, optional
+            If given, the service writes the post-ISR exposure to this
+            FITS file instead of returning it.
+
+        Returns
+        -------
+        exposure : `lsst.afw.image.Exposure` or `None`
+            The post-ISR exposure, unless ``output`` was given.
+        timing : `dict` [`str`, `float`]
+            Time spent by the service, as from `IsrService.process`.
+
+        Raises
+        ------
+        RuntimeError
+            Raised if the service failed to process the exposure.
+        """
+        _send(self._socket, {"instrument": instrument, "exposure": exposure, "detector": detector,
+                             "output": output})
+        response = _recv(self._socket)
+        if response is None:
+            raise ConnectionError("The ISR service closed the connection.")
+        if "error" in response:
+            raise RuntimeError(f"ISR failed for exposure {exposure}: {response['error']}")
+        return response.get("exposure"), response["timing"]
+
+    def shutdown(self):
+        """Ask the service to stop once this request is answered."""
+        _send(self._socket, {"command": "shutdown"})
+        _recv(self._socket)
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def main(argv=None):
+    """Command line entry point for the ISR service."""
+    parser = argparse.ArgumentParser(
+        description="Serve single-exposure ISR requests on a Unix socket, keeping the calibrations in "
+                    "memory.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo.")
+    parser.add_argument("--socket", required=True, help="Path of the Unix socket to listen on.")
+    parser.add_argument("--collections", default="LATISS/raw/all,calib/v00,LATISS/calib",
+                        help="Comma separated collections holding the raws and calibrations.")
+    parser.add_argument("--preload", default="",
+                        help="Comma separated exposures whose calibrations are read before serving.")
+    parser.add_argument("--detector", type=int, default=0, help="Detector of the preloaded exposures.")
+    args = parser.parse_args(argv)
+
+    butler = dafButler.Butler(args.repo, collections=args.collections.split(","), writeable=False)
+    service = IsrService(butler)
+    service.preload({"instrument": "LATISS", "exposure": int(exposure), "detector": args.detector}
+                    for exposure in args.preload.split(",") if exposure)
+    print(f"Serving ISR on {args.socket}.", flush=True)
+    serve(service, args.socket)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Spline linearity solve that fits every amplifier at once."""
+
+__all__ = ["evaluateSplines", "fitLinearitySplines", "BatchedLinearitySolveTask"]
+
+import warnings
+
+import numpy as np
+
+from lsst.cp.pipe.linearity import LinearitySolveTask
+from lsst.ip.isr import Linearizer
+from lsst.pipe.base import Struct
+
+# Weight of the constraint that each spline averages to zero over the
+# signal range, and the number of signals it is averaged over.
+MEAN_CONSTRAINT_WEIGHT = 1e3
+N_MEAN_CONSTRAINT = 100
+
+# Gauss-Newton iterations between rejections, and the relative step
+# at which they stop.
+MAX_GAUSS_NEWTON = 10
+GAUSS_NEWTON_TOLERANCE = 1e-10
+
+
+def evaluateSplines(signal, nodes, values):
+    """Evaluate the Akima splines of several amplifiers.
+
+    This is the interpolation that `lsst.ip.isr.Linearizer` applies to
+    ``Spline`` coefficients, for every amplifier at once.
+
+    Parameters
+    ----------
+    signal : `numpy.ndarray`, (nAmp, nPoint)
+        Signals to evaluate each spline at.
+    nodes : `numpy.ndarray`, (nAmp, nNode)
+        Increasing spline nodes; at least three.
+    values : `numpy.ndarray`, (nAmp, nNode)
+        Spline values at the nodes.
+
+    Returns
+    -------
+    spline : `numpy.ndarray`, (nAmp, nPoint)
+        Spline values at ``signal``, extrapolated with the end
+        intervals.
+    """
+    signal = np.asarray(signal, dtype=np.float64)
+    nodes = np.asarray(nodes, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    if nodes.shape[-1] < 3:
+        raise ValueError(f"Akima splines need at least three nodes, not {nodes.shape[-1]}.")
+
+    spacing = np.diff(nodes, axis=-1)
+    slope = np.diff(values, axis=-1)/spacing
+    # Two more slopes at each end, extrapolated as in Akima (1970).
+    before = 2.0*slope[:, :1] - slope[:, 1:2]
+    after = 2.0*slope[:, -1:] - slope[:, -2:-1]
+    slope = np.concatenate([2.0*before - slope[:, :1], before, slope, after, 2.0*after - slope[:, -1:]],
+                           axis=-1)
+    change = np.abs(np.diff(slope, axis=-1))
+    right, left = change[:, 2:], change[:, :-2]
+    total = right + left
+    with np.errstate(divide="ignore", invalid="ignore"):
+        derivative = np.where(total > 1e-9*np.max(total, axis=-1, keepdims=True),
+                              (right*slope[:, 1:-2] + left*slope[:, 2:-1])/total,
+                              0.5*(slope[:, 1:-2] + slope[:, 2:-1]))
+
+    index = np.sum(signal[..., np.newaxis] >= nodes[:, np.newaxis, 1:-1], axis=-1)
+    width = np.take_along_axis(spacing, index, axis=-1)
+    s = (signal - np.take_along_axis(nodes, index, axis=-1))/width
+    y0, y1 = np.take_along_axis(values, index, axis=-1), np.take_along_axis(values, index + 1, axis=-1)
+    d0 = np.take_along_axis(derivative, index, axis=-1)
+    d1 = np.take_along_axis(derivative, index + 1, axis=-1)
+    return (y0*(1.0 + s*s*(2.0*s - 3.0)) + y1*s*s*(3.0 - 2.0*s)
+            + width*s*(s - 1.0)*(d0*(s - 1.0) + d1*s))
+
+
+def fitLinearitySplines(illumination, signal, mask, nKnots, minLinearAdu, maxLinearAdu, groups=None,
+                        fitOffset=True, nSigmaClip=5.0, maxRejectionPerIteration=5, maxIterations=20):
+    """Fit the spline linearity corrections of several amplifiers.
+
+    This is the model of the spline fit of
+    `lsst.cp.pipe.LinearitySolveTask`: the correction ``S`` of each
+    amplifier is an Akima spline through ``nKnots`` uniformly spaced
+    nodes between zero and the largest signal, such that
+    ``signal - S(signal) - offset`` is proportional to the
+    illumination, with one constant of proportionality per group of
+    points.  The residuals are relative to the proportional model, the
+    spline is zero at zero signal and is constrained to average to zero
+    over the signal range, so that it holds only the departure from
+    linearity.
+
+    The fit is solved by Gauss-Newton iterations on every amplifier at
+    once, each a small system of normal equations, starting from the
+    proportionality of the signals between ``minLinearAdu`` and
+    ``maxLinearAdu``.  Points more than ``nSigmaClip`` robust standard
+    deviations from the model are then rejected, at most
+    ``maxRejectionPerIteration`` per amplifier at a time, and the fit
+    repeated until none are, or ``maxIterations`` fits have been done.
+
+    Parameters
+    ----------
+    illumination : `numpy.ndarray`, (nAmp, nPoint)
+        Exposure times (or photodiode charges) of each point.
+    signal : `numpy.ndarray`, (nAmp, nPoint)
+        Mean signal of each point, in ADU.
+    mask : `numpy.ndarray`, (nAmp, nPoint)
+        Points to use.
+    nKnots : `int`
+        Number of spline nodes; at least three.
+    minLinearAdu, maxLinearAdu : `float`
+        Signal range of the starting proportionality.
+    groups : `numpy.ndarray`, (nAmp, nPoint), optional
+        Group of each point, from zero; all in one group if not given.
+    fitOffset : `bool`, optional
+        Fit an offset of the signal?
+    nSigmaClip : `float`, optional
+        Rejection threshold.
+    maxRejectionPerIteration : `int`, optional
+        Largest number of points rejected from an amplifier per fit.
+    maxIterations : `int`, optional
+        Largest number of fits.
+
+    Returns
+    -------
+    fit : `dict` [`str`, `numpy.ndarray`]
+        ``nodes`` and ``values`` of each spline (nAmp, nKnots), the
+        ``slopes`` of each group (nAmp, nGroup), the ``offset`` (nAmp),
+        every parameter in ``params`` and their uncertainties in
+        ``paramsErr`` (nAmp, nKnots + nGroup + 1; the spline values,
+        slopes and offset), the ``residuals`` from the model in ADU
+        (nAmp, nPoint), the ``mask`` of the points kept, and the reduced
+        ``chiSq`` of the relative residuals (nAmp).
+    """
+    illumination = np.asarray(illumination, dtype=np.float64)
+    signal = np.asarray(signal, dtype=np.float64)
+    mask = (np.asarray(mask, dtype=bool) & np.isfinite(signal) & np.isfinite(illumination)
+            & (illumination > 0.0))
+    groups = np.zeros(signal.shape, dtype=int) if groups is None else np.asarray(groups, dtype=int)
+    if nKnots < 3:
+        raise ValueError(f"The spline fit needs at least three knots, not {nKnots}.")
+    nAmp = len(signal)
+    nGroups = int(groups[mask].max()) + 1 if mask.any() else 1
+    nValues = nKnots - 1
+    nParams = nValues + nGroups + 1
+    signal = np.where(mask, signal, 0.0)
+    illumination = np.where(mask, illumination, 1.0)
+    membership = (groups[..., np.newaxis] == np.arange(nGroups)).astype(np.float64)
+
+    top = np.max(signal, axis=1)
+    top = np.where(top > 0.0, top, 1.0)[:, np.newaxis]
+    nodes = np.linspace(0.0, 1.0, nKnots)*top
+    grid = np.linspace(0.0, 1.0, N_MEAN_CONSTRAINT)*top
+
+    def residualsOf(params):
+        values = np.concatenate([np.zeros((nAmp, 1)), params[:, :nValues]], axis=1)
+        expected = np.einsum("apg,ag->ap", membership, params[:, nValues:-1])*illumination
+        corrected = signal - evaluateSplines(signal, nodes, values) - params[:, -1:]
+        constraint = MEAN_CONSTRAINT_WEIGHT*np.mean(evaluateSplines(grid, nodes, values), axis=1)
+        relative = np.concatenate([corrected/expected - 1.0, constraint[:, np.newaxis]], axis=1)
+        return relative, corrected - expected
+
+    # Start without a correction, from the proportionality of the
+    # signals in the linear range of each group, or of all of them if
+    # there are none.
+    linear = mask & (signal >= minLinearAdu) & (signal <= maxLinearAdu)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slopes = (np.einsum("apg,ap->ag", membership, linear*signal)
+                  / np.einsum("apg,ap->ag", membership, linear*illumination))
+        fallback = (np.einsum("apg,ap->ag", membership, mask*signal)
+                    / np.einsum("apg,ap->ag", membership, mask*illumination))
+    slopes = np.where(np.isfinite(slopes) & (slopes > 0.0), slopes, fallback)
+    slopes = np.where(np.isfinite(slopes) & (slopes > 0.0), slopes, 1.0)
+    params = np.concatenate([np.zeros((nAmp, nValues)), slopes, np.zeros((nAmp, 1))], axis=1)
+    # Scale of each parameter, for the derivatives and convergence.
+    scale = np.concatenate([np.repeat(top, nValues, axis=1), slopes, top], axis=1)
+    free = np.ones(nParams)
+    free[-1] = float(fitOffset)
+
+    def jacobianOf(params):
+        step = 1e-6*(np.abs(params) + scale)
+        columns = []
+        for i in range(nParams):
+            shift = np.zeros_like(params)
+            shift[:, i] = step[:, i]
+            columns.append((residualsOf(params + shift)[0] - residualsOf(params - shift)[0])
+                           / (2.0*step[:, i:i + 1]))
+        return np.stack(columns, axis=-1)*free
+
+    def solve(params, keep):
+        weight = np.concatenate([keep, np.ones((nAmp, 1))], axis=1).astype(np.float64)
+        for _ in range(MAX_GAUSS_NEWTON):
+            residuals = residualsOf(params)[0]
+            jacobian = jacobianOf(params)
+            normal = np.einsum("arp,ar,arq->apq", jacobian, weight, jacobian)
+            # Keep nodes without points, and the offset if it is not
+            # fit, from making the systems singular.
+            ridge = 1e-12*np.maximum(np.trace(normal, axis1=1, axis2=2), 1.0)
+            normal += ridge[:, np.newaxis, np.newaxis]*np.eye(nParams)
+            gradient = np.einsum("arp,ar,ar->ap", jacobian, weight, residuals)
+            step = -np.linalg.solve(normal, gradient[..., np.newaxis])[..., 0]
+            params = params + step
+            if np.all(np.abs(step) <= GAUSS_NEWTON_TOLERANCE*(np.abs(params) + scale)):
+                break
+        return params, normal
+
+    keep = mask.copy()
+    for _ in range(maxIterations):
+        params, normal = solve(params, keep)
+        relative = residualsOf(params)[0][:, :-1]
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)
+            kept = np.where(keep, relative, np.nan)
+            sigma = 1.4826*np.nanmedian(np.abs(kept - np.nanmedian(kept, axis=1, keepdims=True)), axis=1)
+        outlying = np.where(keep & (np.abs(relative) > nSigmaClip*sigma[:, np.newaxis]),
+                            np.abs(relative), -np.inf)
+        worst = np.argsort(-outlying, axis=1)[:, :maxRejectionPerIteration]
+        reject = np.zeros_like(keep)
+        np.put_along_axis(reject, worst, np.take_along_axis(outlying, worst, axis=1) > -np.inf, axis=1)
+        if not reject.any():
+            break
+        keep &= ~reject
+
+    relative, residuals = residualsOf(params)
+    nDof = np.maximum(keep.sum(axis=1) - nParams + 1 + (not fitOffset), 1)
+    chiSq = np.sum(keep*relative[:, :-1]**2, axis=1)/nDof
+    covariance = np.linalg.inv(normal)*chiSq[:, np.newaxis, np.newaxis]
+    paramsErr = np.sqrt(np.clip(np.diagonal(covariance, axis1=1, axis2=2), 0.0, None))*free
+
+    zeros = np.zeros((nAmp, 1))
+    return {
+        "nodes": nodes,
+        "values": np.concatenate([zeros, params[:, :nValues]], axis=1),
+        "slopes": params[:, nValues:-1],
+        "offset": params[:, -1],
+        "params": np.concatenate([zeros, params], axis=1),
+        "paramsErr": np.concatenate([zeros, paramsErr], axis=1),
+        "residuals": np.where(mask, residuals, np.nan),
+        "mask": keep,
+        "chiSq": chiSq,
+    }
+
+
+class BatchedLinearitySolveTask(LinearitySolveTask):
+    """LinearitySolveTask that fits the splines of every amplifier at
+    once.
+
+    Spline solves against the exposure time are done by
+    `fitLinearitySplines`, with the per-amplifier PTC means and exposure
+    times stacked into arrays; photodiode, grouped, weighted and
+    temperature spline fits, and other linearity types, are left to
+    `lsst.cp.pipe.LinearitySolveTask`.
+    """
+
+    _DefaultName = "cpLinearizerSolve"
+
+    def run(self, inputPtc, dummy, camera, inputDims, **kwargs):
+        if (self.config.linearityType != "Spline" or self.config.usePhotodiode
+                or self.config.splineGroupingColumn is not None or self.config.doSplineFitWeights
+                or self.config.doSplineFitTemperature):
+            return super().run(inputPtc, dummy, camera, inputDims, **kwargs)
+
+        detector = camera[inputDims["detector"]]
+        ampNames = [amp.getName() for amp in detector]
+        badAmps = set(inputPtc.badAmps)
+        fit = fitLinearitySplines(
+            np.array([inputPtc.rawExpTimes[name] for name in ampNames]),
+            np.array([inputPtc.rawMeans[name] for name in ampNames]),
+            np.array([np.asarray(inputPtc.expIdMask[name], dtype=bool) & (name not in badAmps)
+                      for name in ampNames]),
+            self.config.splineKnots,
+            self.config.minLinearAdu,
+            self.config.maxLinearAdu,
+            fitOffset=self.config.doSplineFitOffset,
+            nSigmaClip=self.config.nSigmaClipLinear,
+            maxRejectionPerIteration=self.config.splineFitMaxRejectionPerIteration,
+            maxIterations=self.config.splineFitMaxIter,
+        )
+
+        linearizer = Linearizer(detector=detector, log=self.log)
+        for i, amp in enumerate(detector):
+            name = amp.getName()
+            linearizer.linearityBBox[name] = amp.getBBox()
+            if name in badAmps or not fit["mask"][i].any():
+                linearizer.linearityType[name] = "None"
+                linearizer.linearityCoeffs[name] = np.zeros(2*self.config.splineKnots)
+                continue
+            linearizer.linearityType[name] = "Spline"
+            linearizer.linearityCoeffs[name] = np.concatenate([fit["nodes"][i], fit["values"][i]])
+            linearizer.fitParams[name] = fit["params"][i]
+            linearizer.fitParamsErr[name] = fit["paramsErr"][i]
+            linearizer.fitChiSq[name] = fit["chiSq"][i]
+            linearizer.fitResiduals[name] = fit["residuals"][i]
+            linearizer.linearFit[name] = np.array([fit["offset"][i], fit["slopes"][i, 0]])
+        linearizer.hasLinearity = True
+        linearizer.validate()
+        linearizer.updateMetadata(camera=camera, detector=detector, filterName="NONE")
+        linearizer.updateMetadataFromExposures([inputPtc])
+        return Struct(outputLinearizer=linearizer)
@@ -0,0 +1,70 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""The RUN collections a pipetask stage wrote itself.
+
+``pipetask run -o ci_cpp_<stage>`` makes ``ci_cpp_<stage>`` a chain of
+its output run, ``ci_cpp_<stage>/<timestamp>`` (or the run given with
+``--output-run``), followed by the ``-i`` input collections.  Tools
+that act on what a stage produced must only look at the former.
+"""
+
+__all__ = ["selectOutputRuns", "getOutputRuns"]
+
+
+def selectOutputRuns(collection, runs):
+    """Select the runs written by the stage with an output collection.
+
+    Parameters
+    ----------
+    collection : `str`
+        Output collection of the stage, e.g. ``ci_cpp_bias``.
+    runs : iterable [`str`]
+        RUN collections, e.g. the flattened chain of ``collection``.
+
+    Returns
+    -------
+    outputRuns : `list` [`str`]
+        The runs named ``<collection>/...``, in the order given.
+    """
+    return [run for run in runs if run.startswith(f"{collection}/")]
+
+
+def getOutputRuns(butler, collection):
+    """Find the runs written by the stage with an output collection.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler for the repo.
+    collection : `str`
+        Output collection of the stage, e.g. ``ci_cpp_bias``.
+
+    Returns
+    -------
+    outputRuns : `list` [`str`]
+        The stage's own runs; the input collections chained after them
+        are left out.
+    """
+    from lsst.daf.butler import CollectionType
+
+    runs = butler.registry.queryCollections(collection, flattenChains=True,
+                                            collectionTypes=CollectionType.RUN)
+    return selectOutputRuns(collection, runs)
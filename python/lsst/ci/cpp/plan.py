@@ -0,0 +1,277 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Quantum counts and predicted cost of the stages SCons would run.
+
+The stage graph and pipetask arguments come from ``scons plan``.  Quanta
+are counted from quantum graphs built with ``pipetask qgraph`` (cached
+by their arguments), which needs the inputs of a stage to exist; stages
+whose graph cannot be built fall back to the quanta recorded by their
+last run.  Wall time and peak memory are predicted from the stage
+metrics recorded with ``CI_CPP_JOBS=auto``.
+"""
+
+__all__ = ["countQuanta", "predictStage", "findCriticalPath", "main"]
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import shlex
+import subprocess
+
+import yaml
+
+from .benchmarks.utils import formatTable, writeResults
+
+
+def _qgraphArgs(plan, repo):
+    return ["-b", repo, "-i", plan["inputs"], "-o", plan["collection"], "-p", plan["pipeline"],
+            "-d", plan["dataQuery"]]
+
+
+def _registryState(butler, inputs):
+    """Summarize the contents of the input collections of a run.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler for the repo.
+    inputs : `str`
+        Comma separated input collections.
+
+    Returns
+    -------
+    state : `list`
+        For each collection the inputs resolve to, its name and the
+        number of datasets of each dataset type in its summary.
+    """
+    state = []
+    for collection in butler.registry.queryCollections(inputs.split(","), flattenChains=True):
+        summary = butler.registry.getCollectionSummary(collection)
+        counts = {name: butler.registry.queryDatasets(name, collections=collection).count(exact=False)
+                  for name in sorted(summary.dataset_types.names)}
+        state.append([collection, counts])
+    return state
+
+
+def countQuanta(plan, butler, repo, cacheDir):
+    """Count the quanta of a pipetask run by building its graph.
+
+    Parameters
+    ----------
+    plan : `dict`
+        Arguments of the run, as recorded by the SConscript.
+    butler : `lsst.daf.butler.Butler`
+        Butler for the repo.
+    repo : `str`
+        Butler repo.
+    cacheDir : `str`
+        Directory of saved quantum graphs.  A graph is reused while the
+        arguments of the run and the contents of its input collections
+        are unchanged, whatever the registry database.
+
+    Returns
+    -------
+    quanta : `dict` [`str`, `int`] or `None`
+        Number of quanta of each task label, or `None` if the graph
+        could not be built.
+    """
+    from lsst.daf.butler import MissingCollectionError
+
+    try:
+        state = _registryState(butler, plan["inputs"])
+    except MissingCollectionError:
+        # The inputs have not been built yet.
+        return None
+    key = json.dumps([_qgraphArgs(plan, repo), plan["extraArgs"], state])
+    qgraphFile = os.path.join(cacheDir, hashlib.sha256(key.encode()).hexdigest()[:16] + ".qgraph")
+    if not os.path.exists(qgraphFile):
+        os.makedirs(cacheDir, exist_ok=True)
+        # Config overrides are recorded as shell fragments.
+        cmd = " ".join(["pipetask", "qgraph"] + [shlex.quote(arg) for arg in _qgraphArgs(plan, repo)]
+                       + plan["extraArgs"] + ["--save-qgraph", shlex.quote(qgraphFile)])
+        result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
+        if result.returncode != 0 or not os.path.exists(qgraphFile):
+            return None
+
+    from lsst.pipe.base import QuantumGraph
+
+    qgraph = QuantumGraph.loadUri(qgraphFile)
+    return {taskDef.label: qgraph.getNumberOfQuantaForTask(taskDef) for taskDef in qgraph.iterTaskGraph()}
+
+
+def _readMetrics(metricsDir, name):
+    filename = os.path.join(metricsDir, f"{name}.yaml")
+    if not os.path.exists(filename):
+        return None
+    with open(filename) as f:
+        return yaml.safe_load(f)
+
+
+def predictStage(quanta, metrics, jobs, overhead=0.0):
+    """Predict the wall time and peak memory of a pipetask run.
+
+    Tasks are assumed to run one after the other, each spreading its
+    quanta over the processes; the mean time of a task's quanta is taken
+    from the last run.
+
+    Parameters
+    ----------
+    quanta : `dict` [`str`, `int`] or `None`
+        Quanta per task label; defaults to those of the last run.
+    metrics : `dict` or `None`
+        Stage metrics of the last run, as from
+        `lsst.ci.cpp.stageMetrics.collectStageMetrics`.
+    jobs : `int`
+        Number of processes.
+    overhead : `float`, optional
+        Fixed start-up cost of the run, in seconds.
+
+    Returns
+    -------
+    prediction : `dict`
+        ``quanta`` (total, or `None`), ``wallTime`` in seconds and
+        ``maxResidentSetSize`` in bytes (`None` without metrics).
+    """
+    if quanta is None and metrics is not None:
+        quanta = {label: task["quanta"] for label, task in metrics["tasks"].items()}
+    prediction = {"quanta": sum(quanta.values()) if quanta is not None else None,
+                  "wallTime": None, "maxResidentSetSize": None}
+    if metrics is None or quanta is None:
+        return prediction
+
+    wallTime = overhead
+    for label, nQuanta in quanta.items():
+        task = metrics["tasks"].get(label)
+        if task is None or task["quanta"] == 0 or nQuanta == 0:
+            continue
+        perQuantum = task["wallTime"]/task["quanta"]
+        wallTime += perQuantum*math.ceil(nQuanta/jobs)
+    widest = max(quanta.values(), default=0)
+    prediction["wallTime"] = wallTime
+    prediction["maxResidentSetSize"] = min(jobs, max(widest, 1))*metrics["maxResidentSetSize"]
+    return prediction
+
+
+def findCriticalPath(stages, wallTimes):
+    """Find the longest chain of dependent stages.
+
+    Parameters
+    ----------
+    stages : `dict` [`str`, `dict`]
+        Stages with their ``dependsOn`` lists.
+    wallTimes : `dict` [`str`, `float`]
+        Predicted wall time of each stage; missing stages count as 0.
+
+    Returns
+    -------
+    path : `list` [`str`]
+        Stages on the critical path, first to last.
+    wallTime : `float`
+        Predicted wall time along the path.
+    """
+    finish = {}
+    previous = {}
+
+    def getFinish(name):
+        if name not in finish:
+            start = 0.0
+            for dependency in stages[name]["dependsOn"]:
+                if getFinish(dependency) >= start:
+                    start = finish[dependency]
+                    previous[name] = dependency
+            finish[name] = start + (wallTimes.get(name) or 0.0)
+        return finish[name]
+
+    if not stages:
+        return [], 0.0
+    last = max(stages, key=getFinish)
+    path = [last]
+    while path[-1] in previous:
+        path.append(previous[path[-1]])
+    return path[::-1], finish[last]
+
+
+def main(argv=None):
+    """Command line entry point for the build plan."""
+    parser = argparse.ArgumentParser(
+        description="Count the quanta of the stages in a build plan and predict their wall time and "
+                    "peak memory from recorded stage metrics.",
+    )
+    parser.add_argument("spec", help="Plan written by 'scons plan'.")
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo.")
+    parser.add_argument("--metrics-dir", required=True, help="Directory of recorded stage metrics.")
+    parser.add_argument("--overhead", type=float, default=20.0,
+                        help="Start-up time of each pipetask run, in seconds.")
+    parser.add_argument("--no-qgraph", action="store_true",
+                        help="Use the quanta of the last run instead of building quantum graphs.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the plan to.")
+    args = parser.parse_args(argv)
+
+    with open(args.spec) as f:
+        spec = yaml.safe_load(f)
+    butler = None
+    if os.path.exists(os.path.join(args.repo, "butler.yaml")) and not args.no_qgraph:
+        import lsst.daf.butler as dafButler
+
+        butler = dafButler.Butler(args.repo)
+    cacheDir = os.path.join(os.path.dirname(os.path.abspath(args.spec)), "qgraphs")
+
+    rows = []
+    stageTimes = {}
+    stageMemory = {}
+    for stageName, stage in spec["stages"].items():
+        stageTime = None
+        for name in stage["pipetasks"]:
+            plan = spec["pipetasks"][name]
+            quanta = None
+            if butler is not None:
+                quanta = countQuanta(plan, butler, args.repo, cacheDir)
+            metrics = _readMetrics(args.metrics_dir, name)
+            prediction = predictStage(quanta, metrics, plan["jobs"], overhead=args.overhead)
+            source = "qgraph" if quanta is not None else ("lastRun" if metrics is not None else "none")
+            rows.append({"stage": stageName, "pipetask": name, "exposures": plan["exposures"],
+                         "quanta": prediction["quanta"], "jobs": plan["jobs"], "source": source,
+                         "wallTime": prediction["wallTime"],
+                         "maxRssMB": (prediction["maxResidentSetSize"]/1024**2
+                                      if prediction["maxResidentSetSize"] is not None else None),
+                         "command": plan["command"]})
+            if prediction["wallTime"] is not None:
+                stageTime = (stageTime or 0.0) + prediction["wallTime"]
+                stageMemory[stageName] = max(stageMemory.get(stageName, 0), prediction["maxResidentSetSize"])
+        stageTimes[stageName] = stageTime
+
+    path, pathTime = findCriticalPath(spec["stages"], stageTimes)
+    print(formatTable(rows, ["stage", "pipetask", "exposures", "quanta", "jobs", "source", "wallTime",
+                             "maxRssMB"]))
+    unknown = [name for name, time in stageTimes.items()
+               if time is None and spec["stages"][name]["pipetasks"]]
+    print(f"Critical path ({pathTime:.0f} s): {' -> '.join(path)}")
+    print(f"Serial total: {sum(time or 0.0 for time in stageTimes.values()):.0f} s")
+    if unknown:
+        print(f"No recorded metrics (build with CI_CPP_JOBS=auto to record them): {', '.join(unknown)}")
+    if args.output:
+        stages = {name: {"dependsOn": stage["dependsOn"], "wallTime": stageTimes[name],
+                         "maxResidentSetSize": stageMemory.get(name)}
+                  for name, stage in spec["stages"].items()}
+        writeResults({"targets": spec["targets"], "legacy": spec["legacy"], "stages": stages,
+                      "pipetasks": rows, "criticalPath": path, "criticalPathWallTime": pathTime}, args.output)
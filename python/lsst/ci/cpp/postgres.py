@@ -0,0 +1,167 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""A local PostgreSQL server for the registry of the ci_cpp repo.
+
+No stack packages are used, so that the SConscript can load this
+module directly.
+"""
+
+__all__ = ["LocalPostgres", "writeSeedConfig"]
+
+import getpass
+import os
+import shutil
+import socket
+import subprocess
+
+import yaml
+
+
+def _findFreePort():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+class LocalPostgres:
+    """A PostgreSQL server owned by the build.
+
+    The cluster is created with ``initdb`` on first use and listens
+    only on localhost.  The cluster directory is kept between builds so
+    that the registry matches the datastore files in DATA; only the
+    server process is started and stopped with each build.
+
+    Parameters
+    ----------
+    dataDir : `str`
+        Directory holding the database cluster.
+    database : `str`, optional
+        Name of the database holding the registry.
+    port : `int`, optional
+        Port to listen on.  Defaults to the port of the previous run,
+        or a free port.
+    """
+
+    def __init__(self, dataDir, database="ci_cpp", port=None):
+        self.dataDir = os.path.abspath(dataDir)
+        self.database = database
+        self.user = getpass.getuser()
+        self._portFile = os.path.join(self.dataDir, "ci_cpp_port")
+        if port is None and os.path.exists(self._portFile):
+            with open(self._portFile) as f:
+                port = int(f.read())
+        self.port = port if port is not None else _findFreePort()
+        self._started = False
+
+    @staticmethod
+    def isAvailable():
+        """Are the PostgreSQL server programs on the ``PATH``?"""
+        return all(shutil.which(program) for program in ("initdb", "pg_ctl", "createdb", "dropdb", "psql"))
+
+    @property
+    def url(self):
+        """Database URL for the butler registry."""
+        return f"postgresql://{self.user}@localhost:{self.port}/{self.database}"
+
+    def _run(self, *args):
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL)
+
+    def _clientArgs(self):
+        return ["-h", "localhost", "-p", str(self.port), "-U", self.user]
+
+    def isRunning(self):
+        """Is a server running on the cluster?"""
+        return subprocess.run(["pg_ctl", "-D", self.dataDir, "status"], stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL).returncode == 0
+
+    def start(self):
+        """Create the cluster if needed and start the server.
+
+        Nothing is done if the server is already running; `stop` then
+        leaves it running.
+        """
+        if self._started:
+            return
+        if not os.path.exists(os.path.join(self.dataDir, "PG_VERSION")):
+            os.makedirs(self.dataDir, exist_ok=True)
+            self._run("initdb", "-D", self.dataDir, "-U", self.user, "--auth=trust", "-E", "UTF8")
+        elif self.isRunning():
+            return
+        with open(self._portFile, "w") as f:
+            f.write(str(self.port))
+
+        self._run("pg_ctl", "-D", self.dataDir, "-w", "-l", os.path.join(self.dataDir, "server.log"),
+                  "-o", f"-p {self.port} -c listen_addresses=localhost -k {self.dataDir}", "start")
+        self._started = True
+
+    def getResetCmds(self):
+        """Commands that recreate an empty registry database.
+
+        These are run just before ``butler create``.
+
+        Returns
+        -------
+        cmds : `list` [`str`]
+            Shell commands.
+        """
+        client = " ".join(self._clientArgs())
+        return [
+            f"dropdb {client} --if-exists {self.database}",
+            f"createdb {client} {self.database}",
+            # The registry uses exclusion constraints on calibration
+            # validity ranges.
+            f"psql {client} -d {self.database} -c 'CREATE EXTENSION btree_gist;'",
+        ]
+
+    def stop(self):
+        """Stop the server, if this object started it."""
+        if self._started:
+            self._run("pg_ctl", "-D", self.dataDir, "-w", "-m", "fast", "stop")
+            self._started = False
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+def writeSeedConfig(filename, url, baseConfig=None):
+    """Write a butler seed config using a PostgreSQL registry.
+
+    Parameters
+    ----------
+    filename : `str`
+        Seed config to write.
+    url : `str`
+        Database URL of the registry.
+    baseConfig : `str`, optional
+        Seed config to extend, e.g. a storage policy.
+    """
+    config = {}
+    if baseConfig is not None:
+        with open(baseConfig) as f:
+            config = yaml.safe_load(f) or {}
+    config.setdefault("registry", {})["db"] = url
+    os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+    with open(filename, "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
@@ -0,0 +1,199 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Remove intermediate datasets of a stage once it has been certified."""
+
+__all__ = ["DEFAULT_KEEP", "STAGE_KEEP", "getKeepRules", "selectPrunable", "pruneStage", "vacuumRegistry",
+           "main"]
+
+import argparse
+import fnmatch
+import os
+import sqlite3
+
+from .outputRuns import getOutputRuns
+
+# Dataset types kept in every stage: provenance is small and is what
+# the pipetask and report tooling look at.
+DEFAULT_KEEP = ["*_config", "*_log", "*_metadata", "packages"]
+
+# Dataset types kept per stage, in addition to DEFAULT_KEEP.  The
+# certified calibration must always be kept, as calib/v00 refers to
+# the stored files.
+STAGE_KEEP = {
+    "defects": ["defects"],
+    "linearizer": ["linearizer"],
+    "ptc": ["ptc"],
+    "cti": ["cti"],
+    "bfk": ["bfk"],
+    "bias": ["bias"],
+    "dark": ["dark"],
+    "flat": ["flat"],
+    "sky": ["sky"],
+}
+
+
+def getKeepRules(stage, extraKeep=()):
+    """Return the dataset type patterns kept for a stage.
+
+    Parameters
+    ----------
+    stage : `str`
+        Name of the calibration stage.
+    extraKeep : iterable [`str`], optional
+        Further shell-style patterns to keep.
+
+    Returns
+    -------
+    keep : `list` [`str`]
+        Patterns of dataset type names that are not pruned.
+    """
+    return DEFAULT_KEEP + STAGE_KEEP.get(stage, [stage]) + list(extraKeep)
+
+
+def selectPrunable(datasetTypeNames, keep):
+    """Select the dataset types that are not covered by a keep rule.
+
+    Component dataset types follow their parent.
+
+    Parameters
+    ----------
+    datasetTypeNames : iterable [`str`]
+        Dataset type names present in the collection.
+    keep : `list` [`str`]
+        Shell-style patterns of dataset type names to keep.
+
+    Returns
+    -------
+    prunable : `list` [`str`]
+        Sorted names of the dataset types to remove.
+    """
+    prunable = set()
+    for name in datasetTypeNames:
+        parent = name.split(".")[0]
+        if not any(fnmatch.fnmatchcase(parent, pattern) for pattern in keep):
+            prunable.add(parent)
+    return sorted(prunable)
+
+
+def _storedBytes(butler, refs):
+    """Total size of the local files backing some datasets."""
+    paths = set()
+    for ref in refs:
+        primary, components = butler.getURIs(ref)
+        for uri in [primary, *components.values()]:
+            if uri is not None and uri.isLocal:
+                paths.add(uri.ospath)
+    return sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+
+
+def pruneStage(butler, stage, extraKeep=(), dryRun=False):
+    """Remove the intermediate datasets of a certified stage.
+
+    Only the runs the stage wrote itself (``ci_cpp_<stage>/...``) are
+    touched.  The input collections chained under ``ci_cpp_<stage>``,
+    such as the raws, the curated calibrations and the outputs of
+    other stages, are left alone, as are the ``ci_cpv_<stage>``
+    verification outputs, which the report reads.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Writeable butler for the repo.
+    stage : `str`
+        Name of the calibration stage.
+    extraKeep : iterable [`str`], optional
+        Further shell-style patterns of dataset types to keep.
+    dryRun : `bool`, optional
+        Only report what would be removed?
+
+    Returns
+    -------
+    summary : `dict` [`str`, `dict`]
+        Number of datasets and bytes removed, keyed by dataset type.
+    """
+    runs = getOutputRuns(butler, f"ci_cpp_{stage}")
+    if not runs:
+        return {}
+
+    datasetTypeNames = {datasetType.name for datasetType in
+                        butler.registry.queryDatasetTypes(...)}
+    summary = {}
+    for name in selectPrunable(datasetTypeNames, getKeepRules(stage, extraKeep)):
+        refs = list(set(butler.registry.queryDatasets(name, collections=runs, findFirst=False)))
+        if not refs:
+            continue
+        summary[name] = {"datasets": len(refs), "bytes": _storedBytes(butler, refs)}
+        if not dryRun:
+            butler.pruneDatasets(refs, disassociate=True, unstore=True, purge=True)
+    return summary
+
+
+def vacuumRegistry(repo):
+    """Compact the SQLite registry of a repo.
+
+    Parameters
+    ----------
+    repo : `str`
+        Path to the butler repo.
+
+    Returns
+    -------
+    reclaimed : `int`
+        Reduction in the size of the registry file, in bytes.
+    """
+    filename = os.path.join(repo, "gen3.sqlite3")
+    before = os.path.getsize(filename)
+    with sqlite3.connect(filename) as connection:
+        connection.execute("VACUUM")
+    return before - os.path.getsize(filename)
+
+
+def main(argv=None):
+    """Command line entry point for pruning a certified stage."""
+    parser = argparse.ArgumentParser(
+        description="Remove intermediate datasets of a certified ci_cpp stage, keeping provenance and the "
+                    "certified calibration.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo to prune.")
+    parser.add_argument("-s", "--stage", required=True, help="Stage whose ci_cpp_<stage> outputs to prune.")
+    parser.add_argument("-k", "--keep", action="append", default=[],
+                        help="Additional dataset type pattern to keep (may be repeated).")
+    parser.add_argument("--vacuum", action="store_true", help="VACUUM the SQLite registry afterwards.")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would be removed.")
+    args = parser.parse_args(argv)
+
+    import lsst.daf.butler as dafButler
+
+    butler = dafButler.Butler(args.repo, writeable=not args.dry_run)
+    summary = pruneStage(butler, args.stage, extraKeep=args.keep, dryRun=args.dry_run)
+
+    verb = "Would remove" if args.dry_run else "Removed"
+    for name, record in summary.items():
+        print(f"{verb} {record['datasets']} {name} dataset(s), {record['bytes']/1024**2:.1f} MB.")
+    totalBytes = sum(record["bytes"] for record in summary.values())
+    print(f"{args.stage}: {verb.lower()} {totalBytes/1024**2:.1f} MB of intermediate datasets.")
+
+    if args.vacuum and not args.dry_run:
+        del butler
+        if not os.path.exists(os.path.join(args.repo, "gen3.sqlite3")):
+            print(f"Not compacting the registry of {args.repo}, which is not SQLite.")
+            return
+        print(f"VACUUM reclaimed {vacuumRegistry(args.repo)/1024**2:.1f} MB of registry.")
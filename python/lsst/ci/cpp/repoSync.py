@@ -0,0 +1,361 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Write-back of a butler repo built on a RAM-backed filesystem.
+
+The repo is built under a tmpfs directory and mirrored to persistent
+storage.  No stack packages are used, so that the SConscript can load
+this module directly.
+"""
+
+__all__ = ["STATE_FILE", "LOCK_FILE", "REGISTRY_FILE", "readState", "syncRepo", "restoreRepo",
+           "checkRepo", "main"]
+
+import argparse
+import contextlib
+import datetime
+import fcntl
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import yaml
+
+# Marker in the persistent copy recording whether the last sync
+# completed.
+STATE_FILE = ".ci_cpp_sync.yaml"
+LOCK_FILE = ".ci_cpp_sync.lock"
+LOG_FILE = "sync.log"
+REGISTRY_FILE = "gen3.sqlite3"
+_SQLITE_SUFFIXES = ("-journal", "-wal", "-shm")
+
+
+def readState(root):
+    """Read the sync state of a persistent copy.
+
+    Parameters
+    ----------
+    root : `str`
+        Persistent repo directory.
+
+    Returns
+    -------
+    state : `dict` or `None`
+        The recorded state, or `None` if the directory was never
+        synced.
+    """
+    try:
+        with open(os.path.join(root, STATE_FILE)) as f:
+            return yaml.safe_load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _writeState(root, state, **kwargs):
+    record = {"state": state, "time": datetime.datetime.now(datetime.timezone.utc).isoformat()}
+    record.update(kwargs)
+    tmpName = os.path.join(root, STATE_FILE + ".tmp")
+    with open(tmpName, "w") as f:
+        yaml.safe_dump(record, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmpName, os.path.join(root, STATE_FILE))
+
+
+@contextlib.contextmanager
+def _locked(root):
+    """Hold the sync lock of a persistent copy."""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, LOCK_FILE), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+
+# Files of the package, rather than the repo, that live in DATA.
+_PACKAGE_FILES = ("SConscript",)
+
+
+def _isSkipped(relPath):
+    name = os.path.basename(relPath)
+    return (name in (STATE_FILE, STATE_FILE + ".tmp", LOCK_FILE, LOG_FILE)
+            or name.startswith(REGISTRY_FILE)
+            or name.startswith(".sconsign")
+            or relPath in _PACKAGE_FILES)
+
+
+def _listFiles(root):
+    files = {}
+    for dirpath, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            relPath = os.path.relpath(path, root)
+            if not _isSkipped(relPath) and not os.path.islink(path):
+                stat = os.stat(path)
+                files[relPath] = (stat.st_size, int(stat.st_mtime))
+    return files
+
+
+def _backupRegistry(source, destination):
+    """Copy a SQLite registry with the online backup API.
+
+    The backup is a consistent snapshot even while a pipetask is
+    writing to the source.
+    """
+    tmpName = destination + ".tmp"
+    with contextlib.closing(sqlite3.connect(source)) as sourceDb, \
+            contextlib.closing(sqlite3.connect(tmpName)) as destinationDb:
+        sourceDb.backup(destinationDb)
+    os.replace(tmpName, destination)
+    for suffix in _SQLITE_SUFFIXES:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(destination + suffix)
+
+
+def _registryPaths(registry):
+    """Return the local datastore paths a registry refers to."""
+    with contextlib.closing(sqlite3.connect(f"file:{registry}?mode=ro", uri=True)) as db:
+        paths = {row[0] for row in db.execute("SELECT DISTINCT path FROM file_datastore_records")}
+    return {os.path.normpath(path) for path in paths if "://" not in path}
+
+
+def _copyFiles(source, destination, sourceFiles):
+    destinationFiles = _listFiles(destination) if os.path.isdir(destination) else {}
+    copied = 0
+    for relPath, signature in sourceFiles.items():
+        if destinationFiles.get(relPath) == signature:
+            continue
+        target = os.path.join(destination, relPath)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            shutil.copy2(os.path.join(source, relPath), target)
+        except FileNotFoundError:
+            # Removed since it was listed.
+            continue
+        copied += 1
+    return copied
+
+
+def _mirror(source, destination, registry, attempts=3):
+    """Make ``destination`` a copy of ``source``.
+
+    With ``registry``, the SQLite registry is snapshotted first, and of
+    the datastore directories only the files that the snapshot refers
+    to are copied, before the snapshot is moved into place.  Datasets
+    written after the snapshot are left for the next mirror, so the copy
+    is consistent even while a pipetask writes to ``source``.  If files
+    the snapshot refers to are removed before they are copied, a new
+    snapshot is taken, up to ``attempts`` times.
+
+    Returns
+    -------
+    copied : `int`
+        Number of files copied.
+    removed : `int`
+        Number of files removed.
+    """
+    sourceRegistry = os.path.join(source, REGISTRY_FILE)
+    if not registry or not os.path.exists(sourceRegistry):
+        sourceFiles = _listFiles(source)
+        copied = _copyFiles(source, destination, sourceFiles)
+        return copied, _removeExtra(destination, sourceFiles.keys())
+
+    os.makedirs(destination, exist_ok=True)
+    snapshot = os.path.join(destination, REGISTRY_FILE + ".snapshot")
+    copied = 0
+    for _ in range(attempts):
+        _backupRegistry(sourceRegistry, snapshot)
+        referenced = _registryPaths(snapshot)
+        datastoreDirectories = {path.split(os.sep)[0] for path in referenced}
+        sourceFiles = {relPath: signature for relPath, signature in _listFiles(source).items()
+                       if relPath in referenced or relPath.split(os.sep)[0] not in datastoreDirectories}
+        copied += _copyFiles(source, destination, sourceFiles)
+        # Links (e.g. raws ingested in place) are not copied.
+        vanished = [path for path in referenced
+                    if not os.path.exists(os.path.join(destination, path))
+                    and not os.path.islink(os.path.join(source, path))]
+        if not vanished:
+            break
+    else:
+        os.remove(snapshot)
+        raise RuntimeError(f"{len(vanished)} file(s) of the {source} registry, e.g. {vanished[0]}, "
+                           f"were removed while mirroring it {attempts} times.")
+    removed = _removeExtra(destination, sourceFiles.keys() | referenced)
+    os.replace(snapshot, os.path.join(destination, REGISTRY_FILE))
+    for suffix in _SQLITE_SUFFIXES:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(destination, REGISTRY_FILE + suffix))
+    return copied, removed
+
+
+def _removeExtra(destination, keep):
+    removed = 0
+    if os.path.isdir(destination):
+        for relPath in _listFiles(destination).keys() - keep:
+            os.remove(os.path.join(destination, relPath))
+            removed += 1
+    return removed
+
+
+def syncRepo(ramRoot, persistRoot):
+    """Write a RAM-backed repo back to persistent storage.
+
+    The persistent copy is marked as ``syncing`` until the copy
+    completes, so an interrupted sync is detected by `checkRepo`.
+    Concurrent syncs are serialized by a lock file.
+
+    Parameters
+    ----------
+    ramRoot : `str`
+        Repo directory on the RAM-backed filesystem.
+    persistRoot : `str`
+        Persistent repo directory.
+
+    Returns
+    -------
+    copied : `int`
+        Number of files copied.
+    removed : `int`
+        Number of files removed.
+    """
+    with _locked(persistRoot):
+        _writeState(persistRoot, "syncing", source=ramRoot)
+        copied, removed = _mirror(ramRoot, persistRoot, registry=True)
+        _writeState(persistRoot, "complete", source=ramRoot, copied=copied, removed=removed)
+    return copied, removed
+
+
+def restoreRepo(persistRoot, ramRoot):
+    """Copy a consistent persistent repo into an empty RAM-backed
+    directory.
+
+    Parameters
+    ----------
+    persistRoot : `str`
+        Persistent repo directory.
+    ramRoot : `str`
+        Repo directory on the RAM-backed filesystem.
+
+    Returns
+    -------
+    restored : `bool`
+        Whether anything was restored.  Nothing is restored if
+        ``ramRoot`` already holds a repo or the persistent copy was
+        never synced.
+
+    Raises
+    ------
+    RuntimeError
+        Raised if the persistent copy is inconsistent.
+    """
+    if os.path.exists(os.path.join(ramRoot, "butler.yaml")) or readState(persistRoot) is None:
+        return False
+    problems = checkRepo(persistRoot)
+    if problems:
+        raise RuntimeError(f"{persistRoot} is inconsistent and cannot be restored into {ramRoot}: "
+                           + " ".join(problems))
+    with _locked(persistRoot):
+        _mirror(persistRoot, ramRoot, registry=True)
+    return True
+
+
+def checkRepo(root):
+    """Check that a persistent copy is consistent.
+
+    Parameters
+    ----------
+    root : `str`
+        Persistent repo directory.
+
+    Returns
+    -------
+    problems : `list` [`str`]
+        Descriptions of the problems found; empty if consistent.
+    """
+    problems = []
+    state = readState(root)
+    if state is not None and state.get("state") != "complete":
+        problems.append(f"Last sync from {state.get('source')} did not complete ({state.get('time')}).")
+
+    registry = os.path.join(root, REGISTRY_FILE)
+    if not os.path.exists(registry):
+        problems.append(f"No registry at {registry}.")
+        return problems
+    with contextlib.closing(sqlite3.connect(f"file:{registry}?mode=ro", uri=True)) as db:
+        result = db.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            problems.append(f"Registry integrity check failed: {result}.")
+        paths = [row[0] for row in db.execute("SELECT DISTINCT path FROM file_datastore_records")]
+    missing = [path for path in paths
+               if "://" not in path and not os.path.exists(os.path.join(root, path))]
+    if missing:
+        problems.append(f"{len(missing)} datastore file(s) missing, e.g. {missing[0]}.")
+    return problems
+
+
+def main(argv=None):
+    """Command line entry point for RAM-backed repo write-back."""
+    parser = argparse.ArgumentParser(description="Sync a RAM-backed butler repo to persistent storage.")
+    parser.add_argument("command", choices=("sync", "restore", "check"))
+    parser.add_argument("--ram-root", help="Repo directory on the RAM-backed filesystem.")
+    parser.add_argument("--persist-root", required=True, help="Persistent repo directory.")
+    parser.add_argument("--background", action="store_true",
+                        help="Run the sync in a detached process and return immediately.")
+    args = parser.parse_args(argv)
+
+    if args.command == "check":
+        problems = checkRepo(args.persist_root)
+        for problem in problems:
+            print(problem)
+        sys.exit(1 if problems else 0)
+
+    if args.ram_root is None:
+        parser.error(f"{args.command} needs --ram-root.")
+
+    if args.command == "restore":
+        try:
+            restored = restoreRepo(args.persist_root, args.ram_root)
+        except RuntimeError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        if restored:
+            print(f"Restored {args.persist_root} to {args.ram_root}.")
+        else:
+            print(f"Nothing to restore from {args.persist_root}.")
+        return
+
+    if args.background:
+        os.makedirs(args.persist_root, exist_ok=True)
+        argv = [arg for arg in (sys.argv[1:] if argv is None else argv) if arg != "--background"]
+        with open(os.path.join(args.persist_root, LOG_FILE), "a") as log:
+            subprocess.Popen([sys.executable, "-m", __name__, *argv], stdout=log, stderr=log,
+                             start_new_session=True)
+        return
+
+    copied, removed = syncRepo(args.ram_root, args.persist_root)
+    print(f"Synced {args.ram_root} to {args.persist_root}: {copied} file(s) copied, {removed} removed.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Incremental construction of the cp_verify report."""
+
+__all__ = ["REPORT_ENTRY_POINT", "computeCollectionHash", "loadEntryPoint", "IncrementalReportBuilder",
+           "main"]
+
+import argparse
+import glob
+import hashlib
+import importlib
+import logging
+import os
+import shutil
+import sys
+
+import yaml
+
+from .outputRuns import getOutputRuns
+
+_LOG = logging.getLogger(__name__)
+
+MANIFEST_NAME = "fragments.yaml"
+FRAGMENT_DIR = "fragments"
+
+# The cp_verify function behind cpv_report.py, as "<module>:<function>".
+# It reads its arguments from sys.argv.
+REPORT_ENTRY_POINT = "lsst.cp.verify.cpvReport:main"
+
+
+def computeCollectionHash(butler, collection):
+    """Compute a content hash for a verification collection.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler to query.
+    collection : `str`
+        Output collection of the verification, e.g. ``ci_cpv_bias``.
+        Only the runs it wrote itself are hashed; the inputs chained
+        after them (``calib/v00``, the raws and the curated
+        calibrations) are not, so certifying another stage leaves the
+        hash unchanged.
+
+    Returns
+    -------
+    contentHash : `str`
+        Hex digest of the sorted dataset type names and dataset ids
+        found in the verification's runs.
+    """
+    runs = getOutputRuns(butler, collection)
+    refs = butler.registry.queryDatasets(..., collections=runs, findFirst=False) if runs else []
+    entries = sorted(f"{ref.datasetType.name}:{ref.id}" for ref in refs)
+
+    digest = hashlib.sha256()
+    for entry in entries:
+        digest.update(entry.encode())
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def loadEntryPoint(entryPoint=REPORT_ENTRY_POINT):
+    """Import the report function of cp_verify.
+
+    Parameters
+    ----------
+    entryPoint : `str`, optional
+        Function to import, as ``<module>:<function>``.
+
+    Returns
+    -------
+    function : callable
+        The report function.
+
+    Raises
+    ------
+    RuntimeError
+        Raised if the module or function cannot be imported.
+    """
+    moduleName, _, functionName = entryPoint.partition(":")
+    try:
+        return getattr(importlib.import_module(moduleName), functionName)
+    except (ImportError, AttributeError) as e:
+        raise RuntimeError(f"Cannot import the cp_verify report function {entryPoint}.") from e
+
+
+class IncrementalReportBuilder:
+    """Build the cp_verify report one collection at a time.
+
+    Each verification collection is rendered into its own fragment
+    directory, and the fragment is only regenerated when the content
+    hash of that collection changes.  The cp_verify report function is
+    called in this process for each fragment.
+
+    Parameters
+    ----------
+    repo : `str`
+        Butler repository to read.
+    outputDir : `str`
+        Directory to write the report to.
+    entryPoint : `str`, optional
+        cp_verify report function, as ``<module>:<function>``.  It is
+        imported when the first fragment is rendered.
+    """
+
+    def __init__(self, repo, outputDir, entryPoint=REPORT_ENTRY_POINT):
+        self.repo = repo
+        self.outputDir = outputDir
+        self.entryPoint = entryPoint
+        self._reportFunction = None
+
+    @property
+    def manifestPath(self):
+        return os.path.join(self.outputDir, MANIFEST_NAME)
+
+    def fragmentPath(self, collection):
+        """Return the fragment directory for a collection.
+
+        Parameters
+        ----------
+        collection : `str`
+            Verification collection.
+
+        Returns
+        -------
+        path : `str`
+            Directory holding that collection's report.
+        """
+        return os.path.join(self.outputDir, FRAGMENT_DIR, collection)
+
+    def readManifest(self):
+        """Read the hashes of the existing fragments.
+
+        Returns
+        -------
+        manifest : `dict` [`str`, `str`]
+            Mapping of collection name to content hash.
+        """
+        if not os.path.exists(self.manifestPath):
+            return {}
+        with open(self.manifestPath, "r") as f:
+            manifest = yaml.safe_load(f)
+        return manifest if manifest else {}
+
+    def writeManifest(self, manifest):
+        os.makedirs(self.outputDir, exist_ok=True)
+        tmpPath = f"{self.manifestPath}.tmp"
+        with open(tmpPath, "w") as f:
+            yaml.safe_dump(manifest, f)
+        os.replace(tmpPath, self.manifestPath)
+
+    def build(self, collections, force=False, butler=None):
+        """Update the report for the requested collections.
+
+        Parameters
+        ----------
+        collections : `list` [`str`]
+            Verification collections to include in the report.
+        force : `bool`, optional
+            Rebuild every fragment, regardless of the stored hashes.
+        butler : `lsst.daf.butler.Butler`, optional
+            Butler used to hash the collections; defaults to a
+            read-only butler for the repo.
+
+        Returns
+        -------
+        rebuilt : `list` [`str`]
+            Collections whose fragments were regenerated.
+        """
+        if butler is None:
+            import lsst.daf.butler as dafButler
+
+            butler = dafButler.Butler(self.repo, writeable=False)
+        manifest = self.readManifest()
+        rebuilt = []
+
+        for collection in collections:
+            contentHash = computeCollectionHash(butler, collection)
+            fragmentDir = self.fragmentPath(collection)
+            if not force and manifest.get(collection) == contentHash and os.path.isdir(fragmentDir):
+                _LOG.info("Report fragment for %s is up to date.", collection)
+                continue
+
+            _LOG.info("Rebuilding report fragment for %s.", collection)
+            if os.path.isdir(fragmentDir):
+                shutil.rmtree(fragmentDir)
+            os.makedirs(fragmentDir)
+            self.runReport(collection, fragmentDir)
+
+            # Record each fragment as it completes, so an interrupted
+            # build only redoes the remaining collections.
+            manifest[collection] = contentHash
+            self.writeManifest(manifest)
+            rebuilt.append(collection)
+
+        # Collections dropped from the build no longer belong in the
+        # report.
+        for collection in set(manifest) - set(collections):
+            shutil.rmtree(self.fragmentPath(collection), ignore_errors=True)
+            del manifest[collection]
+        self.writeManifest(manifest)
+
+        self.writeIndex(collections)
+        return rebuilt
+
+    def runReport(self, collection, fragmentDir):
+        """Render the report of a single collection in-process.
+
+        Parameters
+        ----------
+        collection : `str`
+            Verification collection to report on.
+        fragmentDir : `str`
+            Output directory for this fragment.
+
+        Raises
+        ------
+        RuntimeError
+            Raised if the report function cannot be imported, or exits
+            with an error.
+        """
+        if self._reportFunction is None:
+            self._reportFunction = loadEntryPoint(self.entryPoint)
+
+        savedArgv = sys.argv
+        sys.argv = ["cpv_report.py", "-r", self.repo, "-O", fragmentDir, "-c", collection]
+        try:
+            self._reportFunction()
+        except SystemExit as e:
+            if e.code not in (None, 0):
+                raise RuntimeError(f"Report generation failed for {collection}: exit code {e.code}") from e
+        finally:
+            sys.argv = savedArgv
+
+    def writeIndex(self, collections):
+        """Stitch the fragments together with a top-level index.
+
+        Parameters
+        ----------
+        collections : `list` [`str`]
+            Collections to link, in order.
+        """
+        lines = ["<html>", "<head><title>ci_cpp_gen3 cp_verify report</title></head>", "<body>",
+                 "<h1>ci_cpp_gen3 cp_verify report</h1>", "<ul>"]
+        for collection in collections:
+            fragmentDir = self.fragmentPath(collection)
+            pages = sorted(glob.glob(os.path.join(fragmentDir, "*.html")))
+            if not pages:
+                lines.append(f"<li>{collection}: no report pages produced</li>")
+                continue
+            links = ", ".join(
+                f'<a href="{os.path.relpath(page, self.outputDir)}">{os.path.basename(page)}</a>'
+                for page in pages
+            )
+            lines.append(f"<li>{collection}: {links}</li>")
+        lines.extend(["</ul>", "</body>", "</html>"])
+
+        with open(os.path.join(self.outputDir, "index.html"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def main(argv=None):
+    """Command line entry point for the incremental report."""
+    parser = argparse.ArgumentParser(description="Incrementally build the cp_verify report.")
+    parser.add_argument("-r", "--repo", required=True, help="Butler repository to read.")
+    parser.add_argument("-O", "--output", required=True, help="Report output directory.")
+    parser.add_argument("-c", "--collection", action="append", default=[], dest="collections",
+                        help="Verification collection to include (may be repeated).")
+    parser.add_argument("--entry-point", default=REPORT_ENTRY_POINT,
+                        help="cp_verify report function, as <module>:<function>.")
+    parser.add_argument("--force", action="store_true", help="Rebuild all fragments.")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    builder = IncrementalReportBuilder(args.repo, args.output, entryPoint=args.entry_point)
+    rebuilt = builder.build(args.collections, force=args.force)
+    _LOG.info("Rebuilt %d of %d report fragments.", len(rebuilt), len(args.collections))
@@ -0,0 +1,302 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Memory growth of repeated ISR runs in one process.
+
+A long-running worker runs ``IsrTaskLSST`` on exposure after exposure,
+so memory that one run does not release adds up.  `soak` runs a function
+repeatedly, recording the resident set size and a `tracemalloc`
+snapshot after each run, and `soakIsr` applies it to the ISR
+configurations of ``tests/test_bias.py``, ``tests/test_dark.py`` and
+``tests/test_flat.py``.
+"""
+
+__all__ = ["ISR_SOAK_CONFIGS", "currentResidentSetSize", "soak", "checkBudget", "makeIsrRunner", "soakIsr",
+           "main"]
+
+import argparse
+import gc
+import os
+import sys
+import tracemalloc
+
+import numpy as np
+
+import lsst.daf.butler as dafButler
+import lsst.ip.isr as ipIsr
+
+from .benchmarks.utils import formatTable, maxResidentSetSize, writeResults
+from .isrConfigs import makeIsrConfig
+
+# Exposure and makeIsrConfig options of each test configuration.
+ISR_SOAK_CONFIGS = {
+    "bias": (2021052500015, {}),
+    "dark": (2021052500057, {"doDark": True}),
+    "flat": (2021052500080, {"doDark": True, "doFlat": True}),
+}
+
+# Calibrations read for each configuration; the dark and flat are only
+# read when they are applied.
+CALIBRATIONS = ("camera", "bias", "ptc", "linearizer", "crosstalk", "defects")
+
+# Allocations made by the measurement itself.
+_FILTERS = [
+    tracemalloc.Filter(False, __file__),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+
+def currentResidentSetSize():
+    """Return the resident set size of this process in bytes.
+
+    Returns
+    -------
+    rss : `int`
+        Current resident set size, or the peak where ``/proc`` is not
+        available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return maxResidentSetSize()
+
+
+def _growthPerRun(values):
+    # A least-squares slope is less sensitive than the difference of
+    # the ends to allocator pools being grown and trimmed.
+    if len(values) < 2:
+        return 0.0
+    return float(np.polyfit(np.arange(len(values)), values, 1)[0])
+
+
+def _formatSite(traceback):
+    return " <- ".join(f"{frame.filename}:{frame.lineno}" for frame in reversed(list(traceback)))
+
+
+def soak(func, nRuns, warmup=1, nTop=10, nFrames=1):
+    """Run a function repeatedly and measure how memory grows.
+
+    Parameters
+    ----------
+    func : callable
+        Function to run, without arguments.  Its return value is
+        discarded.
+    nRuns : `int`
+        Number of measured runs.
+    warmup : `int`, optional
+        Number of runs before the measurements start, which fill caches
+        and allocator pools.
+    nTop : `int`, optional
+        Number of allocation sites to report.
+    nFrames : `int`, optional
+        Number of frames of each allocation site, if `tracemalloc` is
+        not already tracing.
+
+    Returns
+    -------
+    result : `dict`
+        ``residentSetSize`` and ``traced``: the resident set size and
+        the size of the traced Python allocations after each measured
+        run, in bytes.  ``rssGrowth`` and ``tracedGrowth``: their growth
+        per run, in bytes.  ``topSites``: the allocation sites whose
+        traced size grew most over the measured runs, with the growth in
+        bytes and blocks and the number of runs in which they grew.
+    """
+    wasTracing = tracemalloc.is_tracing()
+    if not wasTracing:
+        tracemalloc.start(nFrames)
+    try:
+        for _ in range(warmup):
+            func()
+        gc.collect()
+        # Exactly one snapshot is alive at each measurement, so the
+        # snapshots do not count as growth.
+        previous = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        rss, traced, sites = [], [], {}
+        for _ in range(nRuns):
+            func()
+            gc.collect()
+            rss.append(currentResidentSetSize())
+            traced.append(tracemalloc.get_traced_memory()[0])
+            snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+            for stat in snapshot.compare_to(previous, "traceback"):
+                site = sites.setdefault(stat.traceback, [0, 0, 0])
+                site[0] += stat.size_diff
+                site[1] += stat.count_diff
+                site[2] += stat.size_diff > 0
+            previous = snapshot
+    finally:
+        if not wasTracing:
+            tracemalloc.stop()
+
+    topSites = sorted(((traceback, site) for traceback, site in sites.items() if site[0] > 0),
+                      key=lambda item: item[1][0], reverse=True)[:nTop]
+    return {
+        "residentSetSize": rss,
+        "traced": traced,
+        "rssGrowth": _growthPerRun(rss),
+        "tracedGrowth": _growthPerRun(traced),
+        "topSites": [{"site": _formatSite(traceback), "sizeGrowth": size, "countGrowth": count,
+                      "growingRuns": growingRuns}
+                     for traceback, (size, count, growingRuns) in topSites],
+    }
+
+
+def checkBudget(result, maxRssGrowth, maxTracedGrowth):
+    """Compare the growth measured by `soak` with a budget.
+
+    Parameters
+    ----------
+    result : `dict`
+        Result of `soak`.
+    maxRssGrowth : `float`
+        Largest allowed resident set size growth per run, in bytes.
+    maxTracedGrowth : `float`
+        Largest allowed traced allocation growth per run, in bytes.
+
+    Returns
+    -------
+    failures : `list` [`str`]
+        Description of each exceeded budget; empty if the growth is
+        within budget.
+    """
+    failures = []
+    for key, budget in (("rssGrowth", maxRssGrowth), ("tracedGrowth", maxTracedGrowth)):
+        if result[key] > budget:
+            failures.append(f"{key} of {result[key]/1024**2:.2f} MB per run exceeds "
+                            f"{budget/1024**2:.2f} MB.")
+    return failures
+
+
+def makeIsrRunner(butler, name):
+    """Make a function that runs ISR with one of the test configurations.
+
+    The raw and the calibrations are read once; each call runs
+    ``IsrTaskLSST`` on a copy of the raw and discards the result.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler whose default collections hold the raws and the
+        certified calibrations.
+    name : `str`
+        Key of `ISR_SOAK_CONFIGS`.
+
+    Returns
+    -------
+    runIsr : callable
+        Function without arguments running ISR once.
+    """
+    exposure, options = ISR_SOAK_CONFIGS[name]
+    dataId = {"instrument": "LATISS", "exposure": exposure, "detector": 0}
+    task = ipIsr.IsrTaskLSST(config=makeIsrConfig(**options))
+    raw = butler.get("raw", dataId)
+    inputs = {calib: butler.get(calib, dataId) for calib in CALIBRATIONS}
+    for calib in ("dark", "flat"):
+        if options.get(f"do{calib.capitalize()}", False):
+            inputs[calib] = butler.get(calib, dataId)
+
+    def runIsr():
+        # ISR modifies the exposure in place.
+        task.run(raw.clone(), **inputs)
+
+    return runIsr
+
+
+def soakIsr(butler, names=tuple(ISR_SOAK_CONFIGS), nRuns=10, warmup=2, nTop=10):
+    """Measure the memory growth of repeated ISR runs.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler whose default collections hold the raws and the
+        certified calibrations.
+    names : iterable [`str`], optional
+        Keys of `ISR_SOAK_CONFIGS` to run, one after the other in this
+        process.
+    nRuns, warmup, nTop : `int`, optional
+        Passed to `soak`.
+
+    Returns
+    -------
+    results : `dict` [`str`, `dict`]
+        Result of `soak` for each configuration.
+    """
+    results = {}
+    for name in names:
+        results[name] = soak(makeIsrRunner(butler, name), nRuns, warmup=warmup, nTop=nTop)
+    return results
+
+
+def main(argv=None):
+    """Command line entry point for the ISR soak test."""
+    parser = argparse.ArgumentParser(
+        description="Run the ISR configurations of the bias, dark and flat tests repeatedly in one process, "
+                    "and fail if the resident set size or the traced Python allocations grow by more than "
+                    "a budget per run.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo with the certified calibrations.")
+    parser.add_argument("--collections", default="LATISS/raw/all,calib/v00,LATISS/calib",
+                        help="Comma separated collections to read the raws and calibrations from.")
+    parser.add_argument("--configs", default=",".join(ISR_SOAK_CONFIGS),
+                        help="Comma separated ISR configurations to run.")
+    parser.add_argument("-n", "--runs", type=int, default=20, help="Number of measured runs per config.")
+    parser.add_argument("--warmup", type=int, default=2, help="Number of runs before measuring.")
+    parser.add_argument("--frames", type=int, default=1, help="Frames recorded for each allocation site.")
+    parser.add_argument("--top", type=int, default=10, help="Number of growing allocation sites to report.")
+    parser.add_argument("--max-rss-growth", type=float, default=16.0,
+                        help="Largest allowed resident set size growth per run, in MB.")
+    parser.add_argument("--max-traced-growth", type=float, default=1.0,
+                        help="Largest allowed traced allocation growth per run, in MB.")
+    parser.add_argument("-o", "--output", default=None, help="YAML file to write the results to.")
+    args = parser.parse_args(argv)
+
+    # Trace from the start, so that sites inside the stack have their
+    # full tracebacks.
+    tracemalloc.start(args.frames)
+    butler = dafButler.Butler(args.repo, collections=args.collections.split(","), writeable=False)
+    results = soakIsr(butler, args.configs.split(","), nRuns=args.runs, warmup=args.warmup, nTop=args.top)
+
+    rows, failed = [], False
+    for name, result in results.items():
+        failures = checkBudget(result, args.max_rss_growth*1024**2, args.max_traced_growth*1024**2)
+        result["failures"] = failures
+        failed |= bool(failures)
+        rows.append({"config": name, "runs": args.runs,
+                     "rssMB": result["residentSetSize"][-1]/1024**2,
+                     "rssGrowthMB": result["rssGrowth"]/1024**2,
+                     "tracedGrowthMB": result["tracedGrowth"]/1024**2,
+                     "status": "FAIL" if failures else "ok"})
+    print(formatTable(rows, ["config", "runs", "rssMB", "rssGrowthMB", "tracedGrowthMB", "status"]))
+    for name, result in results.items():
+        if result["topSites"]:
+            print(f"\nTop growing allocation sites for {name}:")
+            print(formatTable(result["topSites"], ["sizeGrowth", "countGrowth", "growingRuns", "site"]))
+        for failure in result["failures"]:
+            print(f"{name}: {failure}", file=sys.stderr)
+
+    if args.output:
+        writeResults({"configs": results, "maxRssGrowthMB": args.max_rss_growth,
+                      "maxTracedGrowthMB": args.max_traced_growth}, args.output)
+    if failed:
+        sys.exit(1)
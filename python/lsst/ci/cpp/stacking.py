@@ -0,0 +1,51 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Memory-bounded combination of calibration inputs."""
+
+__all__ = ["computeSubregionRows"]
+
+# An Exposure subregion holds a float32 image, an int32 mask and a
+# float32 variance plane.
+EXPOSURE_BYTES_PER_PIXEL = 12
+
+
+def computeSubregionRows(nInputs, width, memoryLimit, bytesPerPixel=EXPOSURE_BYTES_PER_PIXEL):
+    """Number of rows that can be combined at once within a memory limit.
+
+    Parameters
+    ----------
+    nInputs : `int`
+        Number of input exposures being combined.
+    width : `int`
+        Width of each input in pixels.
+    memoryLimit : `int`
+        Memory ceiling for the combination, in bytes.
+    bytesPerPixel : `int`, optional
+        Bytes held per input pixel.
+
+    Returns
+    -------
+    rows : `int`
+        Height of each subregion; at least one row.
+    """
+    # One subregion from every input, plus the combined output.
+    bytesPerRow = (nInputs + 1)*width*bytesPerPixel
+    return max(1, int(memoryLimit // bytesPerRow))
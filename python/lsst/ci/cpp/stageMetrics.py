@@ -0,0 +1,112 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Per-quantum wall time and peak memory of a ci_cpp stage."""
+
+__all__ = ["collectStageMetrics", "main"]
+
+import argparse
+import datetime
+import os
+
+import yaml
+
+import lsst.daf.butler as dafButler
+
+from .outputRuns import getOutputRuns
+
+
+def _parseUtc(value):
+    if value is None:
+        return None
+    # Task metadata records e.g. "2024-05-01T12:00:00.123456+00:00".
+    return datetime.datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+
+def collectStageMetrics(butler, collection):
+    """Summarize the task metadata written by a stage.
+
+    Only the runs the stage wrote itself are read, so the metadata of
+    the upstream stages chained as its inputs is not counted.
+
+    Parameters
+    ----------
+    butler : `lsst.daf.butler.Butler`
+        Butler for the repo.
+    collection : `str`
+        Output collection of the stage, e.g. ``ci_cpp_bfk``.
+
+    Returns
+    -------
+    metrics : `dict`
+        Number of quanta, summed wall time (seconds) and the largest
+        per-quantum peak resident set size (bytes), in total and per
+        task label.
+    """
+    tasks = {}
+    # The newest run comes first in the chain, so a quantum rerun by a
+    # later build is only counted once.
+    runs = getOutputRuns(butler, collection)
+    datasetTypes = butler.registry.queryDatasetTypes("*_metadata") if runs else []
+    for datasetType in datasetTypes:
+        label = datasetType.name[:-len("_metadata")]
+        refs = list(butler.registry.queryDatasets(datasetType, collections=runs, findFirst=True))
+        if not refs:
+            continue
+        record = {"quanta": 0, "wallTime": 0.0, "maxResidentSetSize": 0}
+        for ref in refs:
+            quantum = butler.get(ref).get("quantum")
+            if quantum is None:
+                continue
+            record["quanta"] += 1
+            start, end = _parseUtc(quantum.get("prepUtc")), _parseUtc(quantum.get("endUtc"))
+            if start is not None and end is not None:
+                record["wallTime"] += (end - start).total_seconds()
+            maxRss = quantum.get("endMaxResidentSetSize")
+            if maxRss is not None:
+                record["maxResidentSetSize"] = max(record["maxResidentSetSize"], int(maxRss))
+        tasks[label] = record
+
+    return {
+        "collection": collection,
+        "quanta": sum(record["quanta"] for record in tasks.values()),
+        "wallTime": sum(record["wallTime"] for record in tasks.values()),
+        "maxResidentSetSize": max([record["maxResidentSetSize"] for record in tasks.values()], default=0),
+        "tasks": tasks,
+    }
+
+
+def main(argv=None):
+    """Command line entry point for recording stage metrics."""
+    parser = argparse.ArgumentParser(
+        description="Record the quantum count, wall time and peak memory of a stage from its task metadata.",
+    )
+    parser.add_argument("-r", "--repo", required=True, help="Butler repo.")
+    parser.add_argument("-c", "--collection", required=True, help="Output collection of the stage.")
+    parser.add_argument("-o", "--output", required=True, help="YAML file to write the metrics to.")
+    args = parser.parse_args(argv)
+
+    butler = dafButler.Butler(args.repo)
+    metrics = collectStageMetrics(butler, args.collection)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        yaml.safe_dump(metrics, f, sort_keys=False)
+    print(f"{args.collection}: {metrics['quanta']} quanta, {metrics['wallTime']:.1f} s, "
+          f"{metrics['maxResidentSetSize']/1024**2:.0f} MB peak per quantum.")
@@ -0,0 +1,198 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Run a command line script under a sampling profiler."""
+
+__all__ = ["StackSampler", "writeSpeedscope", "main"]
+
+import argparse
+import json
+import os
+import runpy
+import sys
+import threading
+import time
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+
+class StackSampler:
+    """Periodically sample the Python stack of one thread.
+
+    Parameters
+    ----------
+    interval : `float`, optional
+        Sampling interval in seconds.
+    threadId : `int`, optional
+        Thread to sample.  Defaults to the calling thread.
+    """
+
+    def __init__(self, interval=0.005, threadId=None):
+        self.interval = interval
+        self.threadId = threadId if threadId is not None else threading.get_ident()
+        self.frames = []
+        self.samples = []
+        self.weights = []
+        self.duration = 0.0
+        self._frameIndex = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _indexOf(self, code):
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        index = self._frameIndex.get(key)
+        if index is None:
+            index = len(self.frames)
+            self._frameIndex[key] = index
+            self.frames.append({"name": code.co_name, "file": code.co_filename,
+                                "line": code.co_firstlineno})
+        return index
+
+    def _sample(self):
+        last = time.perf_counter()
+        start = last
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.threadId)
+            now = time.perf_counter()
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    stack.append(self._indexOf(frame.f_code))
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples.append(stack)
+                self.weights.append(now - last)
+            last = now
+        self.duration = time.perf_counter() - start
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="ci_cpp-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def writeSpeedscope(sampler, filename, name):
+    """Write the samples as a speedscope ``sampled`` profile.
+
+    Parameters
+    ----------
+    sampler : `StackSampler`
+        Sampler that has been run.
+    filename : `str`
+        Output JSON file.
+    name : `str`
+        Name of the profile.
+    """
+    document = {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": name,
+        "exporter": "ci_cpp_gen3",
+        "activeProfileIndex": 0,
+        "shared": {"frames": sampler.frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0.0,
+                "endValue": sampler.duration,
+                "samples": sampler.samples,
+                "weights": sampler.weights,
+            }
+        ],
+    }
+    with open(filename, "w") as f:
+        json.dump(document, f)
+
+
+def _runScript(script, args):
+    """Execute a script in this process, returning its exit code."""
+    savedArgv = sys.argv
+    sys.argv = [script, *args]
+    try:
+        runpy.run_path(script, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            return 0
+        return e.code if isinstance(e.code, int) else 1
+    finally:
+        sys.argv = savedArgv
+    return 0
+
+
+def _profileWithPyinstrument(script, args, output, interval, name):
+    from pyinstrument import Profiler
+    from pyinstrument.renderers import SpeedscopeRenderer
+
+    profiler = Profiler(interval=interval)
+    profiler.start()
+    try:
+        code = _runScript(script, args)
+    finally:
+        profiler.stop()
+        with open(output, "w") as f:
+            f.write(profiler.output(renderer=SpeedscopeRenderer()))
+    return code
+
+
+def _profileWithSampler(script, args, output, interval, name):
+    sampler = StackSampler(interval=interval)
+    sampler.start()
+    try:
+        code = _runScript(script, args)
+    finally:
+        sampler.stop()
+        writeSpeedscope(sampler, output, name)
+    return code
+
+
+def main(argv=None):
+    """Command line entry point for the stage profiler."""
+    parser = argparse.ArgumentParser(
+        description="Run a script under a sampling profiler, writing speedscope JSON.",
+    )
+    parser.add_argument("-o", "--output", required=True, help="Profile file to write.")
+    parser.add_argument("-n", "--name", default=None, help="Name to record in the profile.")
+    parser.add_argument("--interval", type=float, default=0.005, help="Sampling interval in seconds.")
+    parser.add_argument("--profiler", choices=("auto", "pyinstrument", "sampler"), default="auto",
+                        help="Profiler to use; auto uses pyinstrument when it is available.")
+    parser.add_argument("script", help="Script to run.")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Arguments for the script.")
+    args = parser.parse_args(argv)
+
+    name = args.name if args.name else os.path.basename(args.output)
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+
+    profiler = args.profiler
+    if profiler == "auto":
+        try:
+            import pyinstrument  # noqa: F401
+            profiler = "pyinstrument"
+        except ImportError:
+            profiler = "sampler"
+
+    if profiler == "pyinstrument":
+        code = _profileWithPyinstrument(args.script, args.args, args.output, args.interval, name)
+    else:
+        code = _profileWithSampler(args.script, args.args, args.output, args.interval, name)
+    sys.exit(code)
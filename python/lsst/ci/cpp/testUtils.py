@@ -0,0 +1,146 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""Shared helpers for the ci_cpp_gen3 tests.
+
+Heavy stack packages are only imported once a test needs them, so that
+collecting (or skipping) the tests stays cheap.
+"""
+
+__all__ = ["DEFAULT_COLLECTIONS", "lazyImport", "getRepoDir", "getTestButler", "getCrRejected"]
+
+import functools
+import importlib
+import os
+import sys
+import types
+
+from lsst.utils import getPackageDir
+
+
+class _LazyModule(types.ModuleType):
+    """Stand-in for a module that imports it on first attribute access."""
+
+    def __getattr__(self, name):
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, name)
+
+
+def lazyImport(name):
+    """Import a module when one of its attributes is first used.
+
+    Parameters
+    ----------
+    name : `str`
+        Fully qualified module name, e.g. ``lsst.afw.math``.
+
+    Returns
+    -------
+    module : `types.ModuleType`
+        The module, if it has already been imported, or a stand-in that
+        imports it when needed.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
+
+
+dafButler = lazyImport("lsst.daf.butler")
+measAlg = lazyImport("lsst.meas.algorithms")
+repair = lazyImport("lsst.pipe.tasks.repair")
+
+# Collections most tests read from.
+DEFAULT_COLLECTIONS = ("LATISS/raw/all", "calib/v00", "LATISS/calib")
+
+
+def getRepoDir():
+    """Return the path to the repo built by the SConscript."""
+    return os.path.join(getPackageDir("ci_cpp_gen3"), "DATA/")
+
+
+@functools.lru_cache(maxsize=None)
+def _getBaseButler():
+    """Construct the process-wide read-only butler."""
+    butler = dafButler.Butler.from_config(getRepoDir(), writeable=False)
+    # Load the dimension universe now, so clones do not each do it.
+    butler.dimensions
+    return butler
+
+
+@functools.lru_cache(maxsize=None)
+def _resolveCollections(collections):
+    """Flatten collection chains once per process."""
+    registry = _getBaseButler().registry
+    resolved = []
+    for name in registry.queryCollections(list(collections), flattenChains=True):
+        if name not in resolved:
+            resolved.append(name)
+    return tuple(resolved)
+
+
+def getTestButler(collections=DEFAULT_COLLECTIONS):
+    """Return a read-only butler for the test repo.
+
+    The underlying butler, its dimension universe and the resolution of
+    each set of collections are shared by every caller in the process;
+    callers get a lightweight clone with their own default collections.
+
+    Parameters
+    ----------
+    collections : iterable [`str`], optional
+        Default collections of the returned butler, in search order.
+
+    Returns
+    -------
+    butler : `lsst.daf.butler.Butler`
+        Read-only butler.
+    """
+    return _getBaseButler().clone(collections=list(_resolveCollections(tuple(collections))))
+
+
+def getCrRejected(exposure, cache):
+    """Return a cosmic-ray rejected copy of an exposure.
+
+    The copy is made and repaired once per exposure and kept in
+    ``cache``, so that it lives only as long as the caller's cache
+    (normally a test class attribute cleared in ``tearDownClass``).
+
+    Parameters
+    ----------
+    exposure : `lsst.afw.image.Exposure`
+        Post-ISR exposure; not modified.
+    cache : `dict`
+        Copies keyed by the id of the original exposure, which is kept
+        alongside so that its id cannot be reused.
+
+    Returns
+    -------
+    crRejected : `lsst.afw.image.Exposure`
+        Copy with cosmic rays masked as ``CR`` and interpolated over.
+        Callers must not modify it.
+    """
+    key = id(exposure)
+    if key not in cache:
+        crRejected = exposure.clone()
+        crRejected.setPsf(measAlg.SingleGaussianPsf(21, 21, 3.0))
+        repair.RepairTask().run(crRejected, keepCRs=False)
+        cache[key] = (exposure, crRejected)
+    return cache[key][1]
@@ -0,0 +1,97 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+import numpy as np
+from astropy.io import fits
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.calibDiff import diffFiles
+
+
+def writeCalib(filename, image, mask=None, variance=None):
+    """Write planes in the layout afw uses for an exposure."""
+    maskHeader = fits.Header({"MP_BAD": 0, "MP_SAT": 1, "MP_NO_DATA": 8})
+    hdus = [fits.PrimaryHDU(),
+            fits.ImageHDU(image.astype(np.float32), name="IMAGE"),
+            fits.ImageHDU(np.zeros(image.shape, dtype=np.int32) if mask is None else mask,
+                          header=maskHeader, name="MASK"),
+            fits.ImageHDU(np.ones(image.shape, dtype=np.float32) if variance is None else variance,
+                          name="VARIANCE")]
+    fits.HDUList(hdus).writeto(filename)
+
+
+class CalibDiffTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        rng = np.random.Generator(np.random.PCG64(12345))
+        self.reference = rng.normal(0.0, 1.0, size=(100, 120))
+        # Two amplifiers side by side, tiles straddling the boundary.
+        self.ampBoxes = {"C00": (0, 0, 60, 100), "C01": (60, 0, 120, 100)}
+
+    def test_identical(self):
+        with tempfile.TemporaryDirectory() as directory:
+            fileA, fileB = os.path.join(directory, "a.fits"), os.path.join(directory, "b.fits")
+            writeCalib(fileA, self.reference)
+            writeCalib(fileB, self.reference)
+            amps, total, tiles = diffFiles(fileA, fileB, self.ampBoxes, tileSize=32)
+
+        self.assertEqual(total["nPixels"], self.reference.size)
+        self.assertEqual(total["maxAbs"], 0.0)
+        self.assertEqual(amps["C00"]["nPixels"] + amps["C01"]["nPixels"], self.reference.size)
+        self.assertEqual(tiles["nOutliers"].shape, (4, 4))
+
+    def test_outliers(self):
+        changed = self.reference.copy()
+        changed[:, 60:] += 0.5
+        changed[10, 70] += 100.0
+        mask = np.zeros(changed.shape, dtype=np.int32)
+        mask[50, 5] = 1
+        changed[50, 5] += 100.0
+        with tempfile.TemporaryDirectory() as directory:
+            fileA, fileB = os.path.join(directory, "a.fits"), os.path.join(directory, "b.fits")
+            writeCalib(fileA, self.reference)
+            writeCalib(fileB, changed, mask=mask)
+            amps, total, tiles = diffFiles(fileA, fileB, self.ampBoxes, tileSize=32)
+
+        # The BAD pixel is ignored, so only C01 changes.
+        self.assertFloatsAlmostEqual(amps["C00"]["maxAbs"], 0.0, atol=1e-5)
+        self.assertEqual(amps["C00"]["nPixels"], 60*100 - 1)
+        self.assertFloatsAlmostEqual(amps["C01"]["mean"], 0.5 + 100.0/(60*100), rtol=1e-5)
+        self.assertEqual(amps["C01"]["nOutliers"], 1)
+        self.assertEqual(total["nOutliers"], 1)
+        self.assertEqual(tiles["nOutliers"][0, 2], 1)
+        self.assertEqual(int(tiles["nOutliers"].sum()), 1)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -22,14 +22,12 @@ import os
 import numpy as np
 import unittest
 
-import lsst.afw.math as afwMath
-import lsst.daf.butler as dafButler
-import lsst.ip.isr as ipIsr
-import lsst.meas.algorithms as measAlg
 import lsst.utils.tests
-from lsst.utils import getPackageDir
+from lsst.ci.cpp.testUtils import getCrRejected, getTestButler, lazyImport
 
-from lsst.pipe.tasks.repair import RepairTask
+afwMath = lazyImport("lsst.afw.math")
+ipIsr = lazyImport("lsst.ip.isr")
+isrConfigs = lazyImport("lsst.ci.cpp.isrConfigs")
 
 LEGACY_MODE = int(os.environ.get("CI_CPP_LEGACY", "0"))
 
@@ -50,29 +48,9 @@ class DarkTestCases(lsst.utils.tests.TestCase):
         Process an independent dark frame through the ISR including
         overscan correction, bias subtraction, dark subtraction.
         """
-        repoDir = os.path.join(getPackageDir("ci_cpp_gen3"), "DATA/")
-        butler = dafButler.Butler(repoDir, collections=['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
+        butler = getTestButler(['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
 
-        config = ipIsr.IsrTaskLSSTConfig()
-        config.doBias = True
-        config.expectWcs = False
-        config.doDefect = True
-        config.doDark = True
-        config.doFlat = False
-        config.doDiffNonLinearCorrection = False
-        config.doBootstrap = False
-        config.doDeferredCharge = False
-        config.doLinearize = True
-        config.doCorrectGains = False
-        config.doApplyGains = True
-        config.doVariance = True
-        config.doSaturation = True
-        config.doSuspect = True
-        config.doCrosstalk = True
-        config.doWidenSaturationTrails = False
-        config.doInterpolate = True
-        config.doSetBadRegions = True
-        config.doBrighterFatter = False
+        config = isrConfigs.makeIsrConfig(doDark=True)
 
         isrTaskLSST = ipIsr.IsrTaskLSST(config=config)
         rawDataId = {"detector": 0, "exposure": 2021052500057, "instrument": "LATISS"}
@@ -99,6 +77,12 @@ class DarkTestCases(lsst.utils.tests.TestCase):
         )
 
         cls.exposure = results.outputExposure
+        cls.crRejectedCache = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        """Release the CR-rejected exposure."""
+        cls.crRejectedCache.clear()
 
     def test_independentFrameLevel(self):
         """Test image mean.
@@ -127,12 +111,11 @@ class DarkTestCases(lsst.utils.tests.TestCase):
         overscan
 
         """
-        ccd = self.exposure.getDetector()
-        for amp in ccd:
-            ampExposure = self.exposure.Factory(self.exposure, amp.getBBox())
-            statControl = afwMath.StatisticsControl(5.0, 5)
-            statControl.setAndMask(self.exposure.mask.getPlaneBitMask(["SAT", "BAD", "NO_DATA"]))
-            sigma = afwMath.makeStatistics(ampExposure.getMaskedImage(),
+        statControl = afwMath.StatisticsControl(5.0, 5)
+        statControl.setAndMask(self.exposure.mask.getPlaneBitMask(["SAT", "BAD", "NO_DATA"]))
+        for amp in self.exposure.getDetector():
+            # Sub-image views share the pixels of the exposure.
+            sigma = afwMath.makeStatistics(self.exposure.maskedImage[amp.getBBox()],
                                            afwMath.STDEVCLIP, statControl).getValue()
             # needs to be < 0.05
             fractionalError = np.abs(sigma - amp.getReadNoise())/amp.getReadNoise()
@@ -150,24 +133,17 @@ class DarkTestCases(lsst.utils.tests.TestCase):
         clipped value.
 
         """
-        crTask = RepairTask()
-        crRejected = self.exposure.clone()
-        psf = measAlg.SingleGaussianPsf(21, 21, 3.0)
-        crRejected.setPsf(psf)
-        crTask.run(crRejected, keepCRs=False)
-
-        ccd = self.exposure.getDetector()
-        for amp in ccd:
-            ampExposure = self.exposure.Factory(self.exposure, amp.getBBox())
-            clipControl = afwMath.StatisticsControl(5.0, 5)
-            clipControl.setAndMask(self.exposure.mask.getPlaneBitMask(["SAT", "BAD", "NO_DATA"]))
-            sigmaClip = afwMath.makeStatistics(ampExposure.getMaskedImage(),
+        crRejected = getCrRejected(self.exposure, self.crRejectedCache)
+        clipControl = afwMath.StatisticsControl(5.0, 5)
+        clipControl.setAndMask(self.exposure.mask.getPlaneBitMask(["SAT", "BAD", "NO_DATA"]))
+        statControl = afwMath.StatisticsControl()
+        statControl.setAndMask(crRejected.mask.getPlaneBitMask(["SAT", "BAD", "NO_DATA", "CR"]))
+
+        for amp in self.exposure.getDetector():
+            sigmaClip = afwMath.makeStatistics(self.exposure.maskedImage[amp.getBBox()],
                                                afwMath.STDEVCLIP, clipControl).getValue()
-
-            crAmp = crRejected.Factory(crRejected, amp.getBBox())
-            statControl = afwMath.StatisticsControl()
-            statControl.setAndMask(self.exposure.mask.getPlaneBitMask(["SAT", "BAD", "NO_DATA", "CR"]))
-            sigma = afwMath.makeStatistics(crAmp.getMaskedImage(), afwMath.STDEV, statControl).getValue()
+            sigma = afwMath.makeStatistics(crRejected.maskedImage[amp.getBBox()],
+                                           afwMath.STDEV, statControl).getValue()
 
             # needs to be < 0.05
             fractionalError = np.abs(sigma - sigmaClip)/sigmaClip
@@ -187,8 +163,7 @@ class DarkTestCasesLegacy(DarkTestCases):
         Process an independent dark frame through the ISR including
         overscan correction, bias subtraction, dark subtraction.
         """
-        repoDir = os.path.join(getPackageDir("ci_cpp_gen3"), "DATA/")
-        butler = dafButler.Butler(repoDir, collections=['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
+        butler = getTestButler(['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
 
         config = ipIsr.IsrTaskConfig()
         config.doSaturation = True
@@ -234,10 +209,11 @@ class DarkTestCasesLegacy(DarkTestCases):
                               defects=cls.defects)
 
         cls.exposure = results.outputExposure
+        cls.crRejectedCache = {}
 
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
-    pass
+    ignore_regexps = [r"/?gen3.sqlite3$"]
 
 
 def setup_module(module):
@@ -0,0 +1,74 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+
+import numpy as np
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.dataQuery import compressExposures, formatExposureQuery, getDataQuery
+
+
+class DataQueryTestCases(lsst.utils.tests.TestCase):
+    def test_format(self):
+        expList = [2021052500080, 2021052500015, 2021052500016, 2021052500017, 2021052500019,
+                   2021052500057]
+        self.assertEqual(
+            getDataQuery(expList),
+            "instrument='LATISS' AND detector=0 AND "
+            "exposure IN ( 2021052500015..2021052500019,2021052500057,2021052500080 ) "
+            "AND exposure NOT IN ( 2021052500018 )"
+        )
+        self.assertEqual(formatExposureQuery([5, 6, 7], maxGap=0), "exposure IN ( 5..7 )")
+        # Without ranges the query is the plain list the SConscript
+        # always wrote.
+        self.assertEqual(getDataQuery([5, 7], maxGap=0),
+                         "instrument='LATISS' AND detector=0 AND exposure IN ( 5,7 )")
+        with self.assertRaises(ValueError):
+            formatExposureQuery([])
+
+    def test_exact(self):
+        rng = np.random.Generator(np.random.PCG64(12345))
+        for maxGap in (0, 1, 2, 5):
+            expList = [int(exp) for exp in 2021052500000 + np.flatnonzero(rng.random(2000) > 0.3)]
+            ranges, excluded = compressExposures(expList, maxGap=maxGap)
+            selected = set()
+            for first, last in ranges:
+                selected.update(range(first, last + 1))
+            self.assertEqual(selected - set(excluded), set(expList))
+            if maxGap == 0:
+                self.assertEqual(excluded, [])
+            # The expression is far shorter than the list.
+            self.assertLess(len(formatExposureQuery(expList, maxGap=maxGap)),
+                            len(",".join(str(exp) for exp in expList)))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,88 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.distributed import QuantumScheduler, splitPipetaskArgs
+
+
+class QuantumSchedulerTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        # Two ISR quanta per exposure feed a combine, which feeds a
+        # verification quantum.
+        self.dependencies = {
+            "isr1": set(), "isr2": set(), "isr3": set(), "isr4": set(),
+            "combine": {"isr1", "isr2", "isr3", "isr4"},
+            "verify": {"combine"},
+        }
+
+    def test_order(self):
+        scheduler = QuantumScheduler(self.dependencies)
+        order = []
+        while not scheduler.done:
+            batch = scheduler.takeBatch(1, maxBatch=1)
+            self.assertEqual(len(batch), 1)
+            order.extend(batch)
+            scheduler.finish(batch)
+        self.assertEqual(set(order[:4]), {"isr1", "isr2", "isr3", "isr4"})
+        self.assertEqual(order[4:], ["combine", "verify"])
+
+    def test_batches(self):
+        scheduler = QuantumScheduler(self.dependencies)
+        # Ready quanta are shared between the free workers.
+        first = scheduler.takeBatch(3)
+        second = scheduler.takeBatch(2)
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertEqual(scheduler.nReady, 1)
+        scheduler.finish(first + second)
+        # The combine waits for the last ISR quantum.
+        self.assertEqual(scheduler.takeBatch(2), ["isr4"])
+        self.assertEqual(scheduler.takeBatch(2), [])
+        scheduler.finish(["isr4"])
+        self.assertEqual(scheduler.takeBatch(4), ["combine"])
+        self.assertFalse(scheduler.done)
+
+    def test_pipetaskArgs(self):
+        args = ["run", "-j", "4", "-d", "instrument='LATISS' AND detector=0", "-b", "DATA/butler.yaml",
+                "-i", "LATISS/raw/all,LATISS/calib", "-o", "ci_cpp_bias", "-p", "cpBias.yaml",
+                "--register-dataset-types", "-c", "cpBiasIsr:doCrosstalk=False"]
+        butlerConfig, jobs, qgraphArgs = splitPipetaskArgs(args)
+        self.assertEqual(butlerConfig, "DATA/butler.yaml")
+        self.assertEqual(jobs, 4)
+        self.assertEqual(qgraphArgs, ["-d", "instrument='LATISS' AND detector=0",
+                                      "-i", "LATISS/raw/all,LATISS/calib", "-o", "ci_cpp_bias",
+                                      "-p", "cpBias.yaml", "-c", "cpBiasIsr:doCrosstalk=False"])
+        with self.assertRaises(ValueError):
+            splitPipetaskArgs(["run", "-p", "cpBias.yaml"])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
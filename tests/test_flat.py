@@ -22,11 +22,12 @@ import os
 import numpy as np
 import unittest
 
-import lsst.afw.math as afwMath
-import lsst.daf.butler as dafButler
-import lsst.ip.isr as ipIsr
 import lsst.utils.tests
-from lsst.utils import getPackageDir
+from lsst.ci.cpp.testUtils import getTestButler, lazyImport
+
+afwMath = lazyImport("lsst.afw.math")
+ipIsr = lazyImport("lsst.ip.isr")
+isrConfigs = lazyImport("lsst.ci.cpp.isrConfigs")
 
 LEGACY_MODE = int(os.environ.get("CI_CPP_LEGACY", "0"))
 
@@ -47,29 +48,9 @@ class FlatTestCases(lsst.utils.tests.TestCase):
         Process an independent dark frame through the ISR including
         overscan correction, bias subtraction, dark subtraction.
         """
-        repoDir = os.path.join(getPackageDir("ci_cpp_gen3"), "DATA/")
-        butler = dafButler.Butler(repoDir, collections=['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
+        butler = getTestButler(['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
 
-        config = ipIsr.IsrTaskLSSTConfig()
-        config.doBias = True
-        config.expectWcs = False
-        config.doDefect = True
-        config.doDark = True
-        config.doFlat = True
-        config.doDiffNonLinearCorrection = False
-        config.doBootstrap = False
-        config.doDeferredCharge = False
-        config.doLinearize = True
-        config.doCorrectGains = False
-        config.doApplyGains = True
-        config.doVariance = True
-        config.doSaturation = True
-        config.doSuspect = True
-        config.doCrosstalk = True
-        config.doWidenSaturationTrails = False
-        config.doInterpolate = True
-        config.doSetBadRegions = True
-        config.doBrighterFatter = False
+        config = isrConfigs.makeIsrConfig(doDark=True, doFlat=True)
 
         isrTaskLSST = ipIsr.IsrTaskLSST(config=config)
         rawDataId = {"detector": 0, "exposure": 2021052500080, "instrument": "LATISS"}
@@ -129,8 +110,7 @@ class FlatTestCasesLegacy(FlatTestCases):
         Process an independent dark frame through the ISR including
         overscan correction, bias subtraction, dark subtraction.
         """
-        repoDir = os.path.join(getPackageDir("ci_cpp_gen3"), "DATA/")
-        butler = dafButler.Butler(repoDir, collections=['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
+        butler = getTestButler(['LATISS/raw/all', 'calib/v00', 'LATISS/calib'])
 
         config = ipIsr.IsrTaskConfig()
         config.doSaturation = True
@@ -195,7 +175,7 @@ class FlatTestCasesLegacy(FlatTestCases):
 
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
-    pass
+    ignore_regexps = [r"/?gen3.sqlite3$"]
 
 
 def setup_module(module):
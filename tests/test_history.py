@@ -0,0 +1,88 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import datetime
+import importlib.util
+import os
+import tempfile
+import time
+import unittest
+import yaml
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.history import collectStageRows, flattenStats, findDrifts, readHistory, writeBuild
+
+
+class HistoryTestCases(lsst.utils.tests.TestCase):
+    def test_flattenStats(self):
+        stats = {"AMP": {"C10": {"NOISE": 7.9, "CR_NOISE": 7.92}},
+                 "SUCCESS": False,
+                 "FAILURES": ["C10 PTC_NOISE", "C12 PTC_GAIN"]}
+        self.assertEqual(flattenStats(stats), {"AMP.C10.NOISE": 7.9, "AMP.C10.CR_NOISE": 7.92,
+                                               "SUCCESS": 0.0, "FAILURES.count": 2.0})
+
+    def test_collectStageRows(self):
+        with tempfile.TemporaryDirectory() as metricsDir:
+            for stage in ("bias", "dark"):
+                with open(os.path.join(metricsDir, f"{stage}.yaml"), "w") as f:
+                    yaml.safe_dump({"quanta": 4, "wallTime": 12.5, "maxResidentSetSize": 2**30}, f)
+            buildStart = time.time()
+            # The dark was not rerun by this build.
+            os.utime(os.path.join(metricsDir, "dark.yaml"), (buildStart - 3600, buildStart - 3600))
+
+            rows = collectStageRows(metricsDir)
+            self.assertEqual({row[1] for row in rows}, {"bias", "dark"})
+
+            rows = collectStageRows(metricsDir, since=buildStart - 60)
+            self.assertEqual(rows, [("stage", "bias", "quanta", 4.0), ("stage", "bias", "wallTime", 12.5),
+                                    ("stage", "bias", "maxResidentSetSize", float(2**30))])
+
+    @unittest.skipIf(importlib.util.find_spec("pyarrow") is None, "pyarrow is not available.")
+    def test_drift(self):
+        start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        # A shift well inside the 4.0 test tolerance, but large compared
+        # with the build to build scatter.
+        noise = [7.90, 7.91, 7.89, 7.90, 7.92, 7.90, 7.88, 7.91, 7.90, 7.89, 8.20, 8.21, 8.19]
+        with tempfile.TemporaryDirectory() as historyDir:
+            for i, value in enumerate(noise):
+                writeBuild(historyDir, f"build{i}",
+                           [("verify", "verifyBiasDetStats", "AMP.C10.NOISE", value),
+                            ("verify", "verifyBiasDetStats", "AMP.C11.NOISE", 7.7 + 0.01*(i % 3))],
+                           timestamp=start + datetime.timedelta(days=i))
+            series = readHistory(historyDir, "verifyBiasDetStats/*NOISE")
+            self.assertEqual(len(series["verifyBiasDetStats/AMP.C10.NOISE"]), len(noise))
+
+            drifts = findDrifts(series)
+            self.assertEqual([drift["metric"] for drift in drifts], ["verifyBiasDetStats/AMP.C10.NOISE"])
+            self.assertAlmostEqual(drifts[0]["latest"], 8.20)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
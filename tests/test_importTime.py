@@ -0,0 +1,75 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import glob
+import os
+import unittest
+
+import yaml
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.importTime import checkBudget, measureImportTime, parseImportTime
+
+TESTS_DIR = os.path.abspath(os.path.dirname(__file__))
+
+
+class ImportTimeTestCases(lsst.utils.tests.TestCase):
+    def test_parseImportTime(self):
+        text = ("import time: self [us] | cumulative | imported package\n"
+                "import time:       150 |        150 |   numpy.core\n"
+                "import time:      2000 |       2150 | numpy\n")
+        self.assertEqual(parseImportTime(text), [("numpy.core", 150e-6, 150e-6, 1),
+                                                 ("numpy", 2000e-6, 2150e-6, 0)])
+
+    def test_checkBudget(self):
+        budget = {"deferred": ["lsst.afw"], "seconds": {"default": 2.0, "test_slow": 5.0}}
+        report = {"seconds": 3.0, "packages": {}, "modules": ["lsst.afw.image", "numpy"]}
+        self.assertEqual(len(checkBudget("test_bias", report, budget)), 2)
+        self.assertEqual(len(checkBudget("test_slow", report, budget)), 1)
+        self.assertEqual(checkBudget("test_bias", report, budget, checkSeconds=False),
+                         ["test_bias imports lsst.afw (lsst.afw.image) at collection time."])
+
+    def test_budget(self):
+        """Collecting a test module does not import the deferred packages.
+
+        The time budget depends on the machine, so it is only checked
+        by bin/ci_cpp_import_time.py.
+        """
+        with open(os.path.join(TESTS_DIR, "data", "importBudget.yaml")) as f:
+            budget = yaml.safe_load(f)
+        for filename in sorted(glob.glob(os.path.join(TESTS_DIR, "test_*.py"))):
+            name = os.path.splitext(os.path.basename(filename))[0]
+            with self.subTest(module=name):
+                self.assertEqual(checkBudget(name, measureImportTime(filename), budget, checkSeconds=False),
+                                 [])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
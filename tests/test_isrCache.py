@@ -0,0 +1,85 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import tempfile
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.testUtils import lazyImport
+
+afwImage = lazyImport("lsst.afw.image")
+isrCache = lazyImport("lsst.ci.cpp.isrCache")
+
+
+class IsrCacheTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.cache = isrCache.IsrCache(self.tmpDir.name)
+        self.keyArgs = (2021052500198, 0, {"doBias": True, "cacheDirectory": "a"}, ["id1", "id2"],
+                        {"lsst.ip.isr": "1.0"})
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def test_key(self):
+        key = self.cache.makeKey(*self.keyArgs)
+        exposure, detector, config, inputIds, versions = self.keyArgs
+        # Ignored fields and the order of the inputs do not matter.
+        self.assertEqual(key, self.cache.makeKey(exposure, detector, {"doBias": True}, inputIds[::-1],
+                                                 versions))
+        self.assertNotEqual(key, self.cache.makeKey(exposure, detector, {"doBias": False}, inputIds,
+                                                    versions))
+        self.assertNotEqual(key, self.cache.makeKey(exposure, detector, config, inputIds,
+                                                    {"lsst.ip.isr": "2.0"}))
+
+    def test_roundTrip(self):
+        key = self.cache.makeKey(*self.keyArgs)
+        self.assertIsNone(self.cache.get(key))
+
+        exposure = afwImage.ExposureF(8, 4)
+        exposure.image.array[:, :] = 3.0
+        self.cache.put(key, {"outputExposure": exposure, "outputStatistics": {"MEDIAN": 3.0}})
+        self.assertEqual(self.cache.keys(), [key])
+        cached = self.cache.get(key)
+        self.assertImagesEqual(cached["outputExposure"].image, exposure.image)
+        self.assertEqual(cached["outputStatistics"], {"MEDIAN": 3.0})
+
+    def test_unsupportedOutput(self):
+        key = self.cache.makeKey(*self.keyArgs)
+        with self.assertRaises(TypeError):
+            self.cache.put(key, {"outputStatistics": {"MEDIAN": 3.0}, "other": object()})
+        self.assertIsNone(self.cache.get(key))
+        self.assertEqual(self.cache.keys(), [])
+        self.assertEqual(os.listdir(os.path.dirname(self.cache.path(key))), [])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
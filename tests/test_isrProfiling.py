@@ -0,0 +1,117 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import threading
+import types
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.testUtils import lazyImport
+
+# The module also holds the task, which needs ip_isr.
+isrProfiling = lazyImport("lsst.ci.cpp.isrProfiling")
+
+
+class _Steps:
+    def add(self, a, b):
+        return a + b
+
+    def countDown(self, n):
+        return 0 if n == 0 else self.countDown(n - 1)
+
+
+def _scale(value):
+    return 2*value
+
+
+# Stands in for a module of ISR functions.
+functions = types.SimpleNamespace(scale=_scale)
+
+
+class IsrSubstepProfilerTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.steps = _Steps()
+        self.namespace = {"steps": self.steps, "functions": functions}
+        self.substeps = {"add": "steps.add", "countDown": "steps.countDown", "scale": "functions.scale",
+                         "missing": "steps.missing", "unknown": "other.add"}
+
+    def assertRestored(self):
+        self.assertNotIn("add", vars(self.steps))
+        self.assertNotIn("countDown", vars(self.steps))
+        self.assertIs(functions.scale, _scale)
+
+    def test_records(self):
+        profiler = isrProfiling.IsrSubstepProfiler(self.substeps)
+        with profiler.attach(self.namespace):
+            self.assertEqual(self.steps.add(1, 2), 3)
+            self.assertEqual(self.steps.add(3, 4), 7)
+            self.assertEqual(functions.scale(5), 10)
+            # Recursive calls count once.
+            self.assertEqual(self.steps.countDown(3), 0)
+        self.assertRestored()
+
+        profile = profiler.getProfile()
+        self.assertEqual(set(profile["substeps"]), {"add", "scale", "countDown"})
+        self.assertEqual(profile["substeps"]["add"]["calls"], 2)
+        self.assertEqual(profile["substeps"]["scale"]["calls"], 1)
+        self.assertEqual(profile["substeps"]["countDown"]["calls"], 1)
+        for record in profile["substeps"].values():
+            self.assertLessEqual(record["wallTime"], profile["total"]["wallTime"])
+        self.assertGreaterEqual(profile["total"]["peakAllocated"], 0)
+
+    def test_nested(self):
+        outer = isrProfiling.IsrSubstepProfiler(self.substeps, traceMalloc=False)
+        inner = isrProfiling.IsrSubstepProfiler({"scale": "functions.scale"}, traceMalloc=False)
+        with outer.attach(self.namespace):
+            with inner.attach(self.namespace):
+                functions.scale(1)
+            functions.scale(2)
+            self.assertIsNot(functions.scale, _scale)
+        self.assertRestored()
+        self.assertEqual(inner.getProfile()["substeps"]["scale"]["calls"], 1)
+        self.assertEqual(outer.getProfile()["substeps"]["scale"]["calls"], 1)
+
+    def test_otherThreads(self):
+        profiler = isrProfiling.IsrSubstepProfiler(self.substeps, traceMalloc=False)
+        results = []
+        with profiler.attach(self.namespace):
+            thread = threading.Thread(target=lambda: results.append(functions.scale(3)))
+            thread.start()
+            thread.join()
+            functions.scale(4)
+        self.assertRestored()
+        # Calls from threads without a profiler run, but are not
+        # recorded.
+        self.assertEqual(results, [6])
+        self.assertEqual(profiler.getProfile()["substeps"]["scale"]["calls"], 1)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
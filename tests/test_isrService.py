@@ -0,0 +1,137 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import pickle
+import socket
+import tempfile
+import threading
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.testUtils import lazyImport
+
+isrService = lazyImport("lsst.ci.cpp.isrService")
+
+
+class _Exposure:
+    def __init__(self, exposure):
+        self.exposure = exposure
+
+    def writeFits(self, path):
+        with open(path, "w") as f:
+            f.write(str(self.exposure))
+
+
+class _Service:
+    """Stand-in for `IsrService` that fails on negative exposures."""
+
+    def __init__(self):
+        self.dataIds = []
+
+    def process(self, dataId):
+        self.dataIds.append(dataId)
+        if dataId["exposure"] < 0:
+            raise LookupError(f"No raw for {dataId}.")
+        return _Exposure(dataId["exposure"]), {"raw": 1.0, "calibrations": 2.0, "isr": 3.0}
+
+
+class ProtocolTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.left, self.right = socket.socketpair()
+
+    def tearDown(self):
+        self.left.close()
+        self.right.close()
+
+    def test_roundTrip(self):
+        # Larger than one receive chunk.
+        message = {"payload": b"x" * (3 << 20), "timing": {"isr": 1.5}}
+        sender = threading.Thread(target=isrService._send, args=(self.left, message))
+        sender.start()
+        self.assertEqual(isrService._recv(self.right), message)
+        sender.join()
+
+        isrService._send(self.left, {})
+        self.assertEqual(isrService._recv(self.right), {})
+
+    def test_closed(self):
+        self.left.close()
+        self.assertIsNone(isrService._recv(self.right))
+
+    def test_truncated(self):
+        payload = pickle.dumps({"exposure": 1})
+        self.left.sendall(isrService._HEADER.pack(len(payload)) + payload[:-1])
+        self.left.close()
+        with self.assertRaises(ConnectionError):
+            isrService._recv(self.right)
+
+
+class IsrClientTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpDir.name, "isr.sock")
+        self.service = _Service()
+        self.server = threading.Thread(target=isrService.serve, args=(self.service, self.path), daemon=True)
+        self.server.start()
+
+    def tearDown(self):
+        self.server.join(timeout=10)
+        self.tmpDir.cleanup()
+
+    def test_requests(self):
+        output = os.path.join(self.tmpDir.name, "5.fits")
+        with isrService.IsrClient(self.path, timeout=10.0) as client:
+            exposure, timing = client.process(4, detector=1)
+            self.assertEqual(exposure.exposure, 4)
+            self.assertEqual(timing, {"raw": 1.0, "calibrations": 2.0, "isr": 3.0})
+
+            exposure, _ = client.process(5, output=output)
+            self.assertIsNone(exposure)
+            with open(output) as f:
+                self.assertEqual(f.read(), "5")
+
+            # A failed request leaves the connection usable.
+            with self.assertRaisesRegex(RuntimeError, "LookupError"):
+                client.process(-1)
+            client.shutdown()
+
+        self.server.join(timeout=10)
+        self.assertFalse(self.server.is_alive())
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(self.service.dataIds, [
+            {"instrument": "LATISS", "exposure": 4, "detector": 1},
+            {"instrument": "LATISS", "exposure": 5, "detector": 0},
+            {"instrument": "LATISS", "exposure": -1, "detector": 0},
+        ])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,121 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+
+import numpy as np
+from scipy.interpolate import Akima1DInterpolator
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.testUtils import lazyImport
+
+# The module also holds the task, which needs cp_pipe.
+linearity = lazyImport("lsst.ci.cpp.linearity")
+
+
+class BatchedLinearityTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        # Sixteen amplifiers with slightly different gains, an offset
+        # and a quadratic nonlinearity, sampled like the PTC flat pairs.
+        rng = np.random.Generator(np.random.PCG64(12345))
+        nAmp, nPoint = 16, 40
+        self.noise = 5.0
+        self.illumination = np.tile(np.linspace(0.1, 30.0, nPoint), (nAmp, 1))
+        gain = rng.uniform(900.0, 1100.0, size=(nAmp, 1))
+        linear = gain*self.illumination
+        self.signal = linear*(1.0 - 2e-7*linear) + 30.0 + rng.normal(0.0, self.noise, size=(nAmp, nPoint))
+        self.signal[3, 7] += 500.0
+        self.mask = np.ones(self.signal.shape, dtype=bool)
+        self.mask[2, 5] = False
+        self.kwargs = {"nKnots": 5, "minLinearAdu": 2000.0, "maxLinearAdu": 20000.0}
+
+    def test_evaluateSplines(self):
+        # The interpolation must be the one the Linearizer applies.
+        rng = np.random.Generator(np.random.PCG64(54321))
+        nodes = np.tile(np.linspace(0.0, 50000.0, 6), (3, 1))
+        values = rng.normal(0.0, 50.0, size=nodes.shape)
+        values[1] = 0.0
+        signal = rng.uniform(-1000.0, 52000.0, size=(3, 40))
+        spline = linearity.evaluateSplines(signal, nodes, values)
+        for i in range(len(nodes)):
+            expected = Akima1DInterpolator(nodes[i], values[i])(signal[i], extrapolate=True)
+            self.assertFloatsAlmostEqual(spline[i], expected, atol=1e-9)
+
+    def test_linearizes(self):
+        fit = linearity.fitLinearitySplines(self.illumination, self.signal, self.mask, **self.kwargs)
+        self.assertFalse(fit["mask"][2, 5])
+        # The outlier is rejected, and the kept points are linear once
+        # corrected, within the noise and the relative precision that
+        # the fit minimizes.
+        self.assertFalse(fit["mask"][3, 7])
+        kept = fit["mask"] & (self.signal > self.kwargs["minLinearAdu"])
+        self.assertTrue(np.all(np.abs(fit["residuals"][kept])
+                               < 6.0*self.noise + 2e-3*self.signal[kept]))
+        corrected = (self.signal - linearity.evaluateSplines(self.signal, fit["nodes"], fit["values"])
+                     - fit["offset"][:, np.newaxis])
+        self.assertFloatsAlmostEqual(corrected[kept], (fit["slopes"][:, :1]*self.illumination)[kept],
+                                     rtol=2e-3, atol=6.0*self.noise)
+
+        # The spline is zero at zero signal and averages to zero.
+        self.assertTrue(np.all(fit["values"][:, 0] == 0.0))
+        grid = np.linspace(0.0, 1.0, 100)*fit["nodes"][:, -1:]
+        spline = linearity.evaluateSplines(grid, fit["nodes"], fit["values"])
+        self.assertFloatsAlmostEqual(np.mean(spline, axis=1), 0.0, atol=1e-3)
+
+        # Every fit parameter has an uncertainty.
+        self.assertEqual(fit["params"].shape, fit["paramsErr"].shape)
+        self.assertTrue(np.all(np.isfinite(fit["paramsErr"])))
+        self.assertTrue(np.all(fit["paramsErr"][:, 1:] > 0.0))
+
+    def test_offsetAndGroups(self):
+        # Every other point is taken with a different illumination
+        # scale, as with different photodiode settings.
+        groups = np.zeros(self.signal.shape, dtype=int)
+        groups[:, ::2] = 1
+        illumination = np.where(groups == 1, self.illumination/1.5, self.illumination)
+        fit = linearity.fitLinearitySplines(illumination, self.signal, self.mask, groups=groups,
+                                            **self.kwargs)
+        self.assertEqual(fit["slopes"].shape, (len(self.signal), 2))
+        self.assertFloatsAlmostEqual(fit["slopes"][:, 1]/fit["slopes"][:, 0], 1.5, rtol=2e-3)
+
+        fit = linearity.fitLinearitySplines(self.illumination, self.signal, self.mask, fitOffset=False,
+                                            **self.kwargs)
+        self.assertTrue(np.all(fit["offset"] == 0.0))
+        self.assertTrue(np.all(fit["paramsErr"][:, -1] == 0.0))
+
+    def test_deterministic(self):
+        first = linearity.fitLinearitySplines(self.illumination, self.signal, self.mask, **self.kwargs)
+        second = linearity.fitLinearitySplines(self.illumination, self.signal, self.mask, **self.kwargs)
+        for key in first:
+            self.assertTrue(np.array_equal(first[key], second[key], equal_nan=True), msg=key)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -21,16 +21,23 @@
 import os
 import unittest
 
-import lsst.daf.butler as dafButler
+import numpy as np
+
 import lsst.utils.tests
 
-from lsst.afw.cameraGeom import Camera
-from lsst.afw.image import Exposure
-from lsst.ip.isr import (Defects, BrighterFatterKernel, CrosstalkCalib, DeferredChargeCalib, Linearizer,
-                         PhotonTransferCurveDataset, IsrCalib)
 from lsst.utils import getPackageDir
+from lsst.ci.cpp.testUtils import getTestButler, lazyImport
+
+cameraGeom = lazyImport("lsst.afw.cameraGeom")
+afwImage = lazyImport("lsst.afw.image")
+ipIsr = lazyImport("lsst.ip.isr")
+linearity = lazyImport("lsst.ci.cpp.linearity")
 
 LEGACY_MODE = int(os.environ.get("CI_CPP_LEGACY", "0"))
+ISR_PROFILE = int(os.environ.get("CI_CPP_ISR_PROFILE", "0"))
+ISR_CACHE = os.environ.get("CI_CPP_ISR_CACHE", "0")
+PRUNE = int(os.environ.get("CI_CPP_PRUNE", "0"))
+BATCHED_LINEARIZER = int(os.environ.get("CI_CPP_BATCHED_LINEARIZER", "1"))
 
 
 class OutputTestCases(lsst.utils.tests.TestCase):
@@ -46,9 +53,8 @@ class OutputTestCases(lsst.utils.tests.TestCase):
         overscan correction and bias subtraction
 
         """
-        repoDir = os.path.join(getPackageDir("ci_cpp_gen3"), "DATA/")
         cls.collections = ["LATISS/raw/all", "calib/v00", "LATISS/calib"]
-        cls.butler = dafButler.Butler(repoDir, collections=cls.collections)
+        cls.butler = getTestButler(cls.collections)
         cls.rawDataId = {'detector': 0, 'exposure': 2021052500015, 'instrument': 'LATISS'}
 
     def getExpectedProduct(self, datasetType, dataId=None, collections=None, checkMetadata=True):
@@ -85,7 +91,7 @@ class OutputTestCases(lsst.utils.tests.TestCase):
                 "SEQCKSUM": "2552520002",
             }
             # IsrCalib types additionally have normalized metadata.
-            if isinstance(product, IsrCalib):
+            if isinstance(product, ipIsr.IsrCalib):
                 expectedMetadata["SEQFILE"] = None
                 expectedMetadata["DETECTOR"] = 0
                 expectedMetadata["DET_NAME"] = "RXX_S00"
@@ -98,17 +104,17 @@ class OutputTestCases(lsst.utils.tests.TestCase):
 
     def test_cameraOutput(self):
         # This confirms curated calibrations were written correctly.
-        self.assertIsInstance(self.getExpectedProduct('camera', checkMetadata=False), Camera)
+        self.assertIsInstance(self.getExpectedProduct('camera', checkMetadata=False), cameraGeom.Camera)
 
     def test_biasOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('bias'), Exposure)
+        self.assertIsInstance(self.getExpectedProduct('bias'), afwImage.Exposure)
 
     def test_darkOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('dark'), Exposure)
+        self.assertIsInstance(self.getExpectedProduct('dark'), afwImage.Exposure)
 
     def test_flatOutput(self):
         flat = self.getExpectedProduct('flat')
-        self.assertIsInstance(flat, Exposure)
+        self.assertIsInstance(flat, afwImage.Exposure)
         self.assertIn("FLATSRC", flat.metadata)
         self.assertEqual(flat.metadata["FLATSRC"], "DOME")
 
@@ -116,28 +122,51 @@ class OutputTestCases(lsst.utils.tests.TestCase):
         # TODO DM-50078: Add metadata checking.
         self.assertIsInstance(
             self.getExpectedProduct('crosstalk', checkMetadata=False),
-            CrosstalkCalib,
+            ipIsr.CrosstalkCalib,
         )
 
     def test_ptcOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('ptc'), PhotonTransferCurveDataset)
+        self.assertIsInstance(self.getExpectedProduct('ptc'), ipIsr.PhotonTransferCurveDataset)
 
     @unittest.skipIf(LEGACY_MODE == 0, "Skipping BFK test until we have IsrTaskLSST BFK pipelines.")
     def test_bfkOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('bfk'), BrighterFatterKernel)
+        self.assertIsInstance(self.getExpectedProduct('bfk'), ipIsr.BrighterFatterKernel)
 
     @unittest.skipIf(LEGACY_MODE == 0, "Skipping individual gain output test.")
     def test_gainOutput(self):
         # These are certified on a per-exposure basis.
         dataId = {'detector': 0, 'exposure': 2021052500079, 'instrument': 'LATISS'}
         self.assertIsInstance(self.getExpectedProduct('cpPtcPartial', dataId=dataId),
-                              PhotonTransferCurveDataset)
+                              ipIsr.PhotonTransferCurveDataset)
 
     def test_linearityOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('linearizer'), Linearizer)
+        self.assertIsInstance(self.getExpectedProduct('linearizer'), ipIsr.Linearizer)
+
+    @unittest.skipIf(LEGACY_MODE > 0 or BATCHED_LINEARIZER == 0,
+                     "Skipping batched linearizer test; CI_CPP_BATCHED_LINEARIZER is 0.")
+    def test_linearityBatchedOutput(self):
+        # The batched solve must agree with cp_pipe's solve on the same
+        # PTC, to the fractional deviation allowed by the verification.
+        dataId = {'detector': 0, 'instrument': 'LATISS'}
+        reference = self.getExpectedProduct('linearizer', dataId=dataId, collections=['ci_cpp_linearizer'])
+        batched = self.getExpectedProduct('linearizer', dataId=dataId,
+                                          collections=['ci_cpp_linearizerBatched'])
+        self.assertEqual(batched.linearityType, reference.linearityType)
+        for amp, linearityType in reference.linearityType.items():
+            if linearityType != "Spline":
+                continue
+            nodes, values = np.split(np.asarray(reference.linearityCoeffs[amp]), 2)
+            batchedNodes, batchedValues = np.split(np.asarray(batched.linearityCoeffs[amp]), 2)
+            signal = np.linspace(nodes[1], min(nodes[-1], batchedNodes[-1]), 100)
+            expected = linearity.evaluateSplines(signal[np.newaxis], nodes[np.newaxis], values[np.newaxis])
+            corrections = linearity.evaluateSplines(signal[np.newaxis], batchedNodes[np.newaxis],
+                                                    batchedValues[np.newaxis])
+            self.assertLess(np.max(np.abs(corrections - expected)/signal), 1e-3, msg=amp)
+            self.assertTrue(np.all(np.isfinite(batched.fitParamsErr[amp])), msg=amp)
+            self.assertTrue(np.any(batched.fitParamsErr[amp] > 0.0), msg=amp)
 
     def test_defectsOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('defects'), Defects)
+        self.assertIsInstance(self.getExpectedProduct('defects'), ipIsr.Defects)
 
     def test_scienceOutput(self):
         # This needs one of the actual exposures and the specific
@@ -150,7 +179,7 @@ class OutputTestCases(lsst.utils.tests.TestCase):
             collections=collections,
             checkMetadata=False,
         )
-        self.assertIsInstance(exp, Exposure)
+        self.assertIsInstance(exp, afwImage.Exposure)
 
         metadata = exp.metadata
 
@@ -172,11 +201,79 @@ class OutputTestCases(lsst.utils.tests.TestCase):
                 # We expect DATASEC warnings and nothing else.
                 self.assertIn("DATASEC", rec.message)
 
+    @unittest.skipIf(LEGACY_MODE > 0 or ISR_PROFILE == 0, "Skipping ISR profile test; profiling not enabled.")
+    def test_isrProfileOutput(self):
+        dataId = {'detector': 0, 'exposure': 2021052500198, 'instrument': 'LATISS'}
+        collections = ['ci_cpp_science']
+        profile = self.getExpectedProduct('isrProfile', dataId=dataId, collections=collections,
+                                          checkMetadata=False)
+        self.checkIsrProfile(profile, ["overscan"])
+
+    @unittest.skipIf(LEGACY_MODE > 0 or ISR_PROFILE == 0, "Skipping ISR profile test; profiling not enabled.")
+    def test_verifyFlatIsrProfileOutput(self):
+        dataId = {'detector': 0, 'exposure': 2021052500080, 'instrument': 'LATISS'}
+        collections = ['ci_cpv_flat']
+        profile = self.getExpectedProduct('verifyFlatIsrProfile', dataId=dataId, collections=collections,
+                                          checkMetadata=False)
+        self.checkIsrProfile(profile, ["overscan", "brighterFatter", "deferredCharge"])
+
+    def checkIsrProfile(self, profile, substeps):
+        """Check a profile written by ProfiledIsrTaskLSST.
+
+        Parameters
+        ----------
+        profile : `dict`
+            The profile.
+        substeps : `list` [`str`]
+            Substeps that must have been profiled.
+        """
+        self.assertIn("substeps", profile)
+        self.assertGreater(profile["total"]["wallTime"], 0.0)
+        if profile.get("cached", False):
+            # The ISR outputs were read from CI_CPP_ISR_CACHE.
+            return
+        for substep in substeps:
+            self.assertIn(substep, profile["substeps"])
+        for record in profile["substeps"].values():
+            self.assertGreater(record["calls"], 0)
+            self.assertLessEqual(record["wallTime"], profile["total"]["wallTime"])
+
+    @unittest.skipIf(LEGACY_MODE > 0 or ISR_CACHE == "0", "Skipping ISR cache test; caching not enabled.")
+    def test_isrCacheOutput(self):
+        from lsst.ci.cpp.isrCache import IsrCache
+
+        cacheDir = ISR_CACHE
+        if cacheDir == "1":
+            cacheDir = os.path.join(getPackageDir("ci_cpp_gen3"), "DATA", "isrCache")
+        cache = IsrCache(cacheDir)
+        entries = [cache.get(key) for key in cache.keys()]
+        cachedExposures = {entry["outputExposure"].getInfo().getVisitInfo().id: entry["outputExposure"]
+                           for entry in entries if "outputExposure" in entry}
+
+        # Every science exposure must match its cached copy.
+        refs = list(self.butler.registry.queryDatasets('postISRCCD', collections=['ci_cpp_science'],
+                                                       findFirst=True))
+        self.assertGreater(len(refs), 0)
+        for ref in refs:
+            exposure = self.butler.get(ref)
+            visitId = exposure.getInfo().getVisitInfo().id
+            self.assertIn(visitId, cachedExposures)
+            self.assertImagesAlmostEqual(cachedExposures[visitId].image, exposure.image)
+
+    @unittest.skipIf(LEGACY_MODE > 0 or PRUNE == 0, "Skipping prune test; pruning not enabled.")
+    def test_prunedIntermediates(self):
+        # The per-exposure products are gone, but the certified
+        # calibration is still readable.
+        refs = list(self.butler.registry.queryDatasets('cpBiasProc', collections=['ci_cpp_bias'],
+                                                       findFirst=False))
+        self.assertEqual(len(refs), 0)
+        self.assertIsInstance(self.getExpectedProduct('bias'), afwImage.Exposure)
+
     def test_skyOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('sky'), Exposure)
+        self.assertIsInstance(self.getExpectedProduct('sky'), afwImage.Exposure)
 
     def test_ctiOutput(self):
-        self.assertIsInstance(self.getExpectedProduct('cti'), DeferredChargeCalib)
+        self.assertIsInstance(self.getExpectedProduct('cti'), ipIsr.DeferredChargeCalib)
 
     @unittest.skipIf(LEGACY_MODE == 0, "Skipping CTI test until we have IsrTaskLSST CTI pipelines.")
     def test_ctiProcOutput(self):
@@ -185,7 +282,7 @@ class OutputTestCases(lsst.utils.tests.TestCase):
         dataId = {'detector': 0, 'exposure': 2021052500077, 'instrument': 'LATISS'}
         collections = ['ci_cpp_ctiProc']
         self.assertIsInstance(self.getExpectedProduct('postISRCCD', dataId=dataId, collections=collections),
-                              Exposure)
+                              afwImage.Exposure)
 
 
 class MemoryTester(lsst.utils.tests.MemoryTestCase):
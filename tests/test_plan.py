@@ -0,0 +1,81 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.plan import findCriticalPath, predictStage
+
+
+class PlanTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.metrics = {"quanta": 6, "wallTime": 80.0, "maxResidentSetSize": 2**30,
+                        "tasks": {"isr": {"quanta": 4, "wallTime": 40.0},
+                                  "combine": {"quanta": 2, "wallTime": 40.0}}}
+
+    def test_predictStage(self):
+        # Four ISR quanta over three processes take two rounds of 10 s,
+        # and the single combine quantum one round of 20 s.
+        prediction = predictStage({"isr": 4, "combine": 1}, self.metrics, jobs=3, overhead=5.0)
+        self.assertEqual(prediction["quanta"], 5)
+        self.assertAlmostEqual(prediction["wallTime"], 5.0 + 2*10.0 + 20.0)
+        self.assertEqual(prediction["maxResidentSetSize"], 3*2**30)
+
+        # Without a graph, the quanta of the last run are used.
+        prediction = predictStage(None, self.metrics, jobs=8)
+        self.assertEqual(prediction["quanta"], 6)
+        self.assertAlmostEqual(prediction["wallTime"], 10.0 + 20.0)
+        self.assertEqual(prediction["maxResidentSetSize"], 4*2**30)
+
+        # Tasks that were not run before add nothing.
+        prediction = predictStage({"isr": 4, "measure": 4}, self.metrics, jobs=4)
+        self.assertAlmostEqual(prediction["wallTime"], 10.0)
+
+        prediction = predictStage({"isr": 4}, None, jobs=4)
+        self.assertEqual(prediction, {"quanta": 4, "wallTime": None, "maxResidentSetSize": None})
+        self.assertEqual(predictStage(None, None, jobs=4)["quanta"], None)
+
+    def test_findCriticalPath(self):
+        stages = {"bias": {"dependsOn": []},
+                  "dark": {"dependsOn": ["bias"]},
+                  "defects": {"dependsOn": ["bias"]},
+                  "flat": {"dependsOn": ["dark", "defects"]},
+                  "crosstalk": {"dependsOn": []}}
+        wallTimes = {"bias": 10.0, "dark": 30.0, "defects": 50.0, "flat": 20.0, "crosstalk": 70.0}
+        self.assertEqual(findCriticalPath(stages, wallTimes), (["bias", "defects", "flat"], 80.0))
+
+        # Stages without a prediction count as free.
+        wallTimes["defects"] = None
+        self.assertEqual(findCriticalPath(stages, wallTimes), (["crosstalk"], 70.0))
+        self.assertEqual(findCriticalPath({}, {}), ([], 0.0))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,104 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import types
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.prune import getKeepRules, pruneStage, selectPrunable
+
+
+class _Butler:
+    """Butler holding dataset type names per RUN collection."""
+
+    def __init__(self, chains, contents):
+        self.contents = contents
+        self.pruned = []
+        self.registry = types.SimpleNamespace(
+            queryCollections=lambda collection, flattenChains, collectionTypes: chains[collection],
+            queryDatasetTypes=lambda expression: [types.SimpleNamespace(name=name)
+                                                  for names in contents.values() for name in names],
+            queryDatasets=self.queryDatasets,
+        )
+
+    def queryDatasets(self, name, collections, findFirst):
+        return [(run, name) for run in collections if name in self.contents[run]]
+
+    def getURIs(self, ref):
+        return None, {}
+
+    def pruneDatasets(self, refs, disassociate, unstore, purge):
+        self.pruned.extend(refs)
+
+
+class PruneTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.datasetTypeNames = ["bias", "cpBiasIsrExp", "cpBiasIsrExp.wcs", "cpBiasIsr_config",
+                                 "cpBiasIsr_log", "cpBiasIsr_metadata", "packages", "cpBiasProc",
+                                 "cpBiasIsrStats"]
+
+    def test_keepRules(self):
+        keep = getKeepRules("bias")
+        self.assertIn("bias", keep)
+        self.assertIn("*_metadata", keep)
+        # Stages without their own rule keep the dataset named after them.
+        self.assertIn("crosstalk", getKeepRules("crosstalk"))
+        self.assertEqual(getKeepRules("bias", ["cpBiasProc"])[-1], "cpBiasProc")
+
+    def test_selectPrunable(self):
+        # Provenance and the certified calibration are kept, and the
+        # component follows its parent.
+        self.assertEqual(selectPrunable(self.datasetTypeNames, getKeepRules("bias")),
+                         ["cpBiasIsrExp", "cpBiasIsrStats", "cpBiasProc"])
+        # Extra --keep patterns are shell-style.
+        self.assertEqual(selectPrunable(self.datasetTypeNames, getKeepRules("bias", ["cpBiasIsr*"])),
+                         ["cpBiasProc"])
+        self.assertEqual(selectPrunable(self.datasetTypeNames, getKeepRules("bias", ["*"])), [])
+
+    def test_inputsKept(self):
+        """Only the runs the stage wrote are pruned, not its inputs."""
+        chains = {"ci_cpp_dark": ["ci_cpp_dark/20240501T000000Z", "ci_cpp_bias/20240430T000000Z",
+                                  "ci_cpp_biasBootstrap/run", "LATISS/raw/all", "LATISS/calib/unbounded"]}
+        contents = {"ci_cpp_dark/20240501T000000Z": ["dark", "cpDarkIsrExp", "cpDarkIsr_metadata"],
+                    "ci_cpp_bias/20240430T000000Z": ["bias", "cpBiasIsrExp"],
+                    "ci_cpp_biasBootstrap/run": ["bias"],
+                    "LATISS/raw/all": ["raw"],
+                    "LATISS/calib/unbounded": ["camera"]}
+        butler = _Butler(chains, contents)
+        summary = pruneStage(butler, "dark", dryRun=True)
+        self.assertEqual(list(summary), ["cpDarkIsrExp"])
+        self.assertEqual(butler.pruned, [])
+
+        pruneStage(butler, "dark")
+        self.assertEqual(butler.pruned, [("ci_cpp_dark/20240501T000000Z", "cpDarkIsrExp")])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,113 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import contextlib
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.repoSync import REGISTRY_FILE, checkRepo, readState, restoreRepo, syncRepo
+
+
+class RepoSyncTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.ramRoot = os.path.join(self.directory.name, "ram")
+        self.persistRoot = os.path.join(self.directory.name, "persist")
+        os.makedirs(self.ramRoot)
+        self.registry = os.path.join(self.ramRoot, REGISTRY_FILE)
+        with contextlib.closing(sqlite3.connect(self.registry)) as db:
+            db.execute("CREATE TABLE file_datastore_records (path TEXT)")
+            db.commit()
+        self.write("butler.yaml")
+        self.write("metrics/bias.yaml")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, relPath, record=False):
+        path = os.path.join(self.ramRoot, relPath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(relPath)
+        if record:
+            with contextlib.closing(sqlite3.connect(self.registry)) as db:
+                db.execute("INSERT INTO file_datastore_records VALUES (?)", (relPath,))
+                db.commit()
+
+    def unrecord(self, relPath):
+        with contextlib.closing(sqlite3.connect(self.registry)) as db:
+            db.execute("DELETE FROM file_datastore_records WHERE path = ?", (relPath,))
+            db.commit()
+        os.remove(os.path.join(self.ramRoot, relPath))
+
+    def persisted(self, relPath):
+        return os.path.exists(os.path.join(self.persistRoot, relPath))
+
+    def test_sync(self):
+        self.write("ci_cpp_bias/run/bias/bias_0.fits", record=True)
+        # Written by a running pipetask, but not yet in the registry.
+        self.write("ci_cpp_bias/run/bias/bias_1.fits")
+        syncRepo(self.ramRoot, self.persistRoot)
+        self.assertEqual(readState(self.persistRoot)["state"], "complete")
+        self.assertEqual(checkRepo(self.persistRoot), [])
+        for relPath in ("butler.yaml", "metrics/bias.yaml", "ci_cpp_bias/run/bias/bias_0.fits"):
+            self.assertTrue(self.persisted(relPath), msg=relPath)
+        self.assertFalse(self.persisted("ci_cpp_bias/run/bias/bias_1.fits"))
+
+        # Once registered it is copied, and pruned datasets are removed.
+        self.write("ci_cpp_bias/run/bias/bias_1.fits", record=True)
+        self.unrecord("ci_cpp_bias/run/bias/bias_0.fits")
+        syncRepo(self.ramRoot, self.persistRoot)
+        self.assertEqual(checkRepo(self.persistRoot), [])
+        self.assertTrue(self.persisted("ci_cpp_bias/run/bias/bias_1.fits"))
+        self.assertFalse(self.persisted("ci_cpp_bias/run/bias/bias_0.fits"))
+
+    def test_restore(self):
+        self.write("ci_cpp_bias/run/bias/bias_0.fits", record=True)
+        restored = os.path.join(self.directory.name, "restored")
+        # Nothing to restore before the first sync.
+        self.assertFalse(restoreRepo(self.persistRoot, restored))
+        syncRepo(self.ramRoot, self.persistRoot)
+        self.assertTrue(restoreRepo(self.persistRoot, restored))
+        self.assertTrue(os.path.exists(os.path.join(restored, "ci_cpp_bias/run/bias/bias_0.fits")))
+        self.assertEqual(checkRepo(restored), [])
+        # A populated directory is left alone.
+        self.assertFalse(restoreRepo(self.persistRoot, restored))
+
+        os.remove(os.path.join(self.persistRoot, "ci_cpp_bias/run/bias/bias_0.fits"))
+        with self.assertRaises(RuntimeError):
+            restoreRepo(self.persistRoot, os.path.join(self.directory.name, "other"))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
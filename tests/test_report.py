@@ -0,0 +1,137 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import sys
+import tempfile
+import types
+import unittest
+import uuid
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.report import IncrementalReportBuilder, computeCollectionHash, loadEntryPoint
+
+
+class _Registry:
+    """Registry of chains of RUN collections holding lists of
+    (dataset type, id).
+    """
+
+    def __init__(self, chains, contents):
+        self.chains = chains
+        self.contents = contents
+
+    def queryCollections(self, collection, flattenChains, collectionTypes):
+        return self.chains.get(collection, [collection])
+
+    def queryDatasets(self, datasetType, collections, findFirst):
+        return [types.SimpleNamespace(datasetType=types.SimpleNamespace(name=name), id=datasetId)
+                for run in collections for name, datasetId in self.contents[run]]
+
+
+class _Builder(IncrementalReportBuilder):
+    """Builder writing a placeholder page instead of running cp_verify."""
+
+    def runReport(self, collection, fragmentDir):
+        with open(os.path.join(fragmentDir, "index.html"), "w") as f:
+            f.write(collection)
+
+
+class ReportTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.contents = {"ci_cpv_bias/20240501T000000Z": [("verifyBiasStats", uuid.uuid4()),
+                                                          ("verifyBiasDetStats", uuid.uuid4())],
+                         "ci_cpv_dark/20240501T000000Z": [("verifyDarkStats", uuid.uuid4())],
+                         "ci_cpp_bias/20240430T000000Z": [("bias", uuid.uuid4())],
+                         "LATISS/raw/all": [("raw", uuid.uuid4())]}
+        # The verification chains end with their pipetask inputs.
+        inputs = ["ci_cpp_bias/20240430T000000Z", "LATISS/raw/all"]
+        chains = {"ci_cpv_bias": ["ci_cpv_bias/20240501T000000Z"] + inputs,
+                  "ci_cpv_dark": ["ci_cpv_dark/20240501T000000Z"] + inputs}
+        self.butler = types.SimpleNamespace(registry=_Registry(chains, self.contents))
+
+    def test_collectionHash(self):
+        contentHash = computeCollectionHash(self.butler, "ci_cpv_bias")
+        # The order the registry returns datasets in does not matter.
+        self.contents["ci_cpv_bias/20240501T000000Z"].reverse()
+        self.assertEqual(computeCollectionHash(self.butler, "ci_cpv_bias"), contentHash)
+        # Nor do changes to the inputs.
+        self.contents["ci_cpp_bias/20240430T000000Z"].append(("bias", uuid.uuid4()))
+        self.contents["LATISS/raw/all"].append(("raw", uuid.uuid4()))
+        self.assertEqual(computeCollectionHash(self.butler, "ci_cpv_bias"), contentHash)
+        self.contents["ci_cpv_bias/20240501T000000Z"].append(("verifyBiasExpStats", uuid.uuid4()))
+        self.assertNotEqual(computeCollectionHash(self.butler, "ci_cpv_bias"), contentHash)
+
+    def test_fragments(self):
+        with tempfile.TemporaryDirectory() as outputDir:
+            builder = _Builder("repo", outputDir)
+            collections = ["ci_cpv_bias", "ci_cpv_dark"]
+            self.assertEqual(builder.build(collections, butler=self.butler), collections)
+            self.assertEqual(builder.build(collections, butler=self.butler), [])
+            with open(os.path.join(outputDir, "index.html")) as f:
+                index = f.read()
+            self.assertIn("fragments/ci_cpv_dark/index.html", index)
+
+            # Only the collection that changed is rebuilt; certifying a
+            # new input rebuilds nothing.
+            self.contents["ci_cpv_dark/20240501T000000Z"].append(("verifyDarkDetStats", uuid.uuid4()))
+            self.contents["ci_cpp_bias/20240430T000000Z"].append(("bias", uuid.uuid4()))
+            self.assertEqual(builder.build(collections, butler=self.butler), ["ci_cpv_dark"])
+            self.assertEqual(builder.build(collections, force=True, butler=self.butler), collections)
+
+            # A dropped collection loses its fragment.
+            self.assertEqual(builder.build(["ci_cpv_bias"], butler=self.butler), [])
+            self.assertEqual(builder.readManifest().keys(), {"ci_cpv_bias"})
+            self.assertFalse(os.path.exists(builder.fragmentPath("ci_cpv_dark")))
+
+    def test_entryPoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, "ciCppFakeReport.py"), "w") as f:
+                f.write("import sys\n\nargv = []\n\n\n"
+                        "def main():\n    argv.extend(sys.argv[1:])\n    sys.exit(0)\n")
+            sys.path.insert(0, directory)
+            try:
+                builder = IncrementalReportBuilder("repo", directory, entryPoint="ciCppFakeReport:main")
+                builder.runReport("ci_cpv_bias", "fragment")
+                self.assertEqual(sys.modules["ciCppFakeReport"].argv,
+                                 ["-r", "repo", "-O", "fragment", "-c", "ci_cpv_bias"])
+            finally:
+                sys.path.remove(directory)
+                sys.modules.pop("ciCppFakeReport", None)
+
+        # A missing report function fails loudly.
+        with self.assertRaises(RuntimeError):
+            loadEntryPoint("ciCppNoSuchModule:main")
+        with self.assertRaises(RuntimeError):
+            loadEntryPoint("lsst.ci.cpp.report:noSuchFunction")
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
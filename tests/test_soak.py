@@ -0,0 +1,94 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.testUtils import getTestButler, lazyImport
+
+# The module also runs ISR, which needs ip_isr.
+soak = lazyImport("lsst.ci.cpp.soak")
+
+LEGACY_MODE = int(os.environ.get("CI_CPP_LEGACY", "0"))
+# The ISR soak takes minutes, so "scons tests" only runs it on request;
+# "scons soakTest" runs the full soak.
+SOAK_MODE = int(os.environ.get("CI_CPP_SOAK", "0"))
+
+# Allowed growth per ISR run.  A leaked LATISS exposure would be well
+# over 100 MB.
+MAX_RSS_GROWTH = 16*1024**2
+MAX_TRACED_GROWTH = 1024**2
+
+
+class SoakTestCases(lsst.utils.tests.TestCase):
+    def test_leakDetected(self):
+        leaked = []
+
+        def leak():
+            leaked.append(b"x"*(4*1024**2))
+
+        result = soak.soak(leak, 5)
+        self.assertEqual(len(result["residentSetSize"]), 5)
+        self.assertAlmostEqual(result["tracedGrowth"], 4*1024**2, delta=0.1*1024**2)
+        self.assertGreater(result["rssGrowth"], 2*1024**2)
+        self.assertEqual(len(soak.checkBudget(result, MAX_RSS_GROWTH, MAX_TRACED_GROWTH)), 1)
+
+        top = result["topSites"][0]
+        self.assertIn(__file__, top["site"])
+        self.assertEqual(top["countGrowth"], 5)
+        self.assertEqual(top["growingRuns"], 5)
+
+    def test_noLeak(self):
+        def noLeak():
+            return [b"x"*(4*1024**2) for _ in range(4)]
+
+        result = soak.soak(noLeak, 5)
+        self.assertLess(abs(result["tracedGrowth"]), 64*1024)
+        self.assertEqual(soak.checkBudget(result, MAX_RSS_GROWTH, MAX_TRACED_GROWTH), [])
+
+
+@unittest.skipIf(LEGACY_MODE > 0, "Skipping new tests in legacy mode.")
+@unittest.skipIf(SOAK_MODE == 0, "Skipping ISR soak; CI_CPP_SOAK not set.")
+class IsrSoakTestCases(lsst.utils.tests.TestCase):
+    def test_isrSoak(self):
+        """Repeated ISR runs with the bias, dark and flat test configurations
+        do not grow memory.
+        """
+        butler = getTestButler(["LATISS/raw/all", "calib/v00", "LATISS/calib"])
+        results = soak.soakIsr(butler, nRuns=4, warmup=1)
+        for name, result in results.items():
+            with self.subTest(config=name):
+                self.assertEqual(soak.checkBudget(result, MAX_RSS_GROWTH, MAX_TRACED_GROWTH), [],
+                                 msg=result["topSites"])
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    ignore_regexps = [r"/?gen3.sqlite3$"]
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
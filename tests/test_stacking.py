@@ -0,0 +1,131 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import os
+import numpy as np
+import unittest
+import yaml
+
+import lsst.utils.tests
+from lsst.utils import getPackageDir
+from lsst.ci.cpp.testUtils import getTestButler, lazyImport
+
+afwMath = lazyImport("lsst.afw.math")
+
+LEGACY_MODE = int(os.environ.get("CI_CPP_LEGACY", "0"))
+STACK_MEMORY_MB = float(os.environ.get("CI_CPP_STACK_MEMORY_MB", "0"))
+
+
+@unittest.skipIf(LEGACY_MODE > 0 or STACK_MEMORY_MB == 0,
+                 "Skipping low memory stacking tests; CI_CPP_STACK_MEMORY_MB not set.")
+class StackingTestCases(lsst.utils.tests.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        """Setup butler."""
+        cls.butler = getTestButler(["calib/v00", "LATISS/calib"])
+        cls.dataId = {"instrument": "LATISS", "detector": 0}
+
+    def readTolerances(self, calibType, delta):
+        """Per-amp, per-statistic tolerances scaled from the goldens.
+
+        The goldens in ``tests/data/<calibType>Det.yaml`` are compared
+        with an absolute ``delta`` in ``tests/test_verification.py``.
+        The calibration products are not in the same units (the flat
+        is normalized, the dark is per second), so each statistic is
+        allowed the same fractional difference that ``delta`` is of
+        its golden value.
+
+        Parameters
+        ----------
+        calibType : `str`
+            Calibration to read the goldens of.
+        delta : `float`
+            Tolerance used against the goldens.
+
+        Returns
+        -------
+        tolerances : `dict` [`str`, `dict` [`str`, `float`]]
+            Fractional tolerance, keyed by amp name and statistic.
+        """
+        fileLocation = os.path.join(getPackageDir("ci_cpp_gen3"), "tests", "data", f"{calibType}Det.yaml")
+        with open(fileLocation) as f:
+            golden = yaml.safe_load(f)
+        return {ampName: {statName: delta/abs(stats[statName]) for statName in ("MEAN", "NOISE")}
+                for ampName, stats in golden["AMP"].items()}
+
+    def compareCombinations(self, calibType, dataId, delta):
+        """Compare the chunked combination with the certified product.
+
+        Parameters
+        ----------
+        calibType : `str`
+            Calibration to compare.
+        dataId : `dict`
+            Data id of the calibration.
+        delta : `float`
+            Tolerance used against the goldens in
+            ``tests/test_verification.py``; see `readTolerances`.
+        """
+        inMemory = self.butler.get(calibType, dataId=dataId, collections=["calib/v00"])
+        chunked = self.butler.get(calibType, dataId=dataId, collections=[f"ci_cpp_{calibType}LowMemory"])
+        tolerances = self.readTolerances(calibType, delta)
+
+        statControl = afwMath.StatisticsControl(5.0, 5)
+        statControl.setAndMask(inMemory.mask.getPlaneBitMask(["SAT", "BAD", "NO_DATA"]))
+        for amp in inMemory.getDetector():
+            bbox = amp.getBBox()
+            statsA = afwMath.makeStatistics(inMemory.maskedImage[bbox],
+                                            afwMath.MEANCLIP | afwMath.STDEVCLIP, statControl)
+            statsB = afwMath.makeStatistics(chunked.maskedImage[bbox],
+                                            afwMath.MEANCLIP | afwMath.STDEVCLIP, statControl)
+            for statName, statistic in (("MEAN", afwMath.MEANCLIP), ("NOISE", afwMath.STDEVCLIP)):
+                expected = statsA.getValue(statistic)
+                self.assertAlmostEqual(expected, statsB.getValue(statistic),
+                                       delta=tolerances[amp.getName()][statName]*abs(expected),
+                                       msg=f"{calibType} {amp.getName()} {statName}")
+
+        # The same inputs are combined, so the pixels should agree to
+        # floating point precision.
+        good = np.isfinite(inMemory.image.array) & np.isfinite(chunked.image.array)
+        self.assertFloatsAlmostEqual(inMemory.image.array[good], chunked.image.array[good],
+                                     rtol=1e-5, atol=1e-4)
+
+    def test_biasLowMemory(self):
+        self.compareCombinations("bias", self.dataId, delta=4.0)
+
+    def test_darkLowMemory(self):
+        self.compareCombinations("dark", self.dataId, delta=4.0)
+
+    def test_flatLowMemory(self):
+        dataId = dict(self.dataId, physical_filter="RG610~empty")
+        self.compareCombinations("flat", dataId, delta=4.0)
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    ignore_regexps = [r"/?gen3.sqlite3$"]
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -0,0 +1,128 @@
+# This file is part of ci_cpp_gen3.
+#
+# Developed for the LSST Data Management System.
+# This product includes software developed by the LSST Project
+# (https://www.lsst.org).
+# See the COPYRIGHT file at the top-level directory of this distribution
+# for details of code ownership.
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+import json
+import os
+import tempfile
+import time
+import unittest
+
+import lsst.utils.tests
+
+from lsst.ci.cpp.stageProfiler import SPEEDSCOPE_SCHEMA, StackSampler, main, writeSpeedscope
+
+
+def _busyLoop(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += 1
+    return total
+
+
+class StageProfilerTestCases(lsst.utils.tests.TestCase):
+    def setUp(self):
+        self.tmpDir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpDir.cleanup()
+
+    def checkProfile(self, filename, name):
+        """Check that a file is a valid speedscope sampled profile.
+
+        Returns
+        -------
+        names : `set` [`str`]
+            Names of the sampled functions.
+        """
+        with open(filename) as f:
+            document = json.load(f)
+        self.assertEqual(document["$schema"], SPEEDSCOPE_SCHEMA)
+        self.assertEqual(document["name"], name)
+        frames = document["shared"]["frames"]
+        for frame in frames:
+            self.assertEqual(set(frame), {"name", "file", "line"})
+        self.assertEqual(len(document["profiles"]), 1)
+        self.assertEqual(document["activeProfileIndex"], 0)
+
+        profile = document["profiles"][0]
+        self.assertEqual(profile["type"], "sampled")
+        self.assertEqual(profile["unit"], "seconds")
+        self.assertGreater(len(profile["samples"]), 0)
+        self.assertEqual(len(profile["samples"]), len(profile["weights"]))
+        for stack in profile["samples"]:
+            self.assertGreater(len(stack), 0)
+            for index in stack:
+                self.assertTrue(0 <= index < len(frames))
+        for weight in profile["weights"]:
+            self.assertGreater(weight, 0.0)
+        # The weights tile the profile without overlapping.
+        self.assertLessEqual(sum(profile["weights"]), profile["endValue"] - profile["startValue"] + 1e-6)
+        return {frames[index]["name"] for stack in profile["samples"] for index in stack}
+
+    def test_sampler(self):
+        sampler = StackSampler(interval=0.001)
+        sampler.start()
+        try:
+            _busyLoop(0.2)
+        finally:
+            sampler.stop()
+        self.assertGreaterEqual(sampler.duration, 0.2)
+        # Frames are shared between samples.
+        self.assertEqual(len({(frame["name"], frame["file"], frame["line"]) for frame in sampler.frames}),
+                         len(sampler.frames))
+        # Stacks run from the outermost frame to the sampled one.
+        busy = [stack for stack in sampler.samples if sampler.frames[stack[-1]]["name"] == "_busyLoop"]
+        self.assertGreater(len(busy), 0)
+        self.assertIn("test_sampler", [sampler.frames[index]["name"] for index in busy[0]])
+
+        filename = os.path.join(self.tmpDir.name, "busy.json")
+        writeSpeedscope(sampler, filename, "busy")
+        self.assertIn("_busyLoop", self.checkProfile(filename, "busy"))
+
+    def test_main(self):
+        script = os.path.join(self.tmpDir.name, "script.py")
+        with open(script, "w") as f:
+            f.write("import sys\n"
+                    "import time\n"
+                    "def spin():\n"
+                    "    end = time.perf_counter() + 0.2\n"
+                    "    while time.perf_counter() < end:\n"
+                    "        pass\n"
+                    "spin()\n"
+                    "sys.exit(int(sys.argv[1]))\n")
+        output = os.path.join(self.tmpDir.name, "profiles", "script.json")
+        with self.assertRaises(SystemExit) as context:
+            main(["-o", output, "--profiler", "sampler", "--interval", "0.001", script, "3"])
+        self.assertEqual(context.exception.code, 3)
+        self.assertIn("spin", self.checkProfile(output, "script.json"))
+
+
+class MemoryTester(lsst.utils.tests.MemoryTestCase):
+    pass
+
+
+def setup_module(module):
+    lsst.utils.tests.init()
+
+
+if __name__ == "__main__":
+    lsst.utils.tests.init()
+    unittest.main()
@@ -23,21 +23,22 @@ import numpy as np
 import unittest
 import yaml
 
-import lsst.daf.butler as dafButler
 import lsst.utils.tests
 
 from lsst.utils import getPackageDir
+from lsst.ci.cpp.testUtils import getTestButler
 
 LEGACY_MODE = int(os.environ.get("CI_CPP_LEGACY", "0"))
+BATCHED_LINEARIZER = int(os.environ.get("CI_CPP_BATCHED_LINEARIZER", "1"))
+SMOKE_MODE = int(os.environ.get("CI_CPP_SMOKE", "0"))
 
 
 class VerificationTestCases(lsst.utils.tests.TestCase):
     @classmethod
     def setUpClass(cls):
         """Setup butler."""
-        repoDir = os.path.join(getPackageDir("ci_cpp_gen3"), "DATA/")
         cls.collections = ["LATISS/raw/all", "calib/v00", "LATISS/calib"]
-        cls.butler = dafButler.Butler(repoDir, collections=cls.collections)
+        cls.butler = getTestButler(cls.collections)
         cls.rawDataId = {'detector': 0, 'exposure': 2021052500015, 'instrument': 'LATISS'}
 
     def getExpectedProduct(self, datasetType, dataId=None, collections=None):
@@ -77,14 +78,20 @@ class VerificationTestCases(lsst.utils.tests.TestCase):
         Parameters
         ----------
         filename : `str`
-            File to read.  The subdirectory will be prepended.
+            File to read.  The subdirectory will be prepended.  In
+            smoke mode the test is skipped if there is no smoke golden.
 
         Returns
         -------
         result : `dict`
             The archived result dictionary.
         """
-        if LEGACY_MODE > 0:
+        if SMOKE_MODE > 0:
+            fileLocation = os.path.join(getPackageDir("ci_cpp_gen3"), "tests", "data", "smoke", filename)
+            if not os.path.exists(fileLocation):
+                self.skipTest(f"No smoke golden {filename}; generate the smoke goldens from a smoke build "
+                              "as described in tests/data/smoke/README.rst.")
+        elif LEGACY_MODE > 0:
             fileLocation = os.path.join(
                 getPackageDir("ci_cpp_gen3"),
                 "tests",
@@ -100,6 +107,30 @@ class VerificationTestCases(lsst.utils.tests.TestCase):
 
         return result
 
+    def getDelta(self, filename, delta):
+        """Return the tolerance of a comparison with a golden.
+
+        Parameters
+        ----------
+        filename : `str`
+            Golden file being compared.
+        delta : `float`
+            Tolerance for the full golden.
+
+        Returns
+        -------
+        delta : `float`
+            ``delta``, or in smoke mode the tolerance of the smoke golden
+            from ``tests/data/smoke/tolerances.yaml``.
+        """
+        if SMOKE_MODE > 0:
+            fileLocation = os.path.join(getPackageDir("ci_cpp_gen3"), "tests", "data", "smoke",
+                                        "tolerances.yaml")
+            with open(fileLocation, "r") as file:
+                tolerances = yaml.safe_load(file)
+            delta = tolerances.get(filename, delta)
+        return delta
+
     def assertNumbersEqual(self, inputA, inputB, msg, delta=0.2):
         if not (np.isnan(inputA) and np.isnan(inputB)):
             self.assertAlmostEqual(inputA, inputB, delta=delta, msg=msg)
@@ -142,25 +173,29 @@ class VerificationTestCases(lsst.utils.tests.TestCase):
             Dictionary mapping butler data product to comparison yaml
             file.
         delta : `float`, optional
-            Delta to use for floating point comparisons.
+            Delta to use for floating point comparisons.  In smoke mode
+            each file uses its own tolerance instead; see `getDelta`.
         """
         if 'run' in componentMap:
             runStatDataType, runStatFile = componentMap['run']
             runStats = self.getExpectedProduct(runStatDataType, dataId=dataId, collections=collections)
             expectation = self.readExpectation(runStatFile)
-            self.assertYamlEqual(runStats, expectation, "run level", delta=delta)
+            self.assertYamlEqual(runStats, expectation, "run level",
+                                 delta=self.getDelta(runStatFile, delta))
 
         if 'exp' in componentMap:
             expStatDataType, expStatFile = componentMap['exp']
             expStats = self.getExpectedProduct(expStatDataType, dataId=dataId, collections=collections)
             expectation = self.readExpectation(expStatFile)
-            self.assertYamlEqual(expStats, expectation, "exposure level", delta=delta)
+            self.assertYamlEqual(expStats, expectation, "exposure level",
+                                 delta=self.getDelta(expStatFile, delta))
 
         if 'det' in componentMap:
             detStatDataType, detStatFile = componentMap['det']
             detStats = self.getExpectedProduct(detStatDataType, dataId=dataId, collections=collections)
             expectation = self.readExpectation(detStatFile)
-            self.assertYamlEqual(detStats, expectation, "detector level", delta=delta)
+            self.assertYamlEqual(detStats, expectation, "detector level",
+                                 delta=self.getDelta(detStatFile, delta))
 
     def test_biasVerify(self):
         """Run comparison for bias."""
@@ -227,6 +262,19 @@ class VerificationTestCases(lsst.utils.tests.TestCase):
                    "det": ("verifyLinearizerDetStats", "linearizerDet.yaml")}
         self.genericComparison("ci_cpv_linearizer", dataId, mapping, delta=2.0)
 
+    @unittest.skipIf(LEGACY_MODE > 0 or BATCHED_LINEARIZER == 0,
+                     "Skipping batched linearizer verify test; CI_CPP_BATCHED_LINEARIZER is 0.")
+    def test_linearizerBatchedVerify(self):
+        """Run comparison for the batched linearizer solve.
+
+        The batched solve must verify like the per-amplifier solve, so
+        it is compared with the same goldens.
+        """
+        dataId = {"instrument": "LATISS", "detector": 0}
+        mapping = {"run": ("verifyLinearizerStats", "linearizerRun.yaml"),
+                   "det": ("verifyLinearizerDetStats", "linearizerDet.yaml")}
+        self.genericComparison("ci_cpv_linearizerBatched", dataId, mapping, delta=2.0)
+
     @unittest.skipIf(LEGACY_MODE == 0, "Skipping crosstalk verify test.")
     def test_crosstalkVerify(self):
         """Run comparison for crosstalk."""